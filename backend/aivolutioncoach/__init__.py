@@ -1,12 +1,50 @@
 import os
+import threading
 from flask import Flask
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
-# Importa los blueprints
-""" from aivolutioncoach.routes.chat import chat_bp
-from aivolutioncoach.routes.report import report_bp """
-from aivolutioncoach.routes.TTS_STT import speech_bp
+# Importa los blueprints (los clientes de Azure/OpenAI se crean en el primer
+# uso, así que importar las rutas es barato)
+from aivolutioncoach.routes.chat import chat_bp, get_coach
+from aivolutioncoach.routes.report import report_bp
+from aivolutioncoach.routes.TTS_STT import speech_bp, get_speech_service
+from aivolutioncoach.services.admission import AdmissionRejected, admission_rejected, admission_stats
+from aivolutioncoach.services import metrics
+
+def warmup():
+    """
+    Inicializa clientes, índice local, tokenizador y pools de voz, y
+    sintetiza los saludos (TTS_WARM_CACHE), antes de la primera petición.
+    Un fallo (p.ej. falta configuración) solo se registra
+    """
+    from aivolutioncoach.services import coach
+
+    steps = [
+        ("coach", lambda: (coach.warmup(), get_coach())),
+        ("speech", lambda: get_speech_service().start_pools())
+    ]
+    # Frases fijas del frontend ya sintetizadas en la caché de audio
+    if os.getenv('TTS_WARM_CACHE', 'true').lower() == 'true':
+        steps.append(("tts cache", lambda: get_speech_service().warm_cache()))
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            print(f"Warmup '{name}' failed: {str(e)}")
+
+def preload():
+    """
+    Carga el estado de solo lectura antes de crear los workers (ver
+    gunicorn.conf.py). Un fallo solo se registra
+    """
+    from aivolutioncoach.services import coach
+
+    try:
+        coach.preload()
+    except Exception as e:
+        print(f"Preload failed: {str(e)}")
 
 def create_app():
     load_dotenv()  # Carga variables de entorno
@@ -14,11 +52,29 @@ def create_app():
     app = Flask(__name__)
     CORS(app)
 
+    # Número de proxies delante de la app (nginx, balanceador...). Solo con
+    # TRUSTED_PROXIES > 0 se usa X-Forwarded-For como IP del cliente
+    trusted_proxies = int(os.getenv('TRUSTED_PROXIES', '0'))
+    if trusted_proxies > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
+
     # Registrar blueprints
-    """ app.register_blueprint(chat_bp, url_prefix='/api')
-    app.register_blueprint(report_bp, url_prefix='/api') """
+    app.register_blueprint(chat_bp, url_prefix='/api')
+    app.register_blueprint(report_bp, url_prefix='/api')
     app.register_blueprint(speech_bp)
 
+    # Rechazos del control de admisión: 429/503 con Retry-After
+    app.register_error_handler(AdmissionRejected, admission_rejected)
+    app.add_url_rule('/api/admission', 'admission_stats', admission_stats)
+
+    # /metrics (Prometheus) y cabecera Server-Timing; METRICS_ENABLED=false lo desactiva
+    metrics.init_app(app)
+
+    # WARMUP_ON_START=true inicializa todo en segundo plano sin retrasar el
+    # arranque; si no, cada cliente se crea en su primer uso
+    if os.getenv('WARMUP_ON_START', 'false').lower() == 'true':
+        threading.Thread(target=warmup, daemon=True, name='warmup').start()
+
     # Configuraciones adicionales, inicialización de extensiones, DB, etc.
     # ...
     
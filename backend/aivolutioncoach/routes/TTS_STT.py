@@ -1,25 +1,111 @@
-from flask import Blueprint, jsonify, request
-from aivolutioncoach.services.speech_utils import SpeechService
+import json
+import itertools
+import threading
+from flask import Blueprint, Response, jsonify, request
+from aivolutioncoach.services.speech_utils import SpeechService, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT
+from aivolutioncoach.services.admission import AdmissionController, admission_required
 
 speech_bp = Blueprint('speech', __name__)
-speech_service = SpeechService()
+
+# Límite de reconocimientos/síntesis simultáneos (SPEECH_MAX_CONCURRENT, SPEECH_MAX_QUEUE...)
+speech_admission = AdmissionController.from_env("speech", "SPEECH")
+
+# SpeechService se crea en la primera petición (o en el warmup), no al importar
+_speech_service = None
+_speech_service_lock = threading.Lock()
+
+def get_speech_service() -> SpeechService:
+    global _speech_service
+    if _speech_service is None:
+        with _speech_service_lock:
+            if _speech_service is None:
+                _speech_service = SpeechService()
+    return _speech_service
+
+# Tamaño de lectura del audio subido por el cliente
+AUDIO_CHUNK_SIZE = 32 * 1024
+
+def _audio_chunks():
+    """Audio del cliente: fichero 'audio' de un multipart o el cuerpo (chunked o no)"""
+    stream = request.files['audio'].stream if 'audio' in request.files else request.stream
+    return iter(lambda: stream.read(AUDIO_CHUNK_SIZE), b'')
 
 @speech_bp.route('/api/speech-to-text', methods=['POST'])
+@admission_required(speech_admission)
 def speech_to_text():
+    """
+    Transcribe el audio enviado por el cliente (subida chunked o multipart).
+    Query params: format (wav, pcm, ogg, mp3, webm...), sample_rate (para pcm)
+    y stream=1 para recibir las hipótesis parciales como NDJSON según llegan
+    """
     try:
-        command = speech_service.transcribe_command()
-        return jsonify({'success': True, 'command': command})
+        # Sin cuerpo, sin fichero o con un stream vacío no hay nada que transcribir
+        chunks = _audio_chunks()
+        first = next(chunks, b'')
+        if not first:
+            return jsonify({'success': False, 'error': 'No audio provided'}), 400
+
+        events = get_speech_service().transcribe_stream(
+            itertools.chain([first], chunks),
+            audio_format=request.args.get('format', 'wav'),
+            sample_rate=int(request.args.get('sample_rate', 16000))
+        )
+
+        if request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+            return Response(
+                (json.dumps(event) + '\n' for event in events),
+                mimetype='application/x-ndjson',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        for event in events:
+            if event['type'] == 'error':
+                return jsonify({'success': False, 'error': event['error']}), 500
+            if event['type'] == 'done':
+                return jsonify({'success': True, 'command': event['text']})
+        return jsonify({'success': False, 'error': 'Recognition ended without a result'}), 500
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @speech_bp.route('/api/text-to-speech', methods=['POST'])
+@admission_required(speech_admission)
 def text_to_speech():
+    """
+    Devuelve el audio sintetizado en streaming según se genera.
+    JSON: text, y opcionalmente voice y format (mp3, wav, pcm, ogg, webm)
+    """
     try:
         data = request.json
         text = data.get('text', '')
         if not text:
             return jsonify({'success': False, 'error': 'No text provided'}), 400
-        speech_service.speak_output(text)
-        return jsonify({'success': True})
+        voice = data.get('voice')
+        audio_format = data.get('format', DEFAULT_OUTPUT_FORMAT)
+        if audio_format not in OUTPUT_FORMATS:
+            return jsonify({'success': False, 'error': f'Unsupported format: {audio_format}'}), 400
+
+        cached = get_speech_service().is_cached(text, voice, audio_format)
+        chunks = get_speech_service().synthesize_stream(text, voice, audio_format)
+        # El primer chunk se pide antes de responder para poder devolver un
+        # error HTTP si la síntesis falla al arrancar
+        first = next(chunks, b'')
+
+        def generate():
+            yield first
+            yield from chunks
+
+        return Response(
+            generate(),
+            mimetype=OUTPUT_FORMATS[audio_format][1],
+            headers={'X-Cache': 'HIT' if cached else 'MISS', 'Cache-Control': 'no-cache'}
+        )
+    except TimeoutError as e:
+        # Todos los sintetizadores del pool ocupados
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@speech_bp.route('/api/speech-pool', methods=['GET'])
+def speech_pool_stats():
+    """Métricas de los pools de voz: espera al pedir un objeto y tasa de reutilización"""
+    return jsonify({'success': True, 'pools': get_speech_service().pool_stats()})
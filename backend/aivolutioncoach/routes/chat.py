@@ -1,34 +1,145 @@
-from flask import Blueprint, request, jsonify
+import json
+import uuid
+import threading
+from flask import Blueprint, Response, request, jsonify
 from aivolutioncoach.services.coach import AIvolutionCoachChat
+from aivolutioncoach.services.conversation_store import ConversationStore
+from aivolutioncoach.services.admission import AdmissionController, admission_required
 
 chat_bp = Blueprint('chat', __name__)
 
-# Instancia única o compartida de la clase AIvolutionCoachChat
-coach = AIvolutionCoachChat()
+SESSION_HEADER = 'X-Session-ID'
+SESSION_COOKIE = 'session_id'
+
+# Límite de llamadas simultáneas al LLM (CHAT_MAX_CONCURRENT, CHAT_MAX_QUEUE...)
+chat_admission = AdmissionController.from_env("chat", "CHAT")
+
+# Instancia compartida de AIvolutionCoachChat; el histórico vive por sesión en el store.
+# Se crea en la primera petición (o en el warmup), no al importar
+_coach = None
+_coach_lock = threading.Lock()
+
+def get_coach() -> AIvolutionCoachChat:
+    global _coach
+    if _coach is None:
+        with _coach_lock:
+            if _coach is None:
+                _coach = AIvolutionCoachChat(conversation_store=ConversationStore.from_env())
+    return _coach
+
+def get_session_id():
+    """Obtiene el ID de sesión de la cabecera o cookie; genera uno nuevo si no hay"""
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    return session_id or uuid.uuid4().hex
+
+def with_session(response, session_id):
+    """Devuelve el ID de sesión al cliente en cabecera y cookie"""
+    response.headers[SESSION_HEADER] = session_id
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite='Lax')
+    return response
 
 @chat_bp.route('/chat', methods=['POST'])
+@admission_required(chat_admission)
 def chat():
     try:
         data = request.json
         if not data or 'message' not in data:
             return jsonify({"status": "error", "message": "No message provided"}), 400
 
+        session_id = get_session_id()
         user_message = data['message']
-        response = coach.search_and_answer(user_message)
+        usage = {}
+        response = get_coach().search_and_answer(user_message, session_id=session_id, usage=usage)
+
+        return with_session(jsonify({
+            "status": "success",
+            "response": response,
+            "session_id": session_id,
+            "usage": usage,
+            "conversation_history": get_coach().get_history(session_id)
+        }), session_id)
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@chat_bp.route('/chat/async', methods=['POST'])
+@admission_required(chat_admission)
+async def chat_async():
+    """
+    Igual que /chat, pero con el pipeline asíncrono: la búsqueda y el
+    embedding de la consulta van en paralelo. La petición sigue ocupando un
+    hilo del worker (WSGI) mientras espera al loop compartido
+    """
+    try:
+        data = request.json
+        if not data or 'message' not in data:
+            return jsonify({"status": "error", "message": "No message provided"}), 400
+
+        session_id = get_session_id()
+        usage = {}
+        response = await get_coach().asearch_and_answer(data['message'], session_id=session_id, usage=usage)
 
-        return jsonify({
+        return with_session(jsonify({
             "status": "success",
             "response": response,
-            "conversation_history": coach.conversation_history
-        })
+            "session_id": session_id,
+            "usage": usage,
+            "conversation_history": get_coach().get_history(session_id)
+        }), session_id)
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def sse_event(event, data):
+    """Formatea un evento Server-Sent Events con datos JSON"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@chat_bp.route('/chat/stream', methods=['GET', 'POST'])
+@admission_required(chat_admission)
+def chat_stream():
+    """
+    Igual que /chat pero devuelve la respuesta por SSE según se genera:
+    eventos 'token' con cada fragmento, 'done' al terminar o 'error'.
+    Acepta POST con JSON {"message": ...} o GET ?message=... (EventSource)
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        user_message = data.get('message')
+    else:
+        user_message = request.args.get('message')
+    if not user_message:
+        return jsonify({"status": "error", "message": "No message provided"}), 400
+
+    session_id = get_session_id()
+
+    def generate():
+        usage = {}
+        try:
+            for delta in get_coach().stream_search_and_answer(user_message, session_id=session_id, usage=usage):
+                yield sse_event("token", {"content": delta})
+            yield sse_event("done", {"status": "success", "session_id": session_id, "usage": usage})
+        except Exception as e:
+            print(f"Error in chat_stream: {str(e)}")
+            yield sse_event("error", {"status": "error", "message": str(e)})
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return with_session(response, session_id)
+
+@chat_bp.route('/chat/cache', methods=['GET'])
+def cache_stats():
+    """Contadores de la caché semántica de respuestas"""
+    return jsonify({"status": "success", "cache": get_coach().answer_cache.stats()})
+
 @chat_bp.route('/chat/reset', methods=['POST'])
 def reset_chat():
     try:
-        coach.conversation_history = []
-        return jsonify({"status": "success", "message": "Chat history reset successfully"})
+        session_id = get_session_id()
+        get_coach().reset(session_id)
+        return with_session(
+            jsonify({"status": "success", "message": "Chat history reset successfully"}),
+            session_id
+        )
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -1,15 +1,81 @@
+import os
+import hmac
+import threading
 from flask import Blueprint, request, jsonify
+from aivolutioncoach.routes.chat import chat_admission, get_coach, get_session_id
+from aivolutioncoach.services.report_service import ReportService, DONE, FAILED
 
 report_bp = Blueprint('report', __name__)
 
+# ReportService se crea en la primera petición; sus trabajos ceden el paso a /chat
+_report_service = None
+_report_service_lock = threading.Lock()
+
+def get_report_service() -> ReportService:
+    global _report_service
+    if _report_service is None:
+        with _report_service_lock:
+            if _report_service is None:
+                _report_service = ReportService.from_env(
+                    get_coach,
+                    os.path.join(os.path.dirname(__file__), '..', '..', 'reports'),
+                    yield_to=chat_admission
+                )
+    return _report_service
+
 @report_bp.route('/report/generate', methods=['POST'])
 def generate_report():
-    data = request.json
-    # Aquí colocarás la lógica para generar reportes
-    # Ejemplo:
-    # report_data = create_report(data)  # Función hipotética
-    return jsonify({
-        "status": "success",
-        "message": "Report generated successfully",
-        # "report_data": report_data
-    })
\ No newline at end of file
+    """
+    Encola el informe de la sesión del llamante (cabecera/cookie, nunca del
+    cuerpo: así nadie puede pedir el informe de otra sesión) y devuelve 202
+    con el trabajo; su estado se consulta en /report/<job_id> y el informe
+    en /report/<job_id>/result
+    """
+    data = request.get_json(silent=True) or {}
+    session_id = get_session_id()
+    options = {key: data[key] for key in ('max_documents',) if key in data}
+    try:
+        job = get_report_service().submit(session_id, options)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    response = jsonify({"status": "success", "job": job.to_dict()})
+    response.status_code = 200 if job.status == DONE else 202
+    response.headers['Location'] = f"{request.script_root}/api/report/{job.id}"
+    return response
+
+@report_bp.route('/report/<job_id>', methods=['GET'])
+def report_status(job_id):
+    """Estado y progreso (0-1) de un informe de la sesión del llamante"""
+    job = get_report_service().status(job_id, get_session_id())
+    if job is None:
+        return jsonify({"status": "error", "message": "Report not found"}), 404
+    return jsonify({"status": "success", "job": job})
+
+@report_bp.route('/report/<job_id>/result', methods=['GET'])
+def report_result(job_id):
+    """
+    El informe generado (solo para la sesión del llamante); 409 mientras el
+    trabajo no ha terminado
+    """
+    session_id = get_session_id()
+    job = get_report_service().status(job_id, session_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Report not found"}), 404
+    if job['status'] == FAILED:
+        return jsonify({"status": "error", "message": job['error'], "job": job}), 500
+    result = get_report_service().result(job_id, session_id) if job['status'] == DONE else None
+    if result is None:
+        return jsonify({"status": "error", "message": "Report not ready", "job": job}), 409
+    return jsonify({"status": "success", "job": job, "report": result})
+
+@report_bp.route('/report/stats', methods=['GET'])
+def report_stats():
+    """
+    Trabajos de informe por estado. Solo con REPORT_STATS_TOKEN configurado
+    y enviado como 'Authorization: Bearer <token>'; si no, 404
+    """
+    token = os.getenv('REPORT_STATS_TOKEN', '')
+    supplied = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(supplied, f"Bearer {token}"):
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    return jsonify({"status": "success", "reports": get_report_service().stats()})
@@ -0,0 +1,244 @@
+import os
+import math
+import time
+import inspect
+import threading
+from collections import OrderedDict, deque
+from functools import wraps
+from typing import Callable, Deque, Dict, Optional
+from flask import jsonify, make_response, request
+
+# Controladores creados, por nombre (para exponer sus contadores)
+CONTROLLERS: Dict[str, "AdmissionController"] = {}
+
+
+class AdmissionRejected(Exception):
+    """
+    Petición rechazada sin llegar a llamar al servicio: 503 si estamos
+    saturados, 429 si el cliente supera su cuota. retry_after en segundos
+    """
+
+    def __init__(self, status: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("client", "event", "granted")
+
+    def __init__(self, client: str):
+        self.client = client
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Control de admisión delante de las llamadas lentas (LLM, voz).
+
+    - Como mucho max_concurrent llamadas a la vez.
+    - Las que no caben esperan en una cola de max_queue huecos, hasta
+      queue_timeout segundos; si la cola está llena o vence el plazo se
+      rechazan al momento (503 con Retry-After) en vez de acumular hilos.
+    - Los huecos libres se reparten por turnos entre clientes, y con
+      max_per_client > 0 un cliente no puede tener más peticiones (en curso
+      más en cola) que ese límite (429).
+    """
+
+    def __init__(self, name: str, max_concurrent: int = 8, max_queue: int = 32,
+                 queue_timeout: float = 10.0, max_per_client: int = 0):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._waiting: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._per_client: Dict[str, int] = {}
+        # Métricas
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rejected_client_limit = 0
+        self.max_queue_depth = 0
+        self._service_time = 1.0
+        CONTROLLERS[name] = self
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str) -> "AdmissionController":
+        """
+        Lee <PREFIX>_MAX_CONCURRENT, <PREFIX>_MAX_QUEUE,
+        <PREFIX>_QUEUE_TIMEOUT_SECONDS y <PREFIX>_MAX_PER_CLIENT
+        """
+        return cls(
+            name,
+            max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENT", "8")),
+            max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", "10")),
+            max_per_client=int(os.getenv(f"{prefix}_MAX_PER_CLIENT", "0"))
+        )
+
+    def _retry_after(self) -> int:
+        # Estimación: tiempo para vaciar la cola con la concurrencia actual
+        waves = (self._queued + 1) / self.max_concurrent
+        return max(1, math.ceil(waves * self._service_time))
+
+    def acquire(self, client: str = "") -> Callable[[], None]:
+        """
+        Espera un hueco y devuelve la función que lo libera (llamarla una
+        sola vez). Lanza AdmissionRejected si no se puede admitir
+        """
+        with self._lock:
+            if self.max_per_client > 0 and self._per_client.get(client, 0) >= self.max_per_client:
+                self.rejected_client_limit += 1
+                raise AdmissionRejected(429, f"Too many concurrent requests for this client ({self.name})",
+                                        self._retry_after())
+            if self._active < self.max_concurrent and not self._queued:
+                self._grant(client)
+                return self._releaser(client)
+            if self._queued >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected(503, f"Server busy, {self.name} queue is full", self._retry_after())
+
+            waiter = _Waiter(client)
+            self._waiting.setdefault(client, deque()).append(waiter)
+            self._queued += 1
+            self._per_client[client] = self._per_client.get(client, 0) + 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queued)
+
+        if not waiter.event.wait(self.queue_timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._waiting[client].remove(waiter)
+                    if not self._waiting[client]:
+                        del self._waiting[client]
+                    self._queued -= 1
+                    self._drop_client(client)
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected(503, f"Server busy, timed out waiting for {self.name}",
+                                            self._retry_after())
+        return self._releaser(client)
+
+    def _grant(self, client: str) -> None:
+        self._active += 1
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self.admitted += 1
+
+    def _drop_client(self, client: str) -> None:
+        remaining = self._per_client.get(client, 0) - 1
+        if remaining > 0:
+            self._per_client[client] = remaining
+        else:
+            self._per_client.pop(client, None)
+
+    def _releaser(self, client: str) -> Callable[[], None]:
+        started = time.monotonic()
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            with self._lock:
+                # Media móvil del tiempo de servicio, para el Retry-After
+                self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - started)
+                self._active -= 1
+                self._drop_client(client)
+                if self._waiting:
+                    # Turno rotatorio: el primer cliente de la cola y se pasa al final
+                    next_client, waiters = next(iter(self._waiting.items()))
+                    waiter = waiters.popleft()
+                    if waiters:
+                        self._waiting.move_to_end(next_client)
+                    else:
+                        del self._waiting[next_client]
+                    self._queued -= 1
+                    self._active += 1
+                    self.admitted += 1
+                    waiter.granted = True
+                    waiter.event.set()
+
+        return release
+
+    def busy(self) -> bool:
+        """True si no queda ningún hueco libre o hay peticiones esperando"""
+        with self._lock:
+            return self._queued > 0 or self._active >= self.max_concurrent
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": self._queued,
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "rejected_client_limit": self.rejected_client_limit,
+                "avg_service_seconds": self._service_time
+            }
+
+
+def client_key() -> str:
+    """
+    Identificador del cliente para el reparto justo: su IP de origen. Solo
+    sale de X-Forwarded-For si la app está detrás de proxies de confianza
+    (TRUSTED_PROXIES, ver create_app); si no, el cliente podría falsearla
+    """
+    return request.remote_addr or ""
+
+
+def admission_required(controller: AdmissionController):
+    """
+    Decorador de vistas Flask: ocupa un hueco del controlador mientras dura
+    la respuesta, incluidas las respuestas en streaming (el hueco se libera
+    al cerrarse la respuesta)
+    """
+    def decorator(view):
+        def admitted(rv, release):
+            response = make_response(rv)
+            response.call_on_close(release)
+            return response
+
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                release = controller.acquire(client_key())
+                try:
+                    rv = await view(*args, **kwargs)
+                except BaseException:
+                    release()
+                    raise
+                return admitted(rv, release)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            release = controller.acquire(client_key())
+            try:
+                rv = view(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            return admitted(rv, release)
+        return wrapper
+    return decorator
+
+
+def admission_rejected(error: AdmissionRejected):
+    """Manejador de errores de Flask para AdmissionRejected"""
+    response = jsonify({"status": "error", "message": error.message})
+    response.status_code = error.status
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def admission_stats():
+    """Profundidad de cola y contadores de rechazos de cada controlador"""
+    return jsonify({"status": "success", "admission": {name: c.stats() for name, c in CONTROLLERS.items()}})
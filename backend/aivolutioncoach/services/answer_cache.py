@@ -0,0 +1,207 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+import numpy as np
+from aivolutioncoach.services.vector_index import read_index_version
+from aivolutioncoach.services.shared_cache import SharedDb, shared_db_path
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        index_version TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        answer TEXT NOT NULL,
+        created REAL NOT NULL
+    );
+"""
+
+
+class _Entry:
+    __slots__ = ("embedding", "answer", "created")
+
+    def __init__(self, embedding: np.ndarray, answer: str, created: Optional[float] = None):
+        self.embedding = embedding
+        self.answer = answer
+        self.created = time.monotonic() if created is None else created
+
+
+class SemanticAnswerCache:
+    """
+    Caché de respuestas indexada por el embedding de la consulta.
+
+    Una consulta reutiliza una respuesta previa si la similitud del coseno
+    con la consulta cacheada es >= threshold. Tamaño acotado (LRU) con TTL,
+    y se vacía sola cuando DocumentProcessor reconstruye el índice (cambia
+    la versión guardada en index_folder).
+
+    Con db_path las respuestas se guardan en SQLite (WAL) y cada worker
+    incorpora en cada consulta las que han añadido los demás, así que una
+    respuesta generada en un worker sirve en todos.
+    """
+
+    VERSION_CHECK_INTERVAL = 1.0
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256,
+                 ttl_seconds: float = 3600, index_folder: Optional[str] = None,
+                 db_path: Optional[str] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_folder = index_folder
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+        self._index_version = read_index_version(index_folder) if index_folder else None
+        self._last_version_check = time.monotonic()
+        self._db = SharedDb(db_path, _SCHEMA) if db_path else None
+        self._last_row = 0
+
+    @classmethod
+    def from_env(cls, index_folder: Optional[str] = None) -> "SemanticAnswerCache":
+        """
+        Crea la caché con la configuración de las variables de entorno
+        (ANSWER_CACHE_MAX_ENTRIES=0 la desactiva; ANSWER_CACHE_DB_PATH o
+        SHARED_CACHE_DIR la comparten entre procesos)
+        """
+        return cls(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+            index_folder=index_folder,
+            db_path=shared_db_path("ANSWER_CACHE_DB_PATH", "answers.db")
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, query_embedding: Sequence[float]) -> Optional[str]:
+        """
+        Devuelve la respuesta cacheada más similar, o None si no hay ninguna
+        por encima del umbral
+        """
+        if not self.enabled:
+            return None
+        query = self._normalize(query_embedding)
+        with self._lock:
+            now = time.monotonic()
+            self._check_index_version(now)
+            if self._db:
+                self._sync()
+            self._evict_expired(now)
+
+            if self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[k].embedding for k in self._keys])
+                scores = self._matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = self._keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key].answer
+
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding: Sequence[float], answer: str) -> None:
+        """
+        Guarda una respuesta para la consulta
+        """
+        if not self.enabled or not answer:
+            return
+        entry = _Entry(self._normalize(query_embedding), answer)
+        with self._lock:
+            if self._db:
+                self._store_db(entry)
+                return
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict_expired(self, now: float) -> None:
+        # Las entradas se insertan en orden de creación; move_to_end solo
+        # reordena por uso, así que se recorre todo (la caché es pequeña)
+        expired = [k for k, e in self._entries.items() if now - e.created >= self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _check_index_version(self, now: float) -> None:
+        if not self.index_folder or now - self._last_version_check < self.VERSION_CHECK_INTERVAL:
+            return
+        self._last_version_check = now
+        version = read_index_version(self.index_folder)
+        if version != self._index_version:
+            print("Document index rebuilt, clearing answer cache")
+            self._index_version = version
+            self._entries.clear()
+            self._matrix = None
+            if self._db:
+                with self._db.lock:
+                    db = self._db.connection()
+                    db.execute("DELETE FROM answers WHERE index_version != ?", (version or "",))
+                    db.commit()
+
+    # Almacén compartido (SQLite)
+
+    def _store_db(self, entry: _Entry) -> None:
+        now = time.time()
+        with self._db.lock:
+            db = self._db.connection()
+            cursor = db.execute(
+                "INSERT INTO answers (index_version, embedding, answer, created) VALUES (?, ?, ?, ?)",
+                (self._index_version or "", entry.embedding.astype(np.float32).tobytes(), entry.answer, now)
+            )
+            # Acotada entre todos los workers: se borran las más antiguas
+            db.execute("DELETE FROM answers WHERE id <= ? OR created < ?",
+                       (cursor.lastrowid - self.max_entries, now - self.ttl_seconds))
+            db.commit()
+        self._sync()
+
+    def _sync(self) -> None:
+        """
+        Incorpora las respuestas añadidas (por cualquier proceso) desde la
+        última sincronización
+        """
+        with self._db.lock:
+            rows = self._db.connection().execute(
+                "SELECT id, index_version, embedding, answer, created FROM answers WHERE id > ? ORDER BY id",
+                (self._last_row,)
+            ).fetchall()
+        if not rows:
+            return
+        offset = time.monotonic() - time.time()
+        for row_id, index_version, embedding, answer, created in rows:
+            if index_version == (self._index_version or ""):
+                self._entries[row_id] = _Entry(np.frombuffer(embedding, dtype=np.float32), answer, created + offset)
+        self._last_row = rows[-1][0]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import contextvars
+from typing import Awaitable, TypeVar
+
+T = TypeVar("T")
+
+# Event loop compartido por el proceso, en un hilo propio. Los clientes
+# asíncronos (AsyncAzureOpenAI, SearchClient aio) quedan ligados al loop en el
+# que hacen su primera petición; Flask crea un loop nuevo por cada vista
+# async, así que todas las llamadas se ejecutan aquí para reutilizar las
+# conexiones. Cada vista async sigue ocupando su hilo del worker mientras espera
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True, name="async-loop").start()
+                _loop = loop
+    return _loop
+
+
+async def run_on_loop(coro: Awaitable[T]) -> T:
+    """
+    Ejecuta una corrutina en el loop compartido y espera su resultado desde
+    cualquier otro loop (p.ej. el de una vista async de Flask)
+    """
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_in_context(coro), loop))
+
+
+def _in_context(coro: Awaitable[T]) -> Awaitable[T]:
+    """
+    Propaga las variables de contexto de quien llama (p.ej. los tiempos por
+    etapa de la petición) a la tarea que se crea en el loop compartido
+    """
+    context = contextvars.copy_context()
+
+    async def run():
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+
+    return run()
+
@@ -0,0 +1,97 @@
+import os
+import hashlib
+import tempfile
+import threading
+from typing import Iterator, Optional
+
+
+class DiskAudioCache:
+    """
+    Caché LRU en disco de audio sintetizado, acotada en bytes.
+
+    Cada clip se guarda en un fichero cuyo nombre es el hash de
+    (texto, voz, formato); el mtime marca el último uso y al superar
+    max_bytes se borran los menos usados.
+    """
+
+    def __init__(self, folder: str, max_bytes: int = 256 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(folder) if entry.name.endswith(".audio"))
+
+    @classmethod
+    def from_env(cls, default_folder: str) -> "DiskAudioCache":
+        return cls(
+            folder=os.getenv("TTS_CACHE_DIR", default_folder),
+            max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+        )
+
+    @staticmethod
+    def key(text: str, voice: str, audio_format: str) -> str:
+        return hashlib.sha256(f"{voice}\0{audio_format}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.audio")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Ruta del clip cacheado (marcándolo como usado), o None
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return path
+        except OSError:
+            return None
+
+    def read(self, path: str, chunk_size: int = 32 * 1024) -> Iterator[bytes]:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+    def write_through(self, key: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        Devuelve los chunks tal cual mientras los guarda; el clip solo entra
+        en la caché si el stream se completa
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        completed = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                self._commit(key, tmp_path)
+            else:
+                os.remove(tmp_path)
+
+    def _commit(self, key: str, tmp_path: str) -> None:
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            path = self._path(key)
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            (entry for entry in os.scandir(self.folder) if entry.name.endswith(".audio")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except OSError:
+                pass
@@ -0,0 +1,223 @@
+import os
+import re
+import json
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from aivolutioncoach.services.vector_index import current_generation, new_generation
+
+# Subcarpeta del índice vectorial donde se guarda el índice léxico
+LEXICAL_INDEX_FOLDER = "bm25"
+TERMS_FILE = "terms.json"
+OFFSETS_FILE = "offsets.npy"
+POSTINGS_FILE = "postings.npy"
+FREQUENCIES_FILE = "frequencies.npy"
+LENGTHS_FILE = "lengths.npy"
+RECORDS_FILE = "records.json"
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you
+your yours yourself yourselves also may might must shall us
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Términos de un texto: palabras en minúsculas, sin stop words ni
+    tokens de un solo carácter
+    """
+    return [
+        token for token in _TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+class BM25Index:
+    """
+    Índice invertido con ranking BM25 sobre las páginas del corpus extraído.
+
+    Las listas de postings de todos los términos van concatenadas en dos
+    arrays (documento y frecuencia); offsets[t]:offsets[t + 1] delimita las
+    del término t. Guardado en .npy, se carga con mmap sin copiar nada.
+    """
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, postings: np.ndarray,
+                 frequencies: np.ndarray, lengths: np.ndarray, records: List[dict],
+                 k1: float = 1.2, b: float = 0.75):
+        if len(lengths) != len(records):
+            raise ValueError(f"Lengths ({len(lengths)}) and records ({len(records)}) differ in length")
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.records = records
+        self.k1 = k1
+        self.b = b
+        self._term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        # Parte del denominador de BM25 que solo depende del documento
+        average_length = float(lengths.mean()) if len(lengths) else 0.0
+        self._length_norm = (
+            k1 * (1 - b + b * lengths / average_length) if average_length else np.full(len(lengths), k1)
+        ).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict]) -> "BM25Index":
+        """
+        Construye el índice a partir de los documentos de
+        DocumentProcessor.extracted_documents
+        """
+        builder = BM25IndexBuilder()
+        for doc in documents:
+            builder.add(doc)
+        return builder.build()
+
+    def save(self, folder: str) -> None:
+        """
+        Guarda los arrays (.npy), el vocabulario y los metadatos (.json)
+        como una generación nueva de la carpeta
+        """
+        files = (OFFSETS_FILE, POSTINGS_FILE, FREQUENCIES_FILE, LENGTHS_FILE, TERMS_FILE, RECORDS_FILE)
+        with new_generation(folder, legacy_files=files) as generation:
+            np.save(os.path.join(generation, OFFSETS_FILE), self.offsets)
+            np.save(os.path.join(generation, POSTINGS_FILE), self.postings)
+            np.save(os.path.join(generation, FREQUENCIES_FILE), self.frequencies)
+            np.save(os.path.join(generation, LENGTHS_FILE), self.lengths)
+            with open(os.path.join(generation, TERMS_FILE), "w") as f:
+                json.dump(self.terms, f)
+            with open(os.path.join(generation, RECORDS_FILE), "w") as f:
+                json.dump(self.records, f)
+
+    @classmethod
+    def load(cls, folder: str, mmap: bool = True) -> "BM25Index":
+        """
+        Carga un índice guardado; con mmap=True los postings se mapean desde
+        disco en lugar de copiarse en memoria
+        """
+        folder = current_generation(folder)
+        mmap_mode = "r" if mmap else None
+        arrays = [
+            np.load(os.path.join(folder, name), mmap_mode=mmap_mode)
+            for name in (OFFSETS_FILE, POSTINGS_FILE, FREQUENCIES_FILE, LENGTHS_FILE)
+        ]
+        with open(os.path.join(folder, TERMS_FILE)) as f:
+            terms = json.load(f)
+        with open(os.path.join(folder, RECORDS_FILE)) as f:
+            records = json.load(f)
+        return cls(terms, *arrays, records)
+
+    def _idf(self, document_frequency: int) -> float:
+        # Variante de Lucene: siempre positiva, incluso para términos muy comunes
+        total = len(self.records)
+        return float(np.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5)))
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score BM25 de la consulta contra cada registro (0 si no comparte términos)
+        """
+        scores = np.zeros(len(self.records), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            rows = self.postings[start:end]
+            frequencies = self.frequencies[start:end].astype(np.float32)
+            # Cada documento aparece una sola vez por término: el += indexado es seguro
+            scores[rows] += self._idf(end - start) * frequencies * (self.k1 + 1) / (
+                frequencies + self._length_norm[rows]
+            )
+        return scores
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+        """
+        Los top_k registros con mayor score BM25 (solo los que comparten
+        algún término con la consulta), de mayor a menor
+        """
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+        best = candidates[np.argsort(-scores[candidates])]
+        return [{**self.records[row], 'score': float(scores[row])} for row in best]
+
+
+class BM25IndexBuilder:
+    """
+    Construye un BM25Index documento a documento: de cada uno solo se
+    guardan sus metadatos y sus postings, en arrays planos (término,
+    documento, frecuencia) que se ordenan por término al final
+    """
+
+    def __init__(self):
+        self.records: List[dict] = []
+        self._lengths = array("i")
+        # Id de cada término por orden de aparición
+        self._term_ids: Dict[str, int] = {}
+        self._terms = array("i")
+        self._rows = array("i")
+        self._counts = array("i")
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, doc: dict) -> None:
+        tokens = tokenize(doc.get('page_text') or '')
+        if not tokens:
+            return
+        row = len(self.records)
+        self.records.append({
+            'document_id': doc['document_id'],
+            'document_name': doc['document_name'],
+            'page_number': doc['page_number'],
+            'page_text': doc['page_text'],
+            'citations': doc.get('citations', [])
+        })
+        self._lengths.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            self._terms.append(self._term_ids.setdefault(term, len(self._term_ids)))
+            self._rows.append(row)
+            self._counts.append(count)
+
+    def build(self) -> BM25Index:
+        if not self.records:
+            raise ValueError("No documents with text to index")
+        terms = sorted(self._term_ids)
+        # Id de aparición -> posición en el vocabulario ordenado
+        positions = np.empty(len(terms), dtype=np.int64)
+        positions[[self._term_ids[term] for term in terms]] = np.arange(len(terms))
+        term_of = positions[np.frombuffer(self._terms, dtype=np.intc)]
+        # Estable: dentro de cada término los documentos quedan en orden
+        order = np.argsort(term_of, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_of, minlength=len(terms)))
+        doc_rows = np.frombuffer(self._rows, dtype=np.intc)[order].astype(np.int32)
+        frequencies = np.minimum(
+            np.frombuffer(self._counts, dtype=np.intc)[order], np.iinfo(np.uint16).max
+        ).astype(np.uint16)
+        lengths = np.frombuffer(self._lengths, dtype=np.intc).astype(np.int32)
+        return BM25Index(terms, offsets, doc_rows, frequencies, lengths, self.records)
+
+
+def load_bm25_index(folder: str, mmap: bool = True) -> Optional[BM25Index]:
+    """
+    Carga el índice si existe; devuelve None si aún no se ha construido
+    """
+    if not os.path.exists(os.path.join(current_generation(folder), OFFSETS_FILE)):
+        return None
+    try:
+        return BM25Index.load(folder, mmap=mmap)
+    except Exception as e:
+        print(f"Error loading BM25 index from {folder}: {str(e)}")
+        return None
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Dict, Iterable, Iterator
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+
+# Códigos por documento que merece la pena reintentar
+# (409/422: conflicto de versión, 429/503: throttling, 500/502/504: transitorios)
+RETRYABLE_STATUS = {409, 422, 429, 500, 502, 503, 504}
+
+
+class BulkUploader:
+    """
+    Subida masiva al índice de búsqueda.
+
+    Divide los documentos en lotes acotados por número y por tamaño (el
+    servicio admite como máximo 1000 documentos y 16 MB por petición),
+    envía los lotes en paralelo, revisa el estado de cada documento y
+    reintenta solo las claves fallidas, con backoff exponencial.
+    """
+
+    def __init__(self, search_client, key_field: str = "document_id", max_batch_docs: int = 1000,
+                 max_batch_bytes: int = 8 * 1024 * 1024, max_workers: int = 4,
+                 max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.search_client = search_client
+        self.key_field = key_field
+        self.max_batch_docs = max_batch_docs
+        self.max_batch_bytes = max_batch_bytes
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls, search_client, key_field: str = "document_id") -> "BulkUploader":
+        """
+        Crea el uploader con los límites de las variables de entorno
+        """
+        return cls(
+            search_client,
+            key_field=key_field,
+            max_batch_docs=int(os.getenv("UPLOAD_BATCH_SIZE", "1000")),
+            max_batch_bytes=int(os.getenv("UPLOAD_BATCH_MAX_BYTES", str(8 * 1024 * 1024))),
+            max_workers=int(os.getenv("UPLOAD_MAX_WORKERS", "4")),
+            max_retries=int(os.getenv("UPLOAD_MAX_RETRIES", "3"))
+        )
+
+    def batches(self, documents: Iterable[dict]) -> Iterator[List[dict]]:
+        """
+        Agrupa los documentos en lotes que respetan ambos límites
+        """
+        batch = []
+        batch_bytes = 0
+        for document in documents:
+            size = len(json.dumps(document, ensure_ascii=False).encode("utf-8"))
+            if batch and (len(batch) >= self.max_batch_docs or batch_bytes + size > self.max_batch_bytes):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(document)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    def upload(self, documents: Iterable[dict], action: str = "upload") -> Dict:
+        """
+        Ejecuta la acción (upload, merge_or_upload o delete) sobre todos los
+        documentos. Devuelve las claves correctas, las fallidas y el ritmo.
+
+        documents puede ser un generador: cada lote se envía en cuanto se
+        completa, con como mucho max_workers + 1 lotes en vuelo, así que la
+        subida empieza mientras se siguen produciendo documentos
+        """
+        started = time.perf_counter()
+        report = {"succeeded": [], "failed": {}, "batches": 0}
+        total = 0
+
+        def collect(futures):
+            for future in futures:
+                succeeded, failed = future.result()
+                report["succeeded"].extend(succeeded)
+                report["failed"].update(failed)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix="upload") as executor:
+            in_flight = set()
+            for batch in self.batches(documents):
+                if len(in_flight) > self.max_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(executor.submit(self._send_with_retry, batch, action))
+                report["batches"] += 1
+                total += len(batch)
+            collect(wait(in_flight).done)
+
+        elapsed = time.perf_counter() - started
+        report["seconds"] = elapsed
+        report["docs_per_sec"] = len(report["succeeded"]) / elapsed if elapsed > 0 else 0.0
+        print(f"{action}: {len(report['succeeded'])}/{total} documents in "
+              f"{report['batches']} batch(es), {elapsed:.1f}s ({report['docs_per_sec']:.1f} docs/sec)")
+        if report["failed"]:
+            print(f"{action}: {len(report['failed'])} documents failed: {report['failed']}")
+        return report
+
+    def _send(self, batch: List[dict], action: str):
+        if action == "merge_or_upload":
+            return self.search_client.merge_or_upload_documents(batch)
+        if action == "delete":
+            return self.search_client.delete_documents(batch)
+        return self.search_client.upload_documents(batch)
+
+    def _send_with_retry(self, batch: List[dict], action: str):
+        """
+        Envía un lote y reintenta solo los documentos fallidos reintentables
+        """
+        succeeded = []
+        failed = {}
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            by_key = {document[self.key_field]: document for document in pending}
+            retry = []
+            try:
+                results = self._send(pending, action)
+            except (HttpResponseError, ServiceRequestError) as e:
+                status = getattr(e, "status_code", None)
+                if status is not None and status not in RETRYABLE_STATUS:
+                    failed.update({key: f"{status}: {str(e)}" for key in by_key})
+                    return succeeded, failed
+                retry = pending
+                error = str(e)
+            else:
+                for result in results:
+                    if result.succeeded:
+                        succeeded.append(result.key)
+                    elif result.status_code in RETRYABLE_STATUS:
+                        retry.append(by_key[result.key])
+                    else:
+                        failed[result.key] = f"{result.status_code}: {result.error_message}"
+                error = "retryable status"
+
+            if not retry:
+                return succeeded, failed
+            if attempt == self.max_retries:
+                failed.update({document[self.key_field]: error for document in retry})
+                return succeeded, failed
+
+            delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            print(f"Retrying {len(retry)} documents in {delay:.1f}s ({error})")
+            time.sleep(delay)
+            pending = retry
+        return succeeded, failed
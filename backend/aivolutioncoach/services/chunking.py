@@ -0,0 +1,112 @@
+import os
+import re
+from typing import List, Optional, Sequence
+from aivolutioncoach.services.prompt_builder import count_tokens
+
+# Páginas que no aportan contenido (portadas, créditos): se descartan enteras
+BOILERPLATE_PAGE_PATTERNS = [
+    r"development of this training was funded by",
+    r"^\W*table of contents\b",
+    r"^\W*(this page (is )?)?intentionally left blank\W*$"
+]
+
+# Frases repetidas en todas las páginas (marcas de agua, pies): se eliminan del texto
+BOILERPLATE_PHRASES = [
+    r"(GO\s+)?WISE\s+WASHINGTON\s+INITIATIVE\s+for\s+SUPPORTED\s+EMPLOYMENT",
+    r"all rights reserved\.?"
+]
+
+
+class PageChunker:
+    """
+    Divide las páginas extraídas en fragmentos de como mucho chunk_tokens
+    tokens (cortando entre palabras) que se solapan overlap_tokens, para
+    indexar y recuperar fragmentos en vez de páginas enteras.
+
+    Cada fragmento conserva su número de página para las citas. Se quitan
+    las frases repetidas y se descartan las páginas de relleno y las que
+    quedan con menos de min_tokens tokens; un resto final más corto que
+    min_tokens se une al fragmento anterior de la misma página.
+    """
+
+    def __init__(self, chunk_tokens: int = 200, overlap_tokens: int = 40, min_tokens: int = 25,
+                 page_patterns: Sequence[str] = BOILERPLATE_PAGE_PATTERNS,
+                 phrases: Sequence[str] = BOILERPLATE_PHRASES):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, chunk_tokens // 2))
+        self.min_tokens = min_tokens
+        self._page_patterns = [re.compile(pattern, re.I) for pattern in page_patterns]
+        self._phrases = [re.compile(phrase, re.I) for phrase in phrases]
+
+    @classmethod
+    def from_env(cls) -> "PageChunker":
+        """
+        CHUNK_TOKENS (0 = indexar páginas enteras), CHUNK_OVERLAP_TOKENS y
+        CHUNK_MIN_TOKENS
+        """
+        return cls(
+            chunk_tokens=int(os.getenv("CHUNK_TOKENS", "200")),
+            overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "40")),
+            min_tokens=int(os.getenv("CHUNK_MIN_TOKENS", "25"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.chunk_tokens > 0
+
+    def clean(self, text: str) -> Optional[str]:
+        """
+        Texto de la página sin frases repetidas, o None si es de relleno
+        """
+        if any(pattern.search(text) for pattern in self._page_patterns):
+            return None
+        for phrase in self._phrases:
+            text = phrase.sub(" ", text)
+        return " ".join(text.split())
+
+    def _spans(self, counts: List[int]) -> List[List[int]]:
+        """
+        Ventanas [inicio, fin) sobre las palabras según su número de tokens
+        """
+        spans = []
+        start = 0
+        while start < len(counts):
+            end = start
+            total = 0
+            while end < len(counts) and (total + counts[end] <= self.chunk_tokens or end == start):
+                total += counts[end]
+                end += 1
+            spans.append([start, end, total])
+            if end >= len(counts):
+                break
+            # La siguiente ventana repite las últimas palabras (hasta overlap_tokens)
+            back = end
+            overlap = 0
+            while back > start + 1 and overlap + counts[back - 1] <= self.overlap_tokens:
+                back -= 1
+                overlap += counts[back]
+            start = back
+        if len(spans) > 1 and spans[-1][2] < self.min_tokens:
+            spans[-2][1] = spans.pop()[1]
+        return spans
+
+    def chunk_text(self, text: str) -> List[str]:
+        words = text.split()
+        # Tokens de cada palabra con su espacio: la suma es una cota superior
+        counts = [count_tokens(" " + word) for word in words]
+        return [" ".join(words[start:end]) for start, end, _ in self._spans(counts)]
+
+    def chunk_pages(self, pages: List[dict]) -> List[dict]:
+        """
+        Fragmentos de las páginas de un documento extraído
+        ({'page_number', 'page_content'}): lista de
+        {'page_number', 'chunk_index', 'text'}
+        """
+        chunks = []
+        for page in pages:
+            text = self.clean(page.get('page_content') or '')
+            if not text or count_tokens(text) < self.min_tokens:
+                continue
+            for index, chunk in enumerate(self.chunk_text(text)):
+                chunks.append({'page_number': page['page_number'], 'chunk_index': index, 'text': chunk})
+        return chunks
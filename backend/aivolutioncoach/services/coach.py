@@ -1,29 +1,17 @@
 import os
-import json
-import requests
-import sys
-import re
-import pandas as pd
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.indexes import SearchIndexClient 
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes.models import (
-    SearchIndex,
-    SearchField,
-    SearchFieldDataType,
-    SimpleField,
-    SearchableField,
-    SemanticConfiguration,
-    PrioritizedFields,
-    SemanticField,
-    SemanticSettings
-)
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from typing import List
-import openai
+import time
+import asyncio
+import threading
+from typing import List, Iterator
 import numpy as np
 from dotenv import load_dotenv, find_dotenv
+from aivolutioncoach.services.vector_index import VectorIndex, load_vector_index
+from aivolutioncoach.services.bm25_index import LEXICAL_INDEX_FOLDER, load_bm25_index
+from aivolutioncoach.services.conversation_store import ConversationStore
+from aivolutioncoach.services.prompt_builder import PromptBuilder, PromptBuild, count_tokens
+from aivolutioncoach.services.answer_cache import SemanticAnswerCache
+from aivolutioncoach.services.async_loop import run_on_loop
+from aivolutioncoach.services.metrics import stage, record, observe_tokens
 
 # Cargar variables de entorno
 load_dotenv(find_dotenv())
@@ -34,36 +22,233 @@ RESOURCE_ENDPOINT = os.getenv("OPENAI_API_BASE", "").strip()
 chat_model = os.getenv("CHAT_MODEL_NAME")
 EMBEDDING_NAME = os.getenv("EMBEDDING_MODEL_NAME", "").strip()
 
-# Validaciones
-assert API_KEY, "ERROR: Azure OpenAI Key is missing"
-assert RESOURCE_ENDPOINT, "ERROR: Azure OpenAI Endpoint is missing"
-assert chat_model, "ERROR: CHAT_MODEL_NAME is missing in .env file"
-assert EMBEDDING_NAME, "ERROR: Embedding Model Name is missing"
-
 # Configuración de Azure Cognitive Search
 service_endpoint = os.getenv("AZURE_COGNITIVE_SEARCH_ENDPOINT")   
 key = os.getenv("AZURE_COGNITIVE_SEARCH_KEY")
 index_name = os.getenv("AZURE_COGNITIVE_SEARCH_DOC_INDEX_NAME")
 
-# Inicializar clientes
-try:
-    # Cliente de Azure OpenAI
-    client = openai.AzureOpenAI(
-        api_key=API_KEY,
-        api_version=os.getenv("OPENAI_API_VERSION"),
-        azure_endpoint=RESOURCE_ENDPOINT
-    )
-    
-    # Cliente de Azure Cognitive Search
-    credential = AzureKeyCredential(key)
-    search_client = SearchClient(
-        endpoint=service_endpoint, 
-        index_name=index_name, 
-        credential=credential
-    )
-except Exception as e:
-    print(f"Error al inicializar clientes: {str(e)}")
-    exit(1)
+# Caché semántica de respuestas: por defecto solo para consultas sin histórico
+ANSWER_CACHE_IGNORE_HISTORY = os.getenv("ANSWER_CACHE_IGNORE_HISTORY", "false").lower() == "true"
+
+# Índice vectorial local (construido por DocumentProcessor.build_vector_index)
+# SEARCH_MODE: "remote" (solo Azure), "local" (solo índice local) o
+# "hybrid" (candidatos de Azure reordenados con la matriz local)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid").strip().lower()
+VECTOR_INDEX_PATH = os.getenv(
+    "VECTOR_INDEX_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "vector-index")
+)
+
+# Índice léxico local (BM25), construido junto al vectorial.
+# SEARCH_CANDIDATES: "remote" (candidatos de Azure), "bm25" (solo el índice
+# local, sin llamada de red) o "both" (la unión de ambos). Con "remote", si
+# Azure falla (p.ej. throttling) se usan los candidatos locales
+SEARCH_CANDIDATES = os.getenv("SEARCH_CANDIDATES", "remote").strip().lower()
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(VECTOR_INDEX_PATH, LEXICAL_INDEX_FOLDER))
+SEARCH_CANDIDATES_TOP = 10
+
+# Tiempo máximo por llamada a cada servicio, en segundos
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "10"))
+
+# Clientes: se crean (e importan sus SDKs) en el primer uso o en warmup(),
+# no al importar el módulo, para que el arranque de los workers sea rápido
+_clients_lock = threading.RLock()
+_client = None
+_search_client = None
+_embedding_service = None
+_vector_index = None
+_vector_index_loaded = False
+_lexical_index = None
+_lexical_index_loaded = False
+# Versiones asíncronas (ruta async): se usan solo desde el loop compartido
+_async_client = None
+_async_search_client = None
+
+# Campos que se piden al índice de Azure en cada búsqueda. page_embedding
+# solo existe en los índices creados desde que se precalculan embeddings:
+# si el índice no lo tiene se deja de pedir y se recalculan los de los hits
+BASE_SEARCH_FIELDS = ["document_id", "document_name", "page_number", "page_text"]
+SEARCH_FIELDS = BASE_SEARCH_FIELDS + ["page_embedding"]
+_search_fields = SEARCH_FIELDS
+
+def _drop_embedding_field(fields: List[str], error: Exception) -> bool:
+    """
+    True (y deja de pedir page_embedding) si la búsqueda falló porque el
+    índice no tiene ese campo; la búsqueda debe repetirse
+    """
+    global _search_fields
+    if "page_embedding" not in fields or "page_embedding" not in str(error):
+        return False
+    print(f"Search index has no page_embedding field, searching without it: {str(error)}")
+    _search_fields = BASE_SEARCH_FIELDS
+    return True
+
+def _require(values: dict):
+    """Lanza un error (en vez de terminar el proceso) si falta configuración"""
+    missing = [name for name, value in values.items() if not value]
+    if missing:
+        raise RuntimeError(f"ERROR: missing configuration: {', '.join(missing)}")
+
+def _require_openai():
+    _require({
+        "OPENAI_API_KEY": API_KEY,
+        "OPENAI_API_BASE": RESOURCE_ENDPOINT,
+        "CHAT_MODEL_NAME": chat_model,
+        "EMBEDDING_MODEL_NAME": EMBEDDING_NAME
+    })
+
+def _require_search():
+    _require({
+        "AZURE_COGNITIVE_SEARCH_ENDPOINT": service_endpoint,
+        "AZURE_COGNITIVE_SEARCH_KEY": key,
+        "AZURE_COGNITIVE_SEARCH_DOC_INDEX_NAME": index_name
+    })
+
+def get_openai_client():
+    """Cliente de Azure OpenAI"""
+    global _client
+    if _client is None:
+        with _clients_lock:
+            if _client is None:
+                _require_openai()
+                import openai
+                _client = openai.AzureOpenAI(
+                    api_key=API_KEY,
+                    api_version=os.getenv("OPENAI_API_VERSION"),
+                    azure_endpoint=RESOURCE_ENDPOINT,
+                    timeout=OPENAI_TIMEOUT
+                )
+    return _client
+
+def get_search_client():
+    """Cliente de Azure Cognitive Search"""
+    global _search_client
+    if _search_client is None:
+        with _clients_lock:
+            if _search_client is None:
+                _require_search()
+                from azure.core.credentials import AzureKeyCredential
+                from azure.search.documents import SearchClient
+                _search_client = SearchClient(
+                    endpoint=service_endpoint, 
+                    index_name=index_name, 
+                    credential=AzureKeyCredential(key),
+                    connection_timeout=SEARCH_TIMEOUT,
+                    read_timeout=SEARCH_TIMEOUT
+                )
+    return _search_client
+
+def get_async_openai_client():
+    """Cliente asíncrono de Azure OpenAI (solo para el loop compartido)"""
+    global _async_client
+    if _async_client is None:
+        with _clients_lock:
+            if _async_client is None:
+                _require_openai()
+                import openai
+                _async_client = openai.AsyncAzureOpenAI(
+                    api_key=API_KEY,
+                    api_version=os.getenv("OPENAI_API_VERSION"),
+                    azure_endpoint=RESOURCE_ENDPOINT,
+                    timeout=OPENAI_TIMEOUT
+                )
+    return _async_client
+
+def get_async_search_client():
+    """Cliente asíncrono de Azure Cognitive Search (solo para el loop compartido)"""
+    global _async_search_client
+    if _async_search_client is None:
+        with _clients_lock:
+            if _async_search_client is None:
+                _require_search()
+                from azure.core.credentials import AzureKeyCredential
+                from azure.search.documents.aio import SearchClient
+                _async_search_client = SearchClient(
+                    endpoint=service_endpoint,
+                    index_name=index_name,
+                    credential=AzureKeyCredential(key),
+                    connection_timeout=SEARCH_TIMEOUT,
+                    read_timeout=SEARCH_TIMEOUT
+                )
+    return _async_search_client
+
+def get_embedding_service():
+    """Servicio de embeddings (lotes, concurrencia y reintentos ante 429)"""
+    global _embedding_service
+    if _embedding_service is None:
+        with _clients_lock:
+            if _embedding_service is None:
+                from aivolutioncoach.services.embedding_service import EmbeddingService
+                _embedding_service = EmbeddingService.from_env(get_openai_client(), EMBEDDING_NAME)
+    return _embedding_service
+
+def get_vector_index():
+    """Índice vectorial local, o None si no existe o SEARCH_MODE es remote"""
+    global _vector_index, _vector_index_loaded
+    if not _vector_index_loaded:
+        with _clients_lock:
+            if not _vector_index_loaded:
+                _vector_index = load_vector_index(VECTOR_INDEX_PATH) if SEARCH_MODE != "remote" else None
+                _vector_index_loaded = True
+    return _vector_index
+
+def get_lexical_index():
+    """Índice BM25 local, o None si aún no se ha construido"""
+    global _lexical_index, _lexical_index_loaded
+    if not _lexical_index_loaded:
+        with _clients_lock:
+            if not _lexical_index_loaded:
+                _lexical_index = load_bm25_index(LEXICAL_INDEX_PATH)
+                _lexical_index_loaded = True
+    return _lexical_index
+
+def merge_hits(*hit_lists: List[dict]) -> List[dict]:
+    """Une listas de candidatos sin repetir document_id (gana la primera aparición)"""
+    merged = {}
+    for hits in hit_lists:
+        for hit in hits:
+            merged.setdefault(hit['document_id'], hit)
+    return list(merged.values())
+
+def set_clients(client=None, search_client=None, async_client=None, async_search_client=None):
+    """
+    Sustituye los clientes (p.ej. por dobles locales en los benchmarks).
+    El servicio de embeddings se recrea sobre el nuevo cliente
+    """
+    global _client, _search_client, _async_client, _async_search_client, _embedding_service
+    with _clients_lock:
+        if client is not None:
+            _client = client
+            _embedding_service = None
+        if search_client is not None:
+            _search_client = search_client
+        if async_client is not None:
+            _async_client = async_client
+        if async_search_client is not None:
+            _async_search_client = async_search_client
+
+def preload():
+    """
+    Carga solo el estado de solo lectura (índices locales y tokenizador),
+    sin clientes, hilos ni conexiones: con gunicorn --preload se ejecuta
+    antes del fork y los workers comparten esas páginas (copy-on-write)
+    """
+    get_vector_index()
+    get_lexical_index()
+    count_tokens("preload")
+
+def warmup():
+    """
+    Crea todos los clientes, carga el índice local y el tokenizador, para
+    que la primera petición no pague la inicialización
+    """
+    get_openai_client()
+    get_search_client()
+    get_embedding_service()
+    get_vector_index()
+    get_lexical_index()
+    count_tokens("warmup")
 
 # Función para obtener embeddings
 def get_embedding(text: str, embedding_name: str = EMBEDDING_NAME) -> List[float]:
@@ -77,11 +262,31 @@ def get_embedding(text: str, embedding_name: str = EMBEDDING_NAME) -> List[float
     Returns:
         List[float]: Vector de embedding
     """
-    response = client.embeddings.create(
-        model=embedding_name,
-        input=text
-    )
-    return response.data[0].embedding
+    with stage("embedding"):
+        return get_embedding_service().get_embedding(text, model=embedding_name)
+
+def get_embeddings(texts: List[str], embedding_name: str = EMBEDDING_NAME) -> List[List[float]]:
+    """
+    Obtiene los embeddings de varios textos en lotes concurrentes
+    
+    Args:
+        texts (List[str]): Textos para obtener el embedding
+        embedding_name (str): Modelo de embedding a usar
+        
+    Returns:
+        List[List[float]]: Vectores de embedding, en el mismo orden
+    """
+    with stage("embedding"):
+        return get_embedding_service().get_embeddings(texts, model=embedding_name)
+
+async def aget_embeddings(texts: List[str], embedding_name: str = EMBEDDING_NAME) -> List[List[float]]:
+    """
+    Versión asíncrona de get_embeddings (una sola petición; los reintentos
+    ante 429 los hace el SDK)
+    """
+    with stage("embedding"):
+        response = await get_async_openai_client().embeddings.create(input=texts, model=embedding_name)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
 # Función para calcular similitud del coseno
 def cosine_similarity(a: List[float], b: List[float]) -> float:
@@ -97,10 +302,22 @@ def cosine_similarity(a: List[float], b: List[float]) -> float:
     """
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
+# Sesión usada cuando no se indica ninguna (p.ej. el chat interactivo)
+DEFAULT_SESSION = "default"
+
 class AIvolutionCoachChat:
-    def __init__(self):
-        self.conversation_history = []
-        self.max_history = 5  # Máximo número de mensajes a mantener
+    def __init__(self, conversation_store: ConversationStore = None, prompt_builder: PromptBuilder = None,
+                 answer_cache: SemanticAnswerCache = None):
+        # Histórico por sesión; por defecto un almacén en memoria de 5 mensajes
+        # (is None: un almacén vacío tiene len() 0 y sería falso)
+        self.conversation_store = (
+            conversation_store if conversation_store is not None else ConversationStore(max_messages=5)
+        )
+        # Presupuesto de tokens de entrada/salida por petición
+        self.prompt_builder = prompt_builder or PromptBuilder.from_env()
+        # Respuestas reutilizables para preguntas repetidas o casi idénticas
+        self.answer_cache = answer_cache or SemanticAnswerCache.from_env(index_folder=VECTOR_INDEX_PATH)
+        self.max_history = self.conversation_store.max_messages  # Máximo número de mensajes a mantener
         self.system_prompt = '''You are AIvolution Coach, a professional and empathetic assistant 
                             specialized EXCLUSIVELY in employability for people with disabilities.
 
@@ -142,117 +359,410 @@ class AIvolutionCoachChat:
                             "I am specialized in employment assistance for people with disabilities. 
                             Let me help you with job-related questions instead."'''
         
-    def add_message(self, role: str, content: str):
+    @property
+    def conversation_history(self) -> List[dict]:
+        """Histórico de la sesión por defecto"""
+        return self.get_history(DEFAULT_SESSION)
+
+    def get_history(self, session_id: str = DEFAULT_SESSION) -> List[dict]:
+        """Devuelve el histórico de conversación de una sesión"""
+        return self.conversation_store.get_history(session_id)
+
+    def add_message(self, role: str, content: str, session_id: str = DEFAULT_SESSION):
         """Añade un mensaje al histórico de conversación"""
-        self.conversation_history.append({"role": role, "content": content})
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history.pop(0)
+        self.conversation_store.add_message(session_id, role, content)
+
+    def reset(self, session_id: str = DEFAULT_SESSION):
+        """Borra el histórico de conversación de una sesión"""
+        self.conversation_store.reset(session_id)
     
-    def get_chat_completion(self, prompt: str, model: str = chat_model, temperature: float = 0, 
-                          max_tokens: int = 15000, frequency_penalty: float = 0) -> str:
-        """Gets a response from the chat model with conversation history"""
-        try:
-            messages = [
-                {"role": "system", "content": self.system_prompt}
-            ]
-            
-            # Añadir histórico de conversación
-            messages.extend(self.conversation_history)
-            
-            # Añadir prompt actual
-            messages.append({"role": "user", "content": prompt})
-            
-            response = client.chat.completions.create(
+    def _complete(self, build: PromptBuild, model: str = chat_model, temperature: float = 0,
+                  max_tokens: int = None, frequency_penalty: float = 0, usage: dict = None) -> str:
+        """Envía los mensajes ya presupuestados al modelo de chat"""
+        with stage("completion"):
+            response = get_openai_client().chat.completions.create(
                 model=model,
-                messages=messages,
+                messages=build.messages,
                 temperature=temperature,
-                max_tokens=max_tokens,
+                max_tokens=max_tokens or build.max_tokens,
                 frequency_penalty=frequency_penalty
             )
+        self._record_usage(build, max_tokens, response, usage)
+        return response.choices[0].message.content
+
+    def complete(self, system_prompt: str, prompt: str, temperature: float = 0,
+                 max_tokens: int = None, usage: dict = None) -> str:
+        """Una llamada al modelo sin histórico ni búsqueda (p.ej. para los informes)"""
+        with stage("prompt.build"):
+            build = self.prompt_builder.build_chat(system_prompt, prompt)
+        return self._complete(build, temperature=temperature, max_tokens=max_tokens, usage=usage)
+
+    async def _acomplete(self, build: PromptBuild, model: str = chat_model, temperature: float = 0,
+                         max_tokens: int = None, frequency_penalty: float = 0, usage: dict = None) -> str:
+        """Versión asíncrona de _complete"""
+        with stage("completion"):
+            response = await get_async_openai_client().chat.completions.create(
+                model=model,
+                messages=build.messages,
+                temperature=temperature,
+                max_tokens=max_tokens or build.max_tokens,
+                frequency_penalty=frequency_penalty
+            )
+        self._record_usage(build, max_tokens, response, usage)
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _record_usage(build: PromptBuild, max_tokens: int, response, usage: dict = None):
+        """Registra los tokens del prompt presupuestado y los que informa el servicio"""
+        stats = {
+            "prompt_tokens": build.prompt_tokens,
+            "max_tokens": max_tokens or build.max_tokens,
+            "history_messages": build.history_messages,
+            "context_chunks": build.context_chunks
+        }
+        if getattr(response, "usage", None) is not None:
+            stats["reported_prompt_tokens"] = response.usage.prompt_tokens
+            stats["completion_tokens"] = response.usage.completion_tokens
+        observe_tokens(stats.get("reported_prompt_tokens", build.prompt_tokens), stats.get("completion_tokens", 0))
+        if usage is not None:
+            usage.update(stats)
+
+    def _complete_stream(self, build: PromptBuild, model: str = chat_model, temperature: float = 0,
+                         max_tokens: int = None, frequency_penalty: float = 0,
+                         usage: dict = None) -> Iterator[str]:
+        """Igual que _complete, pero va devolviendo los tokens según llegan"""
+        with stage("completion.stream"):
+            started = time.perf_counter()
+            first_token = True
+            stream = get_openai_client().chat.completions.create(
+                model=model,
+                messages=build.messages,
+                temperature=temperature,
+                max_tokens=max_tokens or build.max_tokens,
+                frequency_penalty=frequency_penalty,
+                stream=True
+            )
+
+            completion = []
+            for chunk in stream:
+                # Azure envía primero un chunk sin choices (filtros de contenido)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token:
+                        record("completion.first_token", time.perf_counter() - started)
+                        first_token = False
+                    completion.append(delta)
+                    yield delta
+
+        stats = {
+            "prompt_tokens": build.prompt_tokens,
+            "max_tokens": max_tokens or build.max_tokens,
+            "history_messages": build.history_messages,
+            "context_chunks": build.context_chunks,
+            "completion_tokens": count_tokens("".join(completion))
+        }
+        observe_tokens(build.prompt_tokens, stats["completion_tokens"])
+        if usage is not None:
+            usage.update(stats)
+
+    def get_chat_completion(self, prompt: str, model: str = chat_model, temperature: float = 0, 
+                          max_tokens: int = None, frequency_penalty: float = 0,
+                          session_id: str = DEFAULT_SESSION, usage: dict = None) -> str:
+        """Gets a response from the chat model with conversation history"""
+        try:
+            # Histórico recortado al presupuesto de tokens + prompt actual
+            with stage("prompt.build"):
+                build = self.prompt_builder.build_chat(self.system_prompt, prompt, self.get_history(session_id))
+            answer = self._complete(build, model, temperature, max_tokens, frequency_penalty, usage)
             
             # Guardar la interacción en el histórico
-            self.add_message("user", prompt)
-            self.add_message("assistant", response.choices[0].message.content)
+            self.add_message("user", prompt, session_id)
+            self.add_message("assistant", answer, session_id)
             
-            return response.choices[0].message.content
+            return answer
         except Exception as e:
             print(f"Error in get_chat_completion: {str(e)}")
             return None
 
-    def semantic_search(self, query: str, top_k: int = 3) -> pd.DataFrame:
-        """Realiza una búsqueda semántica usando Azure Cognitive Search y embeddings"""
+    def semantic_search(self, query: str, top_k: int = 3, query_embedding: List[float] = None) -> List[dict]:
+        """
+        Realiza una búsqueda semántica usando Azure Cognitive Search y embeddings.
+
+        El ranking es un producto matriz-vector sobre embeddings normalizados
+        (VectorIndex); devuelve una lista de registros con 'page_text',
+        'document_name' y 'score', ordenada por similitud
+        """
         try:
-            results = search_client.search(
-                search_text=query, 
-                top=10,
-                include_total_count=True
-            )
-            
-            page_chunks = []
-            citations = []
-            for result in results:
-                page_chunks.append(result['page_text'])
-                citations.append(result['document_name'])
-                
-            embed_df = pd.DataFrame({
-                "page_chunks": page_chunks,
-                "citations": citations
-            })
-            
-            embed_df['embedding'] = embed_df["page_chunks"].apply(
-                lambda text: get_embedding(text, embedding_name=EMBEDDING_NAME)
-            )
-            
-            query_embedding = get_embedding(query, embedding_name=EMBEDDING_NAME)
-            embed_df["similarities"] = embed_df['embedding'].apply(
-                lambda embedding: cosine_similarity(embedding, query_embedding)
-            )
-            
-            top_results = (
-                embed_df.sort_values("similarities", ascending=False)
-                .head(top_k)
-                .reset_index(drop=True)
-            )
-            
-            return top_results
+            if query_embedding is None:
+                query_embedding = get_embedding(query, embedding_name=EMBEDDING_NAME)
+
+            vector_index = get_vector_index()
+            if SEARCH_MODE == "local" and vector_index is not None:
+                with stage("search.local"):
+                    return vector_index.search(query_embedding, top_k=top_k)
+
+            hits = self._candidate_hits(query)
+            if not hits:
+                return []
+
+            if vector_index is not None:
+                with stage("search.rescore"):
+                    ranked = vector_index.rescore(
+                        query_embedding, [hit['document_id'] for hit in hits], top_k=top_k
+                    )
+                if ranked:
+                    return ranked
+
+            # Los embeddings se precalculan en la ingesta (DocumentProcessor);
+            # solo se recalculan (en un único lote) si el índice aún no los tiene
+            missing = [hit for hit in hits if not hit.get('page_embedding')]
+            if missing:
+                with stage("search.embed_hits"):
+                    embeddings = get_embeddings([hit['page_text'] for hit in missing])
+                for hit, embedding in zip(missing, embeddings):
+                    hit['page_embedding'] = embedding
+
+            with stage("search.rank"):
+                return VectorIndex.from_documents(hits).search(query_embedding, top_k=top_k)
             
         except Exception as e:
             print(f"Error en semantic_search: {str(e)}")
-            return pd.DataFrame()
+            return []
+
+    @staticmethod
+    def _lexical_hits(query: str, lexical_index) -> List[dict]:
+        with stage("search.bm25"):
+            return lexical_index.search(query, top_k=SEARCH_CANDIDATES_TOP)
+
+    @staticmethod
+    def _azure_hits(query: str) -> List[dict]:
+        """Candidatos de Azure Search (sin page_embedding si el índice no lo tiene)"""
+        while True:
+            fields = _search_fields
+            try:
+                results = get_search_client().search(
+                    search_text=query,
+                    top=SEARCH_CANDIDATES_TOP,
+                    include_total_count=True,
+                    select=fields
+                )
+                return [dict(result) for result in results]
+            except Exception as e:
+                if not _drop_embedding_field(fields, e):
+                    raise
+
+    @staticmethod
+    async def _aazure_hits(query: str) -> List[dict]:
+        """Versión asíncrona de _azure_hits"""
+        while True:
+            fields = _search_fields
+            try:
+                results = await get_async_search_client().search(
+                    search_text=query,
+                    top=SEARCH_CANDIDATES_TOP,
+                    include_total_count=True,
+                    select=fields
+                )
+                return [dict(result) async for result in results]
+            except Exception as e:
+                if not _drop_embedding_field(fields, e):
+                    raise
+
+    def _candidate_hits(self, query: str) -> List[dict]:
+        """
+        Candidatos para el ranking: de Azure Search, del índice BM25 local o
+        de ambos según SEARCH_CANDIDATES. Sin índice local siempre se usa Azure
+        """
+        lexical_index = get_lexical_index()
+        use_lexical = lexical_index is not None and SEARCH_CANDIDATES != "remote"
+        hits = []
+        if SEARCH_CANDIDATES != "bm25" or lexical_index is None:
+            try:
+                with stage("search.azure"):
+                    hits = self._azure_hits(query)
+            except Exception as e:
+                if lexical_index is None:
+                    raise
+                print(f"Azure Search failed, using local BM25 candidates: {str(e)}")
+                use_lexical = True
+        if use_lexical:
+            hits = merge_hits(hits, self._lexical_hits(query, lexical_index))
+        return hits
 
-    def search_and_answer(self, query: str) -> str:
+    async def _asearch_hits(self, query: str) -> List[dict]:
+        """Versión asíncrona de _candidate_hits"""
+        lexical_index = get_lexical_index()
+        use_lexical = lexical_index is not None and SEARCH_CANDIDATES != "remote"
+        hits = []
+        if SEARCH_CANDIDATES != "bm25" or lexical_index is None:
+            try:
+                with stage("search.azure"):
+                    hits = await self._aazure_hits(query)
+            except Exception as e:
+                if lexical_index is None:
+                    raise
+                print(f"Azure Search failed, using local BM25 candidates: {str(e)}")
+                use_lexical = True
+        if use_lexical:
+            hits = merge_hits(hits, self._lexical_hits(query, lexical_index))
+        return hits
+
+    async def _arank(self, query_embedding: List[float], search, vector_index, top_k: int = 3) -> List[dict]:
+        """
+        Parte asíncrona de semantic_search: espera los resultados de Azure (ya
+        en vuelo) y los ordena por similitud con la consulta
+        """
+        try:
+            if search is None:
+                with stage("search.local"):
+                    return vector_index.search(query_embedding, top_k=top_k)
+
+            hits = await search
+            if not hits:
+                return []
+
+            if vector_index is not None:
+                with stage("search.rescore"):
+                    ranked = vector_index.rescore(
+                        query_embedding, [hit['document_id'] for hit in hits], top_k=top_k
+                    )
+                if ranked:
+                    return ranked
+
+            missing = [hit for hit in hits if not hit.get('page_embedding')]
+            if missing:
+                with stage("search.embed_hits"):
+                    embeddings = await aget_embeddings([hit['page_text'] for hit in missing])
+                for hit, embedding in zip(missing, embeddings):
+                    hit['page_embedding'] = embedding
+
+            with stage("search.rank"):
+                return VectorIndex.from_documents(hits).search(query_embedding, top_k=top_k)
+
+        except Exception as e:
+            print(f"Error en asemantic_search: {str(e)}")
+            return []
+
+    def _build_answer_prompt(self, query: str, history: List[dict],
+                             query_embedding: List[float] = None) -> PromptBuild:
+        """Búsqueda + prompt presupuestado para responder a una consulta"""
+        search_results = self.semantic_search(query, query_embedding=query_embedding)
+        
+        #if not search_results:
+            #return "Sorry, I couldn't find any relevant information for your query."
+        
+        # El histórico va solo como mensajes (no repetido en el prompt) y el
+        # contexto se recorta por relevancia al presupuesto de tokens
+        with stage("prompt.build"):
+            return self.prompt_builder.build(self.system_prompt, query, search_results, history)
+
+    def _use_answer_cache(self, history: List[dict]) -> bool:
+        """La caché solo aplica si la respuesta no depende del histórico"""
+        return self.answer_cache.enabled and (not history or ANSWER_CACHE_IGNORE_HISTORY)
+
+    def search_and_answer(self, query: str, session_id: str = DEFAULT_SESSION, usage: dict = None) -> str:
         """Función principal que combina búsqueda y generación de respuesta con contexto"""
         try:
-            search_results = self.semantic_search(query)
-            
-            #if search_results.empty:
-                #return "Sorry, I couldn't find any relevant information for your query."
-            
-            context_prompt = f"""
-            As AIvolution Coach, use the following information to provide a helpful response:
-
-            User Query: ```{query}```
-            Context Information: ```{search_results['page_chunks'].to_list()}```
-            Sources: ```{search_results['citations'].to_list()}```
-
-            Previous conversation context: ```{self.conversation_history}```
-
-            Requirements:
-            1. Provide a clear and empathetic response
-            2. Include specific recommendations if applicable
-            3. Cite sources when possible
-            4. Keep the response concise and concise
-            5. Use a motivating tone
-            6. Reference previous conversation when relevant
-            """
+            history = self.get_history(session_id)
+            query_embedding = get_embedding(query, embedding_name=EMBEDDING_NAME)
+            use_cache = self._use_answer_cache(history)
+
+            answer = self.answer_cache.lookup(query_embedding) if use_cache else None
+            if answer is not None:
+                # Acierto de caché: sin búsqueda ni llamada al modelo
+                if usage is not None:
+                    usage["cache_hit"] = True
+            else:
+                build = self._build_answer_prompt(query, history, query_embedding)
+                answer = self._complete(build, temperature=0.5, usage=usage)
+                if use_cache:
+                    self.answer_cache.store(query_embedding, answer)
             
-            answer = self.get_chat_completion(context_prompt, temperature=0.5)
+            # En el histórico se guarda la pregunta del usuario, no el prompt con contexto
+            self.add_message("user", query, session_id)
+            self.add_message("assistant", answer, session_id)
             return answer
             
         except Exception as e:
             print(f"Error en search_and_answer: {str(e)}")
             return "Lo siento, ocurrió un error al procesar tu consulta."
 
+    async def asearch_and_answer(self, query: str, session_id: str = DEFAULT_SESSION,
+                                 usage: dict = None) -> str:
+        """
+        Versión asíncrona de search_and_answer. La búsqueda en Azure y el
+        embedding de la consulta se lanzan a la vez, así que la latencia es
+        la del paso más lento y no la suma. Se ejecuta en el loop compartido
+        """
+        return await run_on_loop(self._asearch_and_answer(query, session_id, usage))
+
+    async def _asearch_and_answer(self, query: str, session_id: str, usage: dict) -> str:
+        try:
+            history = self.get_history(session_id)
+            use_cache = self._use_answer_cache(history)
+            vector_index = get_vector_index()
+
+            search = None
+            if not (SEARCH_MODE == "local" and vector_index is not None):
+                search = asyncio.ensure_future(self._asearch_hits(query))
+            try:
+                query_embedding = (await aget_embeddings([query]))[0]
+
+                answer = self.answer_cache.lookup(query_embedding) if use_cache else None
+                if answer is not None:
+                    if usage is not None:
+                        usage["cache_hit"] = True
+                else:
+                    search_results = await self._arank(query_embedding, search, vector_index)
+                    with stage("prompt.build"):
+                        build = self.prompt_builder.build(self.system_prompt, query, search_results, history)
+                    answer = await self._acomplete(build, temperature=0.5, usage=usage)
+                    if use_cache:
+                        self.answer_cache.store(query_embedding, answer)
+            finally:
+                # Acierto de caché o error: la búsqueda ya no hace falta
+                if search is not None and not search.done():
+                    search.cancel()
+
+            self.add_message("user", query, session_id)
+            self.add_message("assistant", answer, session_id)
+            return answer
+
+        except Exception as e:
+            print(f"Error en asearch_and_answer: {str(e)}")
+            return "Lo siento, ocurrió un error al procesar tu consulta."
+
+    def stream_search_and_answer(self, query: str, session_id: str = DEFAULT_SESSION,
+                                 usage: dict = None) -> Iterator[str]:
+        """
+        Versión en streaming de search_and_answer: devuelve los fragmentos de
+        la respuesta según los genera el modelo. El histórico solo se
+        actualiza cuando el stream termina completo
+        """
+        history = self.get_history(session_id)
+        query_embedding = get_embedding(query, embedding_name=EMBEDDING_NAME)
+        use_cache = self._use_answer_cache(history)
+
+        cached = self.answer_cache.lookup(query_embedding) if use_cache else None
+        if cached is not None:
+            if usage is not None:
+                usage["cache_hit"] = True
+            answer = [cached]
+            yield cached
+        else:
+            build = self._build_answer_prompt(query, history, query_embedding)
+            answer = []
+            for delta in self._complete_stream(build, temperature=0.5, usage=usage):
+                answer.append(delta)
+                yield delta
+            if use_cache:
+                self.answer_cache.store(query_embedding, "".join(answer))
+        
+        self.add_message("user", query, session_id)
+        self.add_message("assistant", "".join(answer), session_id)
+
 
 
 
@@ -0,0 +1,183 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, List, Dict, Optional
+from aivolutioncoach.services.shared_cache import open_shared_db, shared_db_path
+
+
+class _Session:
+    __slots__ = ("messages", "last_access")
+
+    def __init__(self, max_messages: int, messages: Optional[List[dict]] = None):
+        self.messages: Deque[dict] = deque(messages or [], maxlen=max_messages)
+        self.last_access = time.monotonic()
+
+
+class ConversationStore:
+    """
+    Histórico de conversación por sesión, seguro entre hilos.
+
+    - Cada sesión guarda como máximo max_messages mensajes (deque acotada).
+    - Las sesiones inactivas más de ttl_seconds se eliminan, y si hay más de
+      max_sessions se expulsan las menos usadas (LRU); así la memoria queda
+      acotada a max_sessions * max_messages mensajes.
+    - Con db_path, los mensajes se persisten en SQLite: una sesión expulsada
+      por LRU se recupera de disco en su siguiente petición. Con
+      max_sessions=0 todo se lee de SQLite, así que varios workers ven el
+      mismo histórico.
+    """
+
+    def __init__(self, max_messages: int = 5, ttl_seconds: float = 1800,
+                 max_sessions: int = 1000, db_path: Optional[str] = None):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = self._open_db(db_path) if db_path else None
+        self._last_db_purge = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ConversationStore":
+        """
+        Crea el almacén con la configuración de las variables de entorno
+        """
+        return cls(
+            max_messages=int(os.getenv("CONVERSATION_MAX_MESSAGES", "5")),
+            ttl_seconds=float(os.getenv("CONVERSATION_TTL_SECONDS", "1800")),
+            max_sessions=int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000")),
+            db_path=shared_db_path("CONVERSATION_DB_PATH", "conversations.db")
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def get_history(self, session_id: str) -> List[dict]:
+        """
+        Devuelve una copia del histórico de la sesión (vacío si no existe)
+        """
+        with self._lock:
+            session = self._get_session(session_id, create=False)
+            return list(session.messages) if session else []
+
+    def add_message(self, session_id: str, role: str, content: str) -> None:
+        """
+        Añade un mensaje al histórico de la sesión
+        """
+        message = {"role": role, "content": content}
+        with self._lock:
+            session = self._get_session(session_id, create=True)
+            session.messages.append(message)
+            if self._db:
+                self._db.execute(
+                    "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                    (session_id, role, content)
+                )
+                self._db.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND id NOT IN "
+                    "(SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                    (session_id, session_id, self.max_messages)
+                )
+                self._touch_db(session_id)
+                self._db.commit()
+
+    def reset(self, session_id: str) -> None:
+        """
+        Borra el histórico de una sesión
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db:
+                self._delete_db_sessions([session_id])
+                self._db.commit()
+
+    def _get_session(self, session_id: str, create: bool) -> Optional[_Session]:
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        session = self._sessions.get(session_id)
+        if session is None and self._db:
+            messages = self._load_db_session(session_id)
+            if messages:
+                session = _Session(self.max_messages, messages)
+        if session is None:
+            if not create:
+                return None
+            session = _Session(self.max_messages)
+
+        session.last_access = now
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            # Expulsión LRU: en modo SQLite los mensajes siguen en disco
+            self._sessions.popitem(last=False)
+        return session
+
+    def _evict_expired(self, now: float) -> None:
+        # El OrderedDict está en orden de acceso: las expiradas van primero
+        expired = []
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            expired.append(session_id)
+
+        if self._db and (expired or now - self._last_db_purge > 60):
+            self._delete_db_sessions(expired)
+            self._db.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE last_access < ?)",
+                (time.time() - self.ttl_seconds,)
+            )
+            self._db.execute("DELETE FROM sessions WHERE last_access < ?", (time.time() - self.ttl_seconds,))
+            self._db.commit()
+            self._last_db_purge = now
+
+    # Persistencia SQLite
+
+    @staticmethod
+    def _open_db(db_path: str) -> sqlite3.Connection:
+        db = open_shared_db(db_path)
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_access ON sessions (last_access);
+        """)
+        return db
+
+    def _touch_db(self, session_id: str) -> None:
+        self._db.execute(
+            "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+            (session_id, time.time())
+        )
+
+    def _load_db_session(self, session_id: str) -> List[Dict[str, str]]:
+        row = self._db.execute(
+            "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[0] >= self.ttl_seconds:
+            return []
+        rows = self._db.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_messages)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def _delete_db_sessions(self, session_ids: List[str]) -> None:
+        for session_id in session_ids:
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
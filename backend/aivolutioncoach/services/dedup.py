@@ -0,0 +1,180 @@
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+# Primo de Mersenne 2^31 - 1: (a * x + b) cabe en uint64 sin desbordar
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def citation(document: dict) -> str:
+    """Cita de un registro: documento y página"""
+    return f"{document['document_name']} (p. {document['page_number']})"
+
+
+@dataclass
+class DedupReport:
+    records_in: int = 0
+    records_out: int = 0
+    clusters: int = 0
+    chars_in: int = 0
+    chars_out: int = 0
+
+    @property
+    def removed(self) -> int:
+        return self.records_in - self.records_out
+
+    def summary(self) -> str:
+        share = (1 - self.chars_out / self.chars_in) * 100 if self.chars_in else 0.0
+        return (
+            f"{self.removed} of {self.records_in} record(s) removed as near-duplicates "
+            f"({self.clusters} group(s)), {share:.1f}% of the text"
+        )
+
+
+class NearDuplicateDetector:
+    """
+    Detección de registros casi duplicados con MinHash + LSH.
+
+    Cada texto se reduce a una firma de num_perm mínimos sobre sus shingles
+    de shingle_size palabras; la fracción de posiciones iguales entre dos
+    firmas estima su similitud de Jaccard. Las firmas se parten en bandas y
+    solo se comparan los textos que coinciden en alguna banda entera, así
+    que el coste es lineal en el número de registros.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = self._bands_for(threshold, num_perm)
+
+    @classmethod
+    def from_env(cls) -> "NearDuplicateDetector":
+        """
+        DEDUP_THRESHOLD (similitud de Jaccard estimada; 0 desactiva),
+        DEDUP_NUM_PERM y DEDUP_SHINGLE_SIZE
+        """
+        return cls(
+            threshold=float(os.getenv("DEDUP_THRESHOLD", "0.8")),
+            num_perm=int(os.getenv("DEDUP_NUM_PERM", "128")),
+            shingle_size=int(os.getenv("DEDUP_SHINGLE_SIZE", "3"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return 0 < self.threshold <= 1
+
+    @staticmethod
+    def _bands_for(threshold: float, num_perm: int) -> Tuple[int, int]:
+        """
+        Bandas x filas cuyo umbral de colisión (1/b)^(1/r) queda más cerca
+        del umbral pedido sin superarlo (mejor algún candidato de más que
+        perder duplicados: los candidatos se verifican después)
+        """
+        options = []
+        for rows in range(1, num_perm + 1):
+            if num_perm % rows:
+                continue
+            bands = num_perm // rows
+            options.append(((1 / bands) ** (1 / rows), bands, rows))
+        below = [option for option in options if option[0] <= threshold] or options
+        _, bands, rows = min(below, key=lambda option: abs(option[0] - threshold))
+        return bands, rows
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())
+        size = self.shingle_size
+        grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        return np.array([zlib.crc32(gram.encode("utf-8")) for gram in grams], dtype=np.uint64) % _PRIME
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash de un texto (num_perm valores)"""
+        shingles = self._shingles(text)
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) % _PRIME
+        return hashed.min(axis=1)
+
+    def stream(self, text_field: str = "page_text") -> "DedupStream":
+        """Pasada de deduplicación en streaming con este detector"""
+        return DedupStream(self, text_field)
+
+
+class DedupStream:
+    """
+    Deduplicación registro a registro, con memoria proporcional solo a los
+    registros canónicos (su firma, sus claves de banda y sus citas).
+
+    El canónico de cada grupo es el primero que llega: con la misma entrada
+    en el mismo orden el resultado es siempre el mismo. Un casi duplicado
+    posterior añade su cita a la lista 'citations' del canónico, que puede
+    haberse entregado ya; changed() devuelve las citas de los que las
+    recibieron.
+    """
+
+    def __init__(self, detector: NearDuplicateDetector, text_field: str = "page_text"):
+        self.detector = detector
+        self.text_field = text_field
+        self.report = DedupReport()
+        self._buckets: List[Dict[bytes, int]] = [{} for _ in range(detector.bands)]
+        # Valores < 2^31: caben en uint32 (la mitad de memoria por firma)
+        self._signatures: List[np.ndarray] = []
+        # document_id y lista de citas (la misma del registro entregado)
+        self._canonical: List[Tuple[str, List[str]]] = []
+        self._merged = set()
+
+    def add(self, document: dict) -> Optional[dict]:
+        """
+        Devuelve el registro (con 'citations') si es canónico, o None si es
+        casi duplicado de uno anterior
+        """
+        text = document[self.text_field]
+        self.report.records_in += 1
+        self.report.chars_in += len(text)
+        signature = self.detector.signature(text).astype(np.uint32)
+        rows = self.detector.rows
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.detector.bands)]
+
+        # Se verifica solo contra el primer canónico de cada cubo: coste lineal
+        for band, key in enumerate(keys):
+            index = self._buckets[band].get(key)
+            if index is not None and np.mean(self._signatures[index] == signature) >= self.detector.threshold:
+                citations = self._canonical[index][1]
+                if citation(document) not in citations:
+                    citations.append(citation(document))
+                self._merged.add(index)
+                self.report.clusters = len(self._merged)
+                return None
+
+        index = len(self._canonical)
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, index)
+        self._signatures.append(signature)
+        keeper = dict(document, citations=[citation(document)])
+        self._canonical.append((keeper['document_id'], keeper['citations']))
+        self.report.records_out += 1
+        self.report.chars_out += len(text)
+        return keeper
+
+    def citations(self) -> Dict[str, List[str]]:
+        """
+        Citas de cada canónico por document_id (definitivas cuando ya han
+        pasado todos los registros)
+        """
+        return dict(self._canonical)
+
+    def changed(self) -> List[dict]:
+        """
+        {'document_id', 'citations'} de los canónicos que han recibido citas
+        de casi duplicados
+        """
+        return [
+            {'document_id': document_id, 'citations': list(citations)}
+            for document_id, citations in self._canonical if len(citations) > 1
+        ]
@@ -1,6 +1,11 @@
 import os
-import json
-from typing import List, Dict
+import re
+import time
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import openai
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.formrecognizer import DocumentAnalysisClient
 from azure.search.documents import SearchClient
@@ -12,6 +17,23 @@ from azure.search.documents.indexes.models import (
     SearchFieldDataType
 )
 from dotenv import load_dotenv, find_dotenv
+from aivolutioncoach.services.vector_index import VectorIndex, VectorIndexBuilder, write_index_version
+from aivolutioncoach.services.embedding_store import QuantizedVectorIndex, STORE_DTYPES, store_report
+from aivolutioncoach.services.bm25_index import BM25Index, BM25IndexBuilder, LEXICAL_INDEX_FOLDER
+from aivolutioncoach.services.chunking import PageChunker
+from aivolutioncoach.services.dedup import DedupStream, NearDuplicateDetector
+from aivolutioncoach.services.embedding_service import EmbeddingService
+from aivolutioncoach.services.bulk_uploader import BulkUploader
+from aivolutioncoach.services.extracted_store import (
+    EXTRACTED_EXTENSION, LEGACY_EXTENSION, document_base_id, extracted_paths, extracted_stem,
+    normalize_path, read_extracted, source_name, write_extracted
+)
+from aivolutioncoach.services.ingest_manifest import IngestManifest, IngestPlan, MANIFEST_FILE, file_hash
+from aivolutioncoach.services import metrics
+from aivolutioncoach.services.metrics import stage
+
+# Carpeta backend/ (datos, extraídos e índices locales cuelgan de aquí)
+BACKEND_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..")
 
 class DocumentProcessor:
     def __init__(self):
@@ -24,7 +46,19 @@ class DocumentProcessor:
         # Configurar carpetas
         self.raw_data_folder = self.config["RAW_DATA_FOLDER"]
         self.extracted_data_folder = self.config["EXTRACTED_DATA_FOLDER"]
+        self.vector_index_folder = self.config["VECTOR_INDEX_FOLDER"]
+        self.lexical_index_path = self.config["LEXICAL_INDEX_FOLDER"]
         os.makedirs(self.extracted_data_folder, exist_ok=True)
+        self.manifest_path = os.path.join(self.extracted_data_folder, MANIFEST_FILE)
+        
+        # Operaciones de análisis en vuelo y tamaño de los rangos de páginas
+        self.extraction_max_workers = int(self.config["EXTRACTION_MAX_WORKERS"])
+        self.extraction_pages_per_range = int(self.config["EXTRACTION_PAGES_PER_RANGE"])
+
+        # Fragmentos por tokens como unidad de recuperación (CHUNK_TOKENS=0: páginas enteras)
+        self.chunker = PageChunker.from_env()
+        # Casi duplicados (portadas, diapositivas repetidas) colapsados con MinHash/LSH
+        self.deduplicator = NearDuplicateDetector.from_env()
 
         # Inicializar Document Intelligence client
         self.doc_client = DocumentAnalysisClient(
@@ -45,6 +79,18 @@ class DocumentProcessor:
         )
         
         self.index_name = self.config["SEARCH_INDEX_NAME"]
+        
+        # Subida por lotes, en paralelo y con reintentos por documento
+        self.uploader = BulkUploader.from_env(self.search_client, key_field="document_id")
+
+        # Inicializar Azure OpenAI client (embeddings precalculados en la ingesta)
+        self.openai_client = openai.AzureOpenAI(
+            api_key=self.config["OPENAI_API_KEY"],
+            api_version=self.config["OPENAI_API_VERSION"],
+            azure_endpoint=self.config["OPENAI_API_BASE"]
+        )
+        self.embedding_name = self.config["EMBEDDING_MODEL_NAME"]
+        self.embedding_service = EmbeddingService.from_env(self.openai_client, self.embedding_name)
 
     def _load_environment(self) -> Dict[str, str]:
         """
@@ -62,9 +108,25 @@ class DocumentProcessor:
             "SEARCH_KEY": os.getenv("AZURE_COGNITIVE_SEARCH_KEY"),
             "SEARCH_INDEX_NAME": os.getenv("AZURE_COGNITIVE_SEARCH_DOC_INDEX_NAME"),
             
-            # Folders
-            "RAW_DATA_FOLDER": "backend/unstructured-data",
-            "EXTRACTED_DATA_FOLDER": "backend/data-extracted"
+            # Azure OpenAI
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY"),
+            "OPENAI_API_BASE": os.getenv("OPENAI_API_BASE", "").strip(),
+            "OPENAI_API_VERSION": os.getenv("OPENAI_API_VERSION"),
+            "EMBEDDING_MODEL_NAME": os.getenv("EMBEDDING_MODEL_NAME", "").strip(),
+            
+            # Folders (relativas a backend/, como en coach.py, para que la
+            # ingesta escriba donde la app lee sea cual sea el directorio actual)
+            "RAW_DATA_FOLDER": os.path.join(BACKEND_FOLDER, "unstructured-data"),
+            "EXTRACTED_DATA_FOLDER": os.path.join(BACKEND_FOLDER, "data-extracted"),
+            "VECTOR_INDEX_FOLDER": os.getenv("VECTOR_INDEX_PATH", os.path.join(BACKEND_FOLDER, "vector-index")),
+            # Índice BM25: por defecto dentro del vectorial (ver lexical_index_folder)
+            "LEXICAL_INDEX_FOLDER": os.getenv("LEXICAL_INDEX_PATH"),
+            # Formato de los embeddings del índice local: int8, float16 o float32
+            "EMBEDDING_STORE_DTYPE": os.getenv("EMBEDDING_STORE_DTYPE", "int8").strip().lower(),
+            
+            # Extracción concurrente
+            "EXTRACTION_MAX_WORKERS": os.getenv("EXTRACTION_MAX_WORKERS", "4"),
+            "EXTRACTION_PAGES_PER_RANGE": os.getenv("EXTRACTION_PAGES_PER_RANGE", "20")
         }
         
         # Validación de variables requeridas
@@ -73,7 +135,10 @@ class DocumentProcessor:
             "FORM_RECOGNIZER_KEY",
             "SEARCH_ENDPOINT",
             "SEARCH_KEY",
-            "SEARCH_INDEX_NAME"
+            "SEARCH_INDEX_NAME",
+            "OPENAI_API_KEY",
+            "OPENAI_API_BASE",
+            "EMBEDDING_MODEL_NAME"
         ]
         
         missing_vars = [var for var in required_vars if not config[var]]
@@ -82,22 +147,52 @@ class DocumentProcessor:
             
         return config
 
-    def extract_single_file(self, file_path: str) -> dict:
+    def extract_single_file(self, file_path: str, pages: Optional[str] = None) -> dict:
         """
-        Extrae el contenido de un único archivo
+        Extrae el contenido de un único archivo (o solo del rango de páginas
+        indicado, p.ej. "1-20")
         """
         try:
             with open(file_path, "rb") as f:
-                poller = self.doc_client.begin_analyze_document(
-                    "prebuilt-layout", 
-                    document=f
-                )
-            result = poller.result()
-            return self.get_page_content(file_path, result)
+                document = f.read()
+            return self.get_page_content(file_path, self._analyze(document, pages))
         except Exception as e:
             print(f"Error extracting file {file_path}: {str(e)}")
             raise
 
+    def _analyze(self, document: bytes, pages: Optional[str] = None):
+        """
+        Lanza el análisis de layout y espera su resultado
+        """
+        kwargs = {"pages": pages} if pages else {}
+        with stage("ingest.extract"):
+            poller = self.doc_client.begin_analyze_document("prebuilt-layout", document=document, **kwargs)
+            return poller.result()
+
+    @staticmethod
+    def count_pdf_pages(document: bytes) -> int:
+        """
+        Cuenta aproximada de páginas de un PDF: objetos /Type /Page distintos
+        (las actualizaciones incrementales repiten el mismo número de objeto).
+        Devuelve 0 si no se puede determinar, p.ej. con object streams comprimidos
+        """
+        return len(set(re.findall(
+            rb"(\d+)\s+\d+\s+obj\s*<<(?:(?!endobj).){0,2000}?/Type\s*/Page(?![a-zA-Z])",
+            document,
+            re.S
+        )))
+
+    def page_ranges(self, file: str, document: bytes) -> List[Optional[str]]:
+        """
+        Divide un PDF grande en rangos de páginas que se analizan en paralelo;
+        el resto de ficheros se analiza entero ([None])
+        """
+        size = self.extraction_pages_per_range
+        page_count = self.count_pdf_pages(document) if file.upper().endswith('.PDF') else 0
+        if size <= 0 or page_count <= size:
+            return [None]
+        return [f"{start}-{min(start + size - 1, page_count)}" for start in range(1, page_count + 1, size)]
+
     def get_page_content(self, file_name: str, result) -> dict:
         """
         Obtiene el contenido de las páginas del resultado del análisis
@@ -116,49 +211,329 @@ class DocumentProcessor:
             'content': page_content
         }
 
-    def extract_files(self) -> None:
+    def source_files(self) -> List[str]:
+        """
+        Ficheros de raw_data que se pueden extraer
+        """
+        return sorted(
+            file for file in os.listdir(self.raw_data_folder)
+            if file.upper().endswith(('.PDF', '.JPG', '.PNG'))
+        )
+
+    def output_file(self, file: str) -> str:
+        """
+        Ruta del fichero extraído (JSON Lines) para un fichero de raw_data
+        """
+        return os.path.join(self.extracted_data_folder, f"{file.rsplit('.', 1)[0]}{EXTRACTED_EXTENSION}")
+
+    def extracted_paths(self) -> List[str]:
         """
-        Extrae contenido de todos los archivos en la carpeta raw_data
+        Ficheros extraídos de data-extracted, ordenados (sin el manifiesto)
         """
-        for file in os.listdir(self.raw_data_folder):
-            if file.upper().endswith(('.PDF', '.JPG', '.PNG')):
-                print('Processing file:', file, end='')
-                
+        return extracted_paths(self.extracted_data_folder, exclude=(os.path.basename(self.manifest_path),))
+
+    def _carry_over_embeddings(self, output_file: str, page_content: dict) -> None:
+        """
+        Reutiliza los embeddings de la extracción anterior (en cualquiera de
+        los dos formatos) para las páginas cuyo texto no ha cambiado
+        """
+        legacy = output_file[:-len(EXTRACTED_EXTENSION)] + LEGACY_EXTENSION
+        previous_file = output_file if os.path.exists(output_file) else legacy
+        if not os.path.exists(previous_file):
+            return
+        try:
+            previous = read_extracted(previous_file)
+        except (OSError, ValueError):
+            return
+        embeddings = {
+            page['page_content']: page['embedding']
+            for page in previous['content'] if page.get('embedding') is not None
+        }
+        for page in page_content['content']:
+            if page['page_content'] in embeddings:
+                page['embedding'] = embeddings[page['page_content']]
+        # Los de los fragmentos se reutilizan por texto en chunk_pages
+        if previous['chunks']:
+            page_content['chunks'] = previous['chunks']
+
+    def extract_files(self, files: Optional[List[str]] = None,
+                      max_workers: Optional[int] = None,
+                      on_extracted: Optional[Callable[[str, Optional[str]], None]] = None) -> Dict[str, List[str]]:
+        """
+        Extrae contenido de los archivos de la carpeta raw_data
+        (todos, o solo los indicados en files).
+
+        Hasta max_workers análisis en vuelo a la vez; los PDF grandes se
+        dividen en rangos de páginas. Los ficheros se leen a medida que hay
+        hueco (no todos de golpe), cada extraído se escribe en cuanto su
+        fichero termina y un fichero con error no detiene el resto.
+        on_extracted(file, ruta o None si falló) se llama al terminar cada
+        fichero. Devuelve {'succeeded': [...], 'failed': [...]}
+        """
+        files = self.source_files() if files is None else list(files)
+        max_workers = max(1, max_workers or self.extraction_max_workers)
+        report = {'succeeded': [], 'failed': []}
+        if not files:
+            return report
+
+        def finish(file: str, output: Optional[str]) -> None:
+            report['succeeded' if output else 'failed'].append(file)
+            if on_extracted is not None:
+                on_extracted(file, output)
+
+        started = time.perf_counter()
+        pending: Dict[str, dict] = {}
+
+        def tasks() -> Iterator[Tuple[str, bytes, Optional[str]]]:
+            for file in files:
                 input_file = os.path.join(self.raw_data_folder, file)
-                page_content = self.extract_single_file(input_file)
-                
-                output_file = os.path.join(self.extracted_data_folder, f"{file.rsplit('.', 1)[0]}.json")
-                print(f'  write output to {output_file}')
-                
-                with open(output_file, "w") as f:
-                    json.dump(page_content, f)
+                try:
+                    with open(input_file, "rb") as f:
+                        document = f.read()
+                except OSError as e:
+                    print(f'Error reading file {file}: {str(e)}')
+                    finish(file, None)
+                    continue
+                ranges = self.page_ranges(file, document)
+                pending[file] = {'remaining': len(ranges), 'pages': [], 'error': None,
+                                 'started': time.perf_counter()}
+                for pages in ranges:
+                    yield file, document, pages
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract") as executor:
+            futures = {}
+            queue = tasks()
+
+            def submit_next() -> None:
+                task = next(queue, None)
+                if task is not None:
+                    file, document, pages = task
+                    futures[executor.submit(self._analyze, document, pages)] = (file, pages)
+
+            # Uno de reserva por hilo: el siguiente análisis sale en cuanto acaba uno
+            for _ in range(2 * max_workers):
+                submit_next()
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file, pages = futures.pop(future)
+                    submit_next()
+                    state = pending[file]
+                    state['remaining'] -= 1
+                    try:
+                        input_file = os.path.join(self.raw_data_folder, file)
+                        state['pages'].extend(self.get_page_content(input_file, future.result())['content'])
+                    except Exception as e:
+                        state['error'] = state['error'] or e
+                        print(f"Error extracting file {file} (pages {pages or 'all'}): {str(e)}")
+
+                    if state['remaining'] > 0:
+                        continue
+
+                    del pending[file]
+                    done_count = len(report['succeeded']) + len(report['failed']) + 1
+                    elapsed = time.perf_counter() - state['started']
+                    if state['error'] is not None:
+                        print(f"[{done_count}/{len(files)}] {file}: failed after {elapsed:.1f}s")
+                        finish(file, None)
+                        continue
+
+                    try:
+                        output = self._write_extracted(file, state['pages'])
+                        print(f"[{done_count}/{len(files)}] {file}: {len(state['pages'])} pages in {elapsed:.1f}s")
+                    except Exception as e:
+                        output = None
+                        print(f"[{done_count}/{len(files)}] {file}: error writing output: {str(e)}")
+                    finish(file, output)
+
+        total = time.perf_counter() - started
+        print(f"Extracted {len(report['succeeded'])} file(s) in {total:.1f}s, "
+              f"{len(report['failed'])} failed")
+        return report
+
+    def _write_extracted(self, file: str, pages: List[dict]) -> str:
+        """
+        Escribe el fichero extraído (JSON Lines, páginas ordenadas)
+        """
+        page_content = {
+            'filename': normalize_path(os.path.join(self.raw_data_folder, file)),
+            'content': sorted(pages, key=lambda page: page['page_number'])
+        }
+        output_file = self.output_file(file)
+        self._carry_over_embeddings(output_file, page_content)
+        return write_extracted(output_file, page_content)
+
+    def get_embedding(self, text: str) -> List[float]:
+        """
+        Obtiene el embedding de un texto con el modelo configurado
+        """
+        with stage("ingest.embed"):
+            return self.embedding_service.get_embedding(text)
+
+    def chunk_pages(self, page_content: dict) -> bool:
+        """
+        Divide las páginas en fragmentos (page_content['chunks']); los
+        fragmentos cuyo texto no cambia conservan su embedding. Devuelve True
+        si los fragmentos cambiaron (y el JSON debe reescribirse)
+        """
+        previous = page_content.get('chunks', [])
+        embeddings = {chunk['text']: chunk['embedding'] for chunk in previous if chunk.get('embedding') is not None}
+        with stage("ingest.chunk"):
+            chunks = self.chunker.chunk_pages(page_content['content'])
+        for chunk in chunks:
+            if chunk['text'] in embeddings:
+                chunk['embedding'] = embeddings[chunk['text']]
+        page_content['chunks'] = chunks
+        return [chunk['text'] for chunk in chunks] != [chunk['text'] for chunk in previous]
+
+    def embed_documents(self, documents: List[dict], units: Dict[str, dict]) -> List[dict]:
+        """
+        Calcula (en lotes) el embedding de los documentos que aún no lo
+        tienen y lo guarda también en su página o fragmento (units, por
+        document_id). Devuelve los documentos actualizados
+        """
+        pending = [document for document in documents if document.get('page_embedding') is None]
+        if not pending:
+            return []
+        with stage("ingest.embed"):
+            embeddings = self.embedding_service.get_embeddings([document['page_text'] for document in pending])
+        for document, embedding in zip(pending, embeddings):
+            document['page_embedding'] = embedding
+            units[document['document_id']]['embedding'] = embedding
+        return pending
+
+    def stream_documents(self, paths: Iterable[str], dedup: Optional[DedupStream] = None,
+                         embed: bool = True, rechunk: bool = True) -> Iterator[dict]:
+        """
+        Registros listos para subir, fichero extraído a fichero extraído. La
+        unidad es el fragmento (o la página con CHUNK_TOKENS=0); los casi
+        duplicados de un registro anterior se descartan (su cita va al
+        canónico, ver DedupStream) antes de calcular embeddings. Los
+        registros que ya tienen embedding salen en cuanto se leen; solo
+        esperan en memoria los que no lo tienen, hasta llenar todos los
+        lotes en paralelo del servicio, y sus ficheros, que se reescriben
+        con los embeddings para no repetirlos (embed=False no calcula ni
+        guarda nada, p.ej. en un dry run). rechunk=False usa los fragmentos
+        guardados, válidos tras una pasada con embed=True
+        """
+        window = self.embedding_service.batch_size * self.embedding_service.max_workers
+        # Registros sin embedding y su página o fragmento (por document_id)
+        waiting: List[dict] = []
+        units: Dict[str, dict] = {}
+        # Ficheros que se reescriben cuando sus registros tengan embedding
+        to_write: List[Tuple[str, dict]] = []
+
+        def store(path: str, page_content: dict) -> None:
+            output = os.path.join(os.path.dirname(path), extracted_stem(path) + EXTRACTED_EXTENSION)
+            write_extracted(output, page_content)
+            print(f'  embeddings stored in {output}')
+
+        def flush() -> Iterator[dict]:
+            self.embed_documents(waiting, units)
+            for path, page_content in to_write:
+                store(path, page_content)
+            ready = list(waiting)
+            waiting.clear()
+            units.clear()
+            to_write.clear()
+            yield from ready
+
+        for path in paths:
+            page_content = read_extracted(path)
+            filename = page_content['filename']
+            base_id = document_base_id(filename)
+            # Los ficheros en el formato anterior se reescriben en JSON Lines
+            changed = path.endswith(LEGACY_EXTENSION)
+            if self.chunker.enabled:
+                if (rechunk or 'chunks' not in page_content) and self.chunk_pages(page_content):
+                    changed = True
+                # Un registro por fragmento; page_number es su página de origen
+                items = [
+                    (f"{chunk['page_number']}-{chunk['chunk_index']}", chunk['page_number'], chunk['text'], chunk)
+                    for chunk in page_content['chunks']
+                ]
+            else:
+                items = [
+                    (str(page['page_number']), page['page_number'], page['page_content'], page)
+                    for page in page_content['content']
+                ]
+
+            missing = False
+            dedup_seconds = 0.0
+            for unit_id, page_number, text, unit in items:
+                document = {
+                    'document_id': f"{base_id}-{unit_id}",
+                    'document_name': source_name(filename),
+                    'file_path': filename,
+                    'page_number': page_number,
+                    'page_text': text,
+                    'page_embedding': unit.get('embedding')
+                }
+                if dedup is not None:
+                    start = time.perf_counter()
+                    document = dedup.add(document)
+                    dedup_seconds += time.perf_counter() - start
+                    if document is None:
+                        continue
+                if embed and document['page_embedding'] is None:
+                    units[document['document_id']] = unit
+                    waiting.append(document)
+                    missing = True
+                else:
+                    yield document
+            if dedup is not None:
+                metrics.record("ingest.dedup", dedup_seconds)
+
+            if embed and missing:
+                to_write.append((path, page_content))
+            elif embed and changed:
+                store(path, page_content)
+            if len(waiting) >= window:
+                yield from flush()
+        if waiting:
+            yield from flush()
 
-    def process_extracted_documents(self) -> List[dict]:
+    def dedup_stream(self) -> Optional[DedupStream]:
+        """Deduplicación de una pasada por el corpus (None con DEDUP_THRESHOLD=0)"""
+        return self.deduplicator.stream() if self.deduplicator.enabled else None
+
+    def scan_extracted(self, embed: bool = True) -> Optional[DedupStream]:
         """
-        Procesa los documentos JSON extraídos y los prepara para subir
+        Primera pasada por los ficheros extraídos: calcula (y guarda) los
+        embeddings que faltan y deduplica, sin retener los registros.
+        Devuelve la deduplicación para extracted_documents (None si está
+        desactivada)
         """
-        documents = []
         try:
-            for file in os.listdir(self.extracted_data_folder):
-                if file.endswith('.json'):
-                    with open(os.path.join(self.extracted_data_folder, file)) as f:
-                        page_content = json.load(f)
-                    
-                    documents.extend([
-                        {
-                            'document_id': f"{page_content['filename'].split('\\')[-1].split('.')[0].replace(' ', '_')}-{page['page_number']}",
-                            'document_name': page_content['filename'].split('/')[-1],
-                            'file_path': page_content['filename'],
-                            'page_number': page['page_number'],
-                            'page_text': page['page_content']
-                        }
-                        for page in page_content['content']
-                    ])
-            return documents
+            dedup = self.dedup_stream()
+            if dedup is None and not embed:
+                return None
+            for _ in self.stream_documents(self.extracted_paths(), dedup=dedup, embed=embed):
+                pass
+            if dedup is not None:
+                print(f"  dedup: {dedup.report.summary()}")
+            return dedup
         except Exception as e:
             print(f"Error processing extracted documents: {str(e)}")
             raise
 
+    def extracted_documents(self, dedup: Optional[DedupStream] = None, rechunk: bool = True) -> Iterator[dict]:
+        """
+        Registros de los ficheros extraídos tal como están en disco, uno a
+        uno (para los índices locales y el manifiesto). Con la deduplicación
+        de una pasada anterior (scan_extracted, stream_ingest) solo salen
+        los canónicos, ya con sus citas definitivas, sin volver a deduplicar
+        (y, con rechunk=False, sin volver a fragmentar)
+        """
+        citations = dedup.citations() if dedup is not None else None
+        for document in self.stream_documents(self.extracted_paths(), embed=False, rechunk=rechunk):
+            if citations is not None:
+                if document['document_id'] not in citations:
+                    continue
+                document['citations'] = citations[document['document_id']]
+            yield document
+
     def create_search_index(self) -> None:
         """
         Crea el índice de búsqueda si no existe
@@ -169,48 +544,309 @@ class DocumentProcessor:
                 SimpleField(name="document_name", type=SearchFieldDataType.String),
                 SimpleField(name="file_path", type=SearchFieldDataType.String),
                 SimpleField(name="page_number", type=SearchFieldDataType.Int32),
-                SearchableField(name="page_text", type=SearchFieldDataType.String)
+                SearchableField(name="page_text", type=SearchFieldDataType.String),
+                SimpleField(
+                    name="citations",
+                    type=SearchFieldDataType.Collection(SearchFieldDataType.String)
+                ),
+                SimpleField(
+                    name="page_embedding",
+                    type=SearchFieldDataType.Collection(SearchFieldDataType.Double)
+                )
             ]
             
             index = SearchIndex(name=self.index_name, fields=fields)
-            self.index_client.create_or_update_index(index)
+            with stage("ingest.create_index"):
+                self.index_client.create_or_update_index(index)
             print(f"Index '{self.index_name}' created or updated successfully")
         except Exception as e:
             print(f"Error creating index: {str(e)}")
             raise
 
-    def upload_to_index(self, documents: List[dict]) -> None:
+    def upload_to_index(self, documents: List[dict], action: str = "upload") -> Dict:
         """
-        Sube documentos al índice de búsqueda
+        Sube documentos al índice de búsqueda en lotes paralelos
+        (action="merge_or_upload" para actualizar los existentes).
+        Devuelve el informe del uploader con las claves correctas y fallidas
         """
         try:
-            result = self.search_client.upload_documents(documents)
-            print(f"Successfully uploaded {len(documents)} documents")
-            return result
+            with stage("ingest.upload"):
+                return self.uploader.upload(documents, action=action)
         except Exception as e:
             print(f"Error uploading documents: {str(e)}")
             raise
 
-    def process_all(self) -> None:
+    def delete_from_index(self, document_ids: List[str]) -> Dict:
+        """
+        Elimina documentos del índice de búsqueda por su clave
+        """
+        try:
+            with stage("ingest.delete"):
+                return self.uploader.upload([{'document_id': doc_id} for doc_id in document_ids], action="delete")
+        except Exception as e:
+            print(f"Error deleting documents: {str(e)}")
+            raise
+
+    def build_local_indexes(self, documents: Iterable[dict], vector: bool = True) -> None:
+        """
+        Construye y guarda los índices locales (vectorial y BM25, o solo
+        BM25 con vector=False) en una sola pasada por documents
+        """
+        vector_builder = VectorIndexBuilder() if vector else None
+        lexical_builder = BM25IndexBuilder()
+        for document in documents:
+            if vector_builder is not None:
+                vector_builder.add(document)
+            lexical_builder.add(document)
+        if vector_builder is not None:
+            self.build_vector_index(vector_builder)
+        self.build_lexical_index(lexical_builder)
+
+    def build_vector_index(self, builder: VectorIndexBuilder) -> VectorIndex:
+        """
+        Construye y guarda el índice vectorial local usado por semantic_search,
+        cuantizado según EMBEDDING_STORE_DTYPE (se informa del recall@10
+        frente a float32)
+        """
+        try:
+            dtype = self.config["EMBEDDING_STORE_DTYPE"]
+            with stage("ingest.vector_index"):
+                vector_index = builder.build()
+                if dtype in STORE_DTYPES:
+                    reference = vector_index
+                    vector_index = QuantizedVectorIndex.from_vector_index(reference, dtype)
+                    vector_index.save(self.vector_index_folder)
+                else:
+                    vector_index.save(self.vector_index_folder)
+            print(f"Vector index with {len(vector_index)} pages saved to {self.vector_index_folder}")
+            if dtype in STORE_DTYPES:
+                report = store_report(reference, vector_index)
+                print(
+                    f"Embedding store: {report['dtype']}, {report['store_bytes'] / 1e6:.2f} MB "
+                    f"(float32: {report['float32_bytes'] / 1e6:.2f} MB), recall@10 {report['recall@10']:.3f}"
+                )
+            return vector_index
+        except Exception as e:
+            print(f"Error building vector index: {str(e)}")
+            raise
+
+    def build_lexical_index(self, builder: BM25IndexBuilder) -> BM25Index:
+        """
+        Construye y guarda el índice BM25 local (candidatos sin llamar a Azure)
+        """
+        try:
+            folder = self.lexical_index_folder
+            with stage("ingest.lexical_index"):
+                lexical_index = builder.build()
+                lexical_index.save(folder)
+            print(f"BM25 index with {len(lexical_index)} pages and {len(lexical_index.terms)} terms saved to {folder}")
+            return lexical_index
+        except Exception as e:
+            print(f"Error building BM25 index: {str(e)}")
+            raise
+
+    @property
+    def lexical_index_folder(self) -> str:
+        """LEXICAL_INDEX_PATH o, si no está definida, la subcarpeta del índice vectorial"""
+        return self.lexical_index_path or os.path.join(self.vector_index_folder, LEXICAL_INDEX_FOLDER)
+
+    def hash_source_files(self) -> Dict[str, str]:
+        """
+        Hash del contenido de cada fichero de raw_data
+        """
+        return {
+            file: file_hash(os.path.join(self.raw_data_folder, file))
+            for file in self.source_files()
+        }
+
+    def process_incremental(self, dry_run: bool = False) -> IngestPlan:
+        """
+        Reindexa solo lo que ha cambiado desde la última ejecución según el
+        manifiesto: extrae ficheros nuevos o modificados, actualiza
+        (merge_or_upload) las páginas cambiadas y borra las de ficheros
+        eliminados. Con dry_run solo informa del trabajo previsto
+        """
+        try:
+            manifest = IngestManifest(self.manifest_path)
+
+            # 1. Ficheros nuevos, modificados o eliminados
+            print("1. Planning incremental ingestion...")
+            source_hashes = self.hash_source_files()
+            plan = manifest.plan_files(source_hashes)
+
+            if dry_run:
+                # Sin extraer: las páginas se comparan con los JSON actuales
+                dedup = self.scan_extracted(embed=False)
+                manifest.plan_pages(self.extracted_documents(dedup), plan)
+                print(f"Dry run: {plan.summary()}")
+                for file in plan.files_to_extract:
+                    print(f"  extract: {file}")
+                for file in plan.removed_files:
+                    print(f"  remove: {file}")
+                return plan
+
+            # 2. Extraer solo los ficheros nuevos o modificados
+            print(f"\n2. Extracting {len(plan.files_to_extract)} changed files...")
+            report = self.extract_files(plan.files_to_extract)
+            # Los ficheros con error no se registran: se reintentan en la próxima ejecución
+            for file in report['succeeded']:
+                manifest.record_file(file, source_hashes[file], os.path.basename(self.output_file(file)))
+            for file in plan.removed_files:
+                output = manifest.forget_file(file)
+                # El manifiesto puede apuntar aún al fichero en el formato anterior
+                for path in {self.output_file(file), os.path.join(self.extracted_data_folder, output or "")}:
+                    if os.path.isfile(path):
+                        os.remove(path)
+
+            # 3. Páginas cambiadas y eliminadas
+            print("\n3. Processing extracted documents...")
+            dedup = self.scan_extracted()
+            manifest.plan_pages(self.extracted_documents(dedup, rechunk=False), plan)
+            print(f"Plan: {plan.summary()}")
+            if not plan.has_changes:
+                # Ni el índice de Azure ni los locales cambian
+                manifest.save()
+                print("\nNothing changed since the last run")
+                return plan
+            self.create_search_index()
+
+            # 4. Actualizar el índice
+            # Solo se registran en el manifiesto las páginas que el índice
+            # confirmó; las fallidas se reintentan en la próxima ejecución
+            uploaded = set()
+            deleted = set()
+            if plan.pages_to_upsert:
+                print("\n4. Upserting changed pages...")
+                uploaded = set(self.upload_to_index(plan.pages_to_upsert, action="merge_or_upload")['succeeded'])
+            if plan.pages_to_delete:
+                print("\n4b. Deleting removed pages...")
+                deleted = set(self.delete_from_index(plan.pages_to_delete)['succeeded'])
+            manifest.record_pages(
+                [doc for doc in plan.pages_to_upsert if doc['document_id'] in uploaded],
+                [doc_id for doc_id in plan.pages_to_delete if doc_id in deleted]
+            )
+
+            # 5. Índice vectorial local y versión (solo si hubo cambios)
+            if plan.pages_to_upsert or plan.pages_to_delete:
+                print("\n5. Building local vector and BM25 indexes...")
+                self.build_local_indexes(self.extracted_documents(dedup, rechunk=False))
+                write_index_version(self.vector_index_folder)
+
+            manifest.save()
+            print("\nIncremental process finished successfully!")
+            return plan
+
+        except Exception as e:
+            print(f"Error in incremental process: {str(e)}")
+            raise
+
+    def stream_ingest(self, dedup: Optional[DedupStream] = None) -> Tuple[Dict[str, List[str]], set]:
+        """
+        Extracción → registros → (fragmentos, deduplicación, embeddings) →
+        subida por lotes, encadenados con generadores. La extracción corre
+        en un hilo aparte y cada fichero extraído entra en la cadena en
+        cuanto termina (en orden de nombre, para que los canónicos de la
+        deduplicación sean siempre los mismos) mientras el uploader sube los
+        lotes anteriores. Un fichero cuya extracción falla se procesa con su
+        extracción anterior, si la hay. Los registros no se retienen: los
+        índices locales se construyen después desde los ficheros extraídos
+        (extracted_documents, con esta misma dedup).
+        Devuelve el informe de extracción y las claves subidas
+        """
+        files = self.source_files()
+        existing = {extracted_stem(path): path for path in self.extracted_paths()}
+        by_stem = {extracted_stem(self.output_file(file)): file for file in files}
+        # Fichero de raw_data -> ruta extraída (None si falló)
+        extracted: Dict[str, Optional[str]] = {}
+        ready = threading.Condition()
+        outcome = {}
+
+        def on_extracted(file: str, output: Optional[str]) -> None:
+            with ready:
+                extracted[file] = output
+                ready.notify_all()
+
+        def extract() -> None:
+            try:
+                outcome['report'] = self.extract_files(files, on_extracted=on_extracted)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                with ready:
+                    for file in files:
+                        extracted.setdefault(file, None)
+                    ready.notify_all()
+
+        def paths() -> Iterator[str]:
+            for stem in sorted(set(existing) | set(by_stem)):
+                file = by_stem.get(stem)
+                if file is not None:
+                    with ready:
+                        ready.wait_for(lambda: file in extracted)
+                    if extracted[file]:
+                        yield extracted[file]
+                        continue
+                if stem in existing and os.path.exists(existing[stem]):
+                    yield existing[stem]
+
+        extraction = threading.Thread(target=extract, daemon=True, name="extract-stream")
+        extraction.start()
+        uploaded = set(self.upload_to_index(self.stream_documents(paths(), dedup=dedup))['succeeded'])
+        extraction.join()
+        if 'error' in outcome:
+            raise outcome['error']
+
+        if dedup is not None:
+            print(f"  dedup: {dedup.report.summary()}")
+            # Citas de casi duplicados que llegaron después de subir su canónico
+            updates = dedup.changed()
+            if updates:
+                merged = set(self.upload_to_index(updates, action="merge_or_upload")['succeeded'])
+                uploaded -= {update['document_id'] for update in updates} - merged
+        return outcome['report'], uploaded
+
+    def process_all(self, incremental: bool = False, dry_run: bool = False) -> None:
         """
         Ejecuta el proceso completo de extracción, procesamiento e indexación
+        (o solo lo que ha cambiado, con incremental=True)
         """
+        if incremental or dry_run:
+            return self.process_incremental(dry_run=dry_run)
+
         try:
-            # 1. Extraer archivos
-            print("1. Extracting files...")
-            self.extract_files()
-            
-            # 2. Crear índice
-            print("\n2. Creating search index...")
+            manifest = IngestManifest(self.manifest_path)
+            source_hashes = self.hash_source_files()
+
+            # 1. Crear índice
+            print("1. Creating search index...")
             self.create_search_index()
+
+            # 2. Extraer, procesar y subir en streaming
+            print("\n2. Extracting, processing and uploading documents...")
+            dedup = self.dedup_stream()
+            report, uploaded = self.stream_ingest(dedup)
+
+            # 3. Índices locales y páginas del manifiesto, en una segunda
+            # pasada por los ficheros extraídos (ya con sus embeddings)
+            print("\n3. Building local vector and BM25 indexes...")
+            manifest.pages = {}
+
+            def record_uploaded(documents: Iterable[dict]) -> Iterator[dict]:
+                for document in documents:
+                    if document['document_id'] in uploaded:
+                        manifest.record_pages([document], [])
+                    yield document
+
+            self.build_local_indexes(record_uploaded(self.extracted_documents(dedup, rechunk=False)))
             
-            # 3. Procesar documentos extraídos
-            print("\n3. Processing extracted documents...")
-            documents = self.process_extracted_documents()
+            # Nueva versión del índice: invalida las cachés de respuestas
+            write_index_version(self.vector_index_folder)
             
-            # 4. Subir al índice
-            print("\n4. Uploading to search index...")
-            self.upload_to_index(documents)
+            # Manifiesto para las siguientes ejecuciones incrementales
+            manifest.files = {}
+            for file in report['succeeded']:
+                manifest.record_file(file, source_hashes[file], os.path.basename(self.output_file(file)))
+            manifest.save()
             
             print("\nComplete process finished successfully!")
             
@@ -219,12 +855,30 @@ class DocumentProcessor:
             raise
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract, process and index documents")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process files and pages that changed since the last run")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report the planned incremental work without changing anything")
+    parser.add_argument("--lexical-only", action="store_true",
+                        help="only rebuild the local BM25 index from the extracted JSON (no Azure calls)")
+    args = parser.parse_args()
+
     try:
         # Crear instancia del procesador
         processor = DocumentProcessor()
         
-        # Ejecutar proceso completo
-        processor.process_all()
+        if args.lexical_only:
+            dedup = processor.scan_extracted(embed=False)
+            processor.build_local_indexes(processor.extracted_documents(dedup), vector=False)
+            write_index_version(processor.vector_index_folder)
+        else:
+            # Ejecutar proceso completo (o incremental)
+            processor.process_all(incremental=args.incremental, dry_run=args.dry_run)
+
+        # Tiempo por etapa (extracción, embeddings, subida...)
+        print("\nStage timings:")
+        print(metrics.summary())
         
     except Exception as e:
         print(f"Error: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Optional, Tuple
+import openai
+from aivolutioncoach.services.shared_cache import SharedEmbeddingCache
+
+
+class EmbeddingService:
+    """
+    Cliente de embeddings con lotes, concurrencia acotada y coalescencia.
+
+    - get_embeddings(texts) divide la entrada en lotes del tamaño que acepta
+      el proveedor y los envía en paralelo (máximo max_workers en vuelo).
+    - Las peticiones idénticas en vuelo se comparten ("single-flight"): si
+      dos usuarios piden el mismo texto a la vez, solo se hace una llamada.
+    - Los 429 se reintentan con backoff, respetando las cabeceras
+      retry-after-ms / retry-after cuando el servicio las envía.
+    - Con cache (SharedEmbeddingCache) los textos ya embebidos, por este o
+      por otro worker, no se vuelven a pedir.
+    """
+
+    RETRYABLE_ERRORS = (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    )
+
+    def __init__(self, client, model: str, batch_size: int = 16, max_workers: int = 4,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 cache: Optional[SharedEmbeddingCache] = None):
+        # Los reintentos los gestiona este servicio, no el SDK
+        self.client = client.with_options(max_retries=0) if hasattr(client, "with_options") else client
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="embeddings"
+        )
+        self._in_flight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, client, model: str) -> "EmbeddingService":
+        """
+        Crea el servicio con los límites definidos en variables de entorno
+        """
+        return cls(
+            client,
+            model,
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "16")),
+            max_workers=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")),
+            max_retries=int(os.getenv("EMBEDDING_MAX_RETRIES", "5")),
+            cache=SharedEmbeddingCache.from_env()
+        )
+
+    def get_embedding(self, text: str, model: Optional[str] = None) -> List[float]:
+        """
+        Obtiene el embedding de un único texto
+        """
+        return self.get_embeddings([text], model=model)[0]
+
+    def get_embeddings(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """
+        Obtiene los embeddings de una lista de textos, en el mismo orden
+        """
+        model = model or self.model
+        futures: Dict[str, Future] = {}
+        to_fetch: List[str] = []
+
+        if self.cache is not None:
+            try:
+                cached = self.cache.get_many(model, list(dict.fromkeys(texts)))
+            except Exception as e:
+                print(f"Error reading the shared embedding cache: {str(e)}")
+                cached = {}
+            for text, embedding in cached.items():
+                futures[text] = Future()
+                futures[text].set_result(embedding)
+
+        with self._lock:
+            for text in texts:
+                if text in futures:
+                    continue
+                key = (model, text)
+                future = self._in_flight.get(key)
+                if future is None:
+                    future = Future()
+                    self._in_flight[key] = future
+                    to_fetch.append(text)
+                futures[text] = future
+
+        for start in range(0, len(to_fetch), self.batch_size):
+            batch = to_fetch[start:start + self.batch_size]
+            self._executor.submit(self._fetch_batch, model, batch)
+
+        return [futures[text].result() for text in texts]
+
+    def _fetch_batch(self, model: str, batch: List[str]) -> None:
+        """
+        Resuelve los futures de un lote (con su resultado o con el error)
+        """
+        try:
+            embeddings = self._create_with_retry(model, batch)
+            if self.cache is not None:
+                try:
+                    self.cache.put_many(model, dict(zip(batch, embeddings)))
+                except Exception as e:
+                    print(f"Error storing embeddings in the shared cache: {str(e)}")
+        except Exception as e:
+            embeddings = None
+            error = e
+        with self._lock:
+            futures = [self._in_flight.pop((model, text)) for text in batch]
+        for i, future in enumerate(futures):
+            if embeddings is None:
+                future.set_exception(error)
+            else:
+                future.set_result(embeddings[i])
+
+    def _create_with_retry(self, model: str, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.embeddings.create(model=model, input=batch)
+                embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+                if len(embeddings) != len(batch):
+                    raise ValueError(
+                        f"Embedding response has {len(embeddings)} vectors for {len(batch)} inputs"
+                    )
+                return embeddings
+            except self.RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                print(f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Espera antes del siguiente intento: la indicada por el servicio si la
+        hay, si no backoff exponencial con jitter
+        """
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return min(self.max_delay, float(retry_after_ms) / 1000)
+            except ValueError:
+                pass
+
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                try:
+                    return min(self.max_delay, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return backoff * random.uniform(0.5, 1.0)
@@ -0,0 +1,203 @@
+import os
+import json
+import struct
+from typing import Dict, List, Optional
+import numpy as np
+from aivolutioncoach.services.vector_index import (
+    VectorIndex, EMBEDDINGS_FILE, RECORDS_FILE, current_generation, new_generation
+)
+
+# Formato binario versionado: cabecera fija, matriz (n x dim) y, en int8,
+# una escala float32 por vector
+STORE_FILE = "embeddings.bin"
+IDS_FILE = "ids.txt"
+RECORD_LINES_FILE = "records.jsonl"
+RECORD_OFFSETS_FILE = "record_offsets.npy"
+
+STORE_MAGIC = b"AIVQEMB\0"
+STORE_VERSION = 1
+_HEADER = struct.Struct("<8sII QQ 32x")  # magic, versión, tipo, filas, dimensión
+HEADER_SIZE = _HEADER.size  # 64 bytes: la matriz queda alineada
+
+STORE_DTYPES = {"int8": 1, "float16": 2}
+_DTYPE_NAMES = {code: name for name, code in STORE_DTYPES.items()}
+
+# Filas por bloque al puntuar: cada bloque se convierte a float32 en un
+# buffer reutilizado que cabe en caché
+SCORE_BLOCK_ROWS = 256
+
+
+class RecordStore:
+    """
+    Metadatos del índice como líneas JSON con sus posiciones en un .npy.
+    Solo se lee y parsea la línea de cada resultado, no el fichero entero.
+    """
+
+    def __init__(self, folder: str):
+        self.path = os.path.join(folder, RECORD_LINES_FILE)
+        self.offsets = np.load(os.path.join(folder, RECORD_OFFSETS_FILE), mmap_mode="r")
+        self._lines = np.memmap(self.path, dtype=np.uint8, mode="r") if len(self) else None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._lines[start:end].tobytes())
+
+    @staticmethod
+    def write(folder: str, records: List[dict]) -> None:
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        with open(os.path.join(folder, RECORD_LINES_FILE), "wb") as f:
+            for row, record in enumerate(records):
+                line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets[row + 1] = offsets[row] + len(line)
+        np.save(os.path.join(folder, RECORD_OFFSETS_FILE), offsets)
+
+
+class QuantizedVectorIndex(VectorIndex):
+    """
+    VectorIndex con los embeddings cuantizados para corpus grandes.
+
+    - int8: cada vector (normalizado) se guarda como round(v / escala) con
+      escala = max|v| / 127; el score es escala * (q · consulta). 4x menos
+      memoria que float32.
+    - float16: 2x menos memoria, prácticamente sin pérdida, pero convertir
+      a float32 al puntuar cuesta más CPU que int8.
+
+    La matriz se mapea desde disco con np.memmap y se puntúa por bloques
+    directamente sobre la forma cuantizada. Al arrancar solo se leen la
+    cabecera y los IDs (una línea por fila, sin JSON); los metadatos de cada
+    resultado se leen bajo demanda de RecordStore.
+    """
+
+    def __init__(self, vectors: np.ndarray, scales: Optional[np.ndarray], document_ids: List[str], records):
+        if len(vectors) != len(document_ids) or len(vectors) != len(records):
+            raise ValueError(
+                f"Vectors ({len(vectors)}), ids ({len(document_ids)}) and records ({len(records)}) differ in length"
+            )
+        self.embeddings = vectors
+        self.scales = scales
+        self.records = records
+        self.document_ids = document_ids
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(document_ids)}
+
+    @property
+    def dtype(self) -> str:
+        return "int8" if self.scales is not None else "float16"
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes de los embeddings (matriz y escalas)"""
+        return int(self.embeddings.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    @staticmethod
+    def quantize(normalized: np.ndarray, dtype: str = "int8"):
+        """
+        Cuantiza una matriz float32 normalizada: devuelve (vectores, escalas),
+        con escalas None en float16
+        """
+        if dtype == "float16":
+            return np.ascontiguousarray(normalized, dtype=np.float16), None
+        if dtype != "int8":
+            raise ValueError(f"Unsupported embedding store dtype: {dtype}")
+        peaks = np.abs(normalized).max(axis=1)
+        scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+        vectors = np.clip(np.rint(normalized / scales[:, None]), -127, 127).astype(np.int8)
+        return np.ascontiguousarray(vectors), scales
+
+    @classmethod
+    def from_vector_index(cls, index: VectorIndex, dtype: str = "int8") -> "QuantizedVectorIndex":
+        vectors, scales = cls.quantize(np.asarray(index.embeddings, dtype=np.float32), dtype)
+        records = [index.records[row] for row in range(len(index))]
+        return cls(vectors, scales, [record['document_id'] for record in records], records)
+
+    def save(self, folder: str) -> None:
+        """
+        Escribe el fichero binario, los IDs y los metadatos como una
+        generación nueva de la carpeta (se publican los tres a la vez)
+        """
+        legacy_files = (STORE_FILE, IDS_FILE, RECORD_LINES_FILE, RECORD_OFFSETS_FILE, EMBEDDINGS_FILE, RECORDS_FILE)
+        with new_generation(folder, legacy_files=legacy_files) as generation:
+            rows, dim = self.embeddings.shape
+            with open(os.path.join(generation, STORE_FILE), "wb") as f:
+                f.write(_HEADER.pack(STORE_MAGIC, STORE_VERSION, STORE_DTYPES[self.dtype], rows, dim))
+                f.write(np.ascontiguousarray(self.embeddings).tobytes())
+                if self.scales is not None:
+                    f.write(np.ascontiguousarray(self.scales, dtype=np.float32).tobytes())
+            with open(os.path.join(generation, IDS_FILE), "w", encoding="utf-8") as f:
+                f.write("\n".join(self.document_ids))
+            RecordStore.write(generation, [self.records[row] for row in range(len(self))])
+
+    @classmethod
+    def load(cls, folder: str, mmap: bool = True) -> "QuantizedVectorIndex":
+        """
+        Mapea la matriz (y las escalas) desde disco; mmap=False las copia en memoria
+        """
+        folder = current_generation(folder)
+        path = os.path.join(folder, STORE_FILE)
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"{path} is truncated")
+        magic, version, code, rows, dim = _HEADER.unpack(header)
+        if magic != STORE_MAGIC:
+            raise ValueError(f"{path} is not an embedding store")
+        if version != STORE_VERSION:
+            raise ValueError(f"Unsupported embedding store version {version} in {path}")
+        dtype = _DTYPE_NAMES.get(code)
+        if dtype is None:
+            raise ValueError(f"Unknown embedding store dtype code {code} in {path}")
+
+        vectors = np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=HEADER_SIZE, shape=(rows, dim))
+        scales = None
+        if dtype == "int8":
+            scales = np.memmap(path, dtype=np.float32, mode="r", offset=HEADER_SIZE + rows * dim, shape=(rows,))
+        if not mmap:
+            vectors = np.array(vectors)
+            scales = np.array(scales) if scales is not None else None
+        with open(os.path.join(folder, IDS_FILE), encoding="utf-8") as f:
+            document_ids = f.read().split("\n") if rows else []
+        return cls(vectors, scales, document_ids, RecordStore(folder))
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is not None:
+            scores = self.embeddings[rows].astype(np.float32) @ query
+            return scores * self.scales[rows] if self.scales is not None else scores
+        scores = np.empty(len(self), dtype=np.float32)
+        block = np.empty((min(SCORE_BLOCK_ROWS, len(self)), self.embeddings.shape[1]), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, len(self))
+            np.copyto(block[:end - start], self.embeddings[start:end], casting="unsafe")
+            scores[start:end] = block[:end - start] @ query
+        return scores * self.scales if self.scales is not None else scores
+
+
+def recall_at_k(reference: VectorIndex, quantized: VectorIndex, k: int = 10,
+                samples: int = 200, seed: int = 0) -> float:
+    """
+    Fracción media de los top-k de la búsqueda float32 que también devuelve
+    la cuantizada, usando como consultas vectores del propio corpus con ruido
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(reference), size=min(samples, len(reference)), replace=False)
+    base = np.asarray(reference.embeddings[rows], dtype=np.float32)
+    queries = VectorIndex.normalize(base + rng.normal(0, 0.5 / np.sqrt(base.shape[1]), base.shape))
+    k = min(k, len(reference))
+    overlap = 0
+    for query in queries:
+        expected = set(VectorIndex._top_k(reference._scores(query), k))
+        overlap += len(expected & set(VectorIndex._top_k(quantized._scores(query), k)))
+    return overlap / (k * len(queries))
+
+
+def store_report(reference: VectorIndex, quantized: QuantizedVectorIndex, k: int = 10) -> Dict:
+    """Memoria de los embeddings y recall@k frente a float32"""
+    return {
+        'dtype': quantized.dtype,
+        'rows': len(quantized),
+        'float32_bytes': int(np.asarray(reference.embeddings).nbytes),
+        'store_bytes': quantized.nbytes,
+        f'recall@{k}': round(recall_at_k(reference, quantized, k=k), 4)
+    }
@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import unicodedata
+from typing import Dict, Iterator, List
+
+# Formato de los ficheros extraídos: JSON Lines, un registro por línea.
+# La primera línea describe el fichero fuente y cada una de las siguientes es
+# una página ('page') o un fragmento ('chunk'), con su embedding si ya se
+# calculó. Se leen y escriben de uno en uno, sin cargar el corpus entero
+EXTRACTED_EXTENSION = ".jsonl"
+EXTRACTED_FORMAT_VERSION = 1
+# Formato anterior (un JSON por fichero): se sigue pudiendo leer
+LEGACY_EXTENSION = ".json"
+
+_UNSAFE_ID_CHARS = re.compile(r"[^A-Za-z0-9_\-=]")
+
+
+def normalize_path(path: str) -> str:
+    """
+    Ruta con '/' como separador, sea cual sea el sistema que la generó
+    (las extracciones hechas en Windows guardaban 'carpeta\\fichero.pdf')
+    """
+    return path.replace("\\", "/")
+
+
+def source_name(path: str) -> str:
+    """Nombre del fichero fuente, sin carpetas"""
+    return normalize_path(path).rsplit("/", 1)[-1]
+
+
+def document_base_id(path: str) -> str:
+    """
+    Prefijo de los document_id de un fichero fuente: su nombre sin
+    extensión, en ASCII y solo con los caracteres que admite una clave de
+    Azure Search (el resto pasa a '_')
+    """
+    stem = source_name(path).rsplit(".", 1)[0]
+    ascii_stem = unicodedata.normalize("NFKD", stem).encode("ascii", "ignore").decode("ascii")
+    return _UNSAFE_ID_CHARS.sub("_", ascii_stem)
+
+
+def extracted_stem(path: str) -> str:
+    name = os.path.basename(path)
+    for extension in (EXTRACTED_EXTENSION, LEGACY_EXTENSION):
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def extracted_paths(folder: str, exclude: tuple = ()) -> List[str]:
+    """
+    Ficheros extraídos de la carpeta, ordenados por nombre; si un fichero
+    está en los dos formatos se usa el JSON Lines
+    """
+    by_stem: Dict[str, str] = {}
+    for name in sorted(os.listdir(folder)):
+        if name in exclude or name.startswith("."):
+            continue
+        if name.endswith(EXTRACTED_EXTENSION) or (name.endswith(LEGACY_EXTENSION) and extracted_stem(name) not in by_stem):
+            by_stem[extracted_stem(name)] = os.path.join(folder, name)
+    return [by_stem[stem] for stem in sorted(by_stem)]
+
+
+def iter_extracted(path: str) -> Iterator[dict]:
+    """
+    Registros de un fichero extraído: primero {'type': 'file', ...} y
+    después las páginas y los fragmentos, línea a línea
+    """
+    if path.endswith(LEGACY_EXTENSION):
+        with open(path) as f:
+            data = json.load(f)
+        yield {'type': 'file', 'version': 0, 'filename': normalize_path(data['filename'])}
+        for page in data.get('content', []):
+            yield dict(page, type='page')
+        for chunk in data.get('chunks', []):
+            yield dict(chunk, type='chunk')
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_extracted(path: str) -> dict:
+    """
+    Un fichero extraído como {'filename', 'content': [páginas], 'chunks': [...]}
+    """
+    page_content = {'filename': None, 'content': [], 'chunks': []}
+    for record in iter_extracted(path):
+        kind = record.pop('type', None)
+        if kind == 'file':
+            if record.get('version', 0) > EXTRACTED_FORMAT_VERSION:
+                raise ValueError(f"Unsupported extracted format version {record['version']} in {path}")
+            page_content['filename'] = normalize_path(record['filename'])
+        elif kind == 'page':
+            page_content['content'].append(record)
+        elif kind == 'chunk':
+            page_content['chunks'].append(record)
+    if page_content['filename'] is None:
+        raise ValueError(f"{path} has no file record")
+    return page_content
+
+
+def write_extracted(path: str, page_content: dict) -> str:
+    """
+    Escribe un fichero extraído (de forma atómica) y elimina su versión
+    en el formato anterior si la había
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        header = {'type': 'file', 'version': EXTRACTED_FORMAT_VERSION,
+                  'filename': normalize_path(page_content['filename'])}
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for kind, records in (('page', page_content.get('content', [])), ('chunk', page_content.get('chunks', []))):
+            for record in records:
+                f.write(json.dumps(dict(record, type=kind), ensure_ascii=False) + "\n")
+    os.replace(temporary, path)
+    legacy = os.path.join(os.path.dirname(path), extracted_stem(path) + LEGACY_EXTENSION)
+    if path.endswith(EXTRACTED_EXTENSION) and os.path.exists(legacy):
+        os.remove(legacy)
+    return path
+
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional
+
+MANIFEST_FILE = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """
+    SHA-256 del contenido de un fichero, leído por bloques
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_hash(document: dict) -> str:
+    """
+    SHA-256 de los campos indexados de una página (sin el embedding, que se
+    deriva del texto)
+    """
+    payload = json.dumps(
+        [document['document_name'], document['file_path'], document['page_number'], document['page_text'],
+         document.get('citations', [])],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IngestPlan:
+    files_to_extract: List[str] = field(default_factory=list)
+    removed_files: List[str] = field(default_factory=list)
+    pages_to_upsert: List[dict] = field(default_factory=list)
+    pages_to_delete: List[str] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.files_to_extract or self.removed_files or self.pages_to_upsert or self.pages_to_delete)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.files_to_extract)} file(s) to extract, "
+            f"{len(self.removed_files)} removed file(s), "
+            f"{len(self.pages_to_upsert)} page(s) to upsert, "
+            f"{len(self.pages_to_delete)} page(s) to delete"
+        )
+
+
+class IngestManifest:
+    """
+    Registro de lo ya ingerido: hash de cada fichero fuente (y su JSON
+    extraído) y hash de cada página subida al índice. Permite reprocesar
+    solo lo que ha cambiado desde la última ejecución.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, str]] = {}
+        self.pages: Dict[str, str] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            print(f"Ignoring manifest {self.path} with unsupported version {data.get('version')}")
+            return
+        self.files = data.get("files", {})
+        self.pages = data.get("pages", {})
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files, "pages": self.pages}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def plan_files(self, source_hashes: Dict[str, str]) -> IngestPlan:
+        """
+        Compara los hashes actuales de los ficheros fuente con el manifiesto
+        """
+        plan = IngestPlan()
+        for name, digest in sorted(source_hashes.items()):
+            entry = self.files.get(name)
+            if entry is None or entry.get("sha256") != digest:
+                plan.files_to_extract.append(name)
+        plan.removed_files = sorted(set(self.files) - set(source_hashes))
+        return plan
+
+    def plan_pages(self, documents: List[dict], plan: Optional[IngestPlan] = None) -> IngestPlan:
+        """
+        Añade al plan las páginas nuevas/cambiadas y las que ya no existen
+        """
+        plan = plan or IngestPlan()
+        current_ids = set()
+        for document in documents:
+            current_ids.add(document['document_id'])
+            if self.pages.get(document['document_id']) != page_hash(document):
+                plan.pages_to_upsert.append(document)
+        plan.pages_to_delete = sorted(set(self.pages) - current_ids)
+        return plan
+
+    def record_file(self, name: str, digest: str, output: str) -> None:
+        self.files[name] = {"sha256": digest, "output": output}
+
+    def forget_file(self, name: str) -> Optional[str]:
+        """
+        Elimina un fichero fuente del manifiesto; devuelve su JSON extraído
+        """
+        entry = self.files.pop(name, None)
+        return entry.get("output") if entry else None
+
+    def record_pages(self, documents: List[dict], deleted_ids: List[str]) -> None:
+        for document in documents:
+            self.pages[document['document_id']] = page_hash(document)
+        for document_id in deleted_ids:
+            self.pages.pop(document_id, None)
@@ -0,0 +1,239 @@
+import os
+import time
+import bisect
+import threading
+import contextvars
+from typing import Dict, List, Sequence, Tuple
+
+# METRICS_ENABLED=false deja stage() como un no-op y no instala el endpoint
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+
+# Tiempos por etapa de la petición en curso (para la cabecera Server-Timing)
+_timings: contextvars.ContextVar = contextvars.ContextVar("stage_timings", default=None)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+                    for labels, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [cuentas por bucket (no acumuladas)..., +Inf], suma
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """Número de observaciones y suma por etiquetas"""
+        with self._lock:
+            return {labels: (sum(counts), total) for labels, (counts, total) in self._series.items()}
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_text = _format_labels(self.label_names + ("le",), labels + (le,))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "aivolution_stage_seconds", "Latency of each pipeline stage in seconds", ("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    "aivolution_request_seconds", "HTTP request latency in seconds (until the response is returned)",
+    ("endpoint", "method", "status")
+)
+TOKENS = Counter("aivolution_tokens_total", "Tokens sent to and received from the chat model", ("kind",))
+ERRORS = Counter("aivolution_stage_errors_total", "Stages that ended with an exception", ("stage",))
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _observe(self.name, time.perf_counter() - self.started, exc_type is not None)
+        return False
+
+
+def _observe(name: str, seconds: float, failed: bool = False) -> None:
+    STAGE_SECONDS.observe((name,), seconds)
+    if failed:
+        ERRORS.inc((name,))
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+def stage(name: str):
+    """
+    Context manager que mide una etapa: la registra en el histograma y en
+    la cabecera Server-Timing de la petición en curso
+    """
+    return _Stage(name) if METRICS_ENABLED else _NOOP
+
+
+def record(name: str, seconds: float) -> None:
+    """Registra una etapa medida a mano (p.ej. el tiempo hasta el primer token)"""
+    if METRICS_ENABLED:
+        _observe(name, seconds)
+
+
+def observe_tokens(prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    if METRICS_ENABLED:
+        if prompt_tokens:
+            TOKENS.inc(("prompt",), prompt_tokens)
+        if completion_tokens:
+            TOKENS.inc(("completion",), completion_tokens)
+
+
+def render() -> str:
+    """Todas las métricas en formato de exposición de Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> str:
+    """Resumen legible de las etapas (para los scripts de línea de comandos)"""
+    rows = sorted(STAGE_SECONDS.snapshot().items())
+    return "\n".join(
+        f"{labels[0]:<32} n={count:<6} total={total:8.2f}s avg={total / count * 1000:9.1f}ms"
+        for labels, (count, total) in rows if count
+    )
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Cabecera Server-Timing: duración acumulada por etapa, en ms"""
+    durations: Dict[str, float] = {}
+    for name, elapsed in timings:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    parts = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in durations.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def init_app(app) -> None:
+    """
+    Instala el endpoint /metrics, el histograma de peticiones y la cabecera
+    Server-Timing. No hace nada si las métricas están desactivadas
+    """
+    if not METRICS_ENABLED:
+        return
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timings():
+        g.metrics_started = time.perf_counter()
+        g.metrics_token = _timings.set([])
+
+    @app.after_request
+    def add_server_timing(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        response.headers["Server-Timing"] = server_timing(_timings.get() or [], total)
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe((endpoint, request.method, str(response.status_code)), total)
+        return response
+
+    @app.teardown_request
+    def reset_timings(exc=None):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            try:
+                _timings.reset(token)
+            except ValueError:
+                # El token se creó en otro contexto (p.ej. vista async)
+                _timings.set(None)
+
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
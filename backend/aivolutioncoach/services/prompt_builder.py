@@ -0,0 +1,213 @@
+import os
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Tokens extra que el formato de chat añade por mensaje y por respuesta
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+CONTEXT_TEMPLATE = """
+As AIvolution Coach, use the following information to provide a helpful response:
+
+User Query: ```{query}```
+Context Information: ```{context}```
+Sources: ```{sources}```
+
+Requirements:
+1. Provide a clear and empathetic response
+2. Include specific recommendations if applicable
+3. Cite sources when possible
+4. Keep the response concise and concise
+5. Use a motivating tone
+6. Reference previous conversation when relevant
+"""
+
+# tiktoken es opcional: sin él (o sin acceso a su fichero BPE) se usa una
+# estimación de ~4 caracteres por token. Se importa en el primer uso
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except ImportError:
+                    pass
+                except Exception as e:
+                    print(f"tiktoken encoding unavailable, estimating tokens: {str(e)}")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Cuenta los tokens de un texto localmente
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Recorta un texto a como máximo max_tokens tokens
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """
+    Tokens de una lista de mensajes de chat, incluyendo el formato
+    """
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m["content"]) for m in messages) + TOKENS_PER_REPLY
+
+
+@dataclass
+class PromptBuild:
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    max_tokens: int
+    history_messages: int = 0
+    context_chunks: int = 0
+    sources: List[str] = field(default_factory=list)
+
+
+class PromptBuilder:
+    """
+    Monta los mensajes de chat dentro de un presupuesto de tokens.
+
+    El presupuesto de entrada se reparte entre el system prompt (fijo), el
+    histórico (como mucho history_share del resto, empezando por los
+    mensajes más recientes) y los fragmentos recuperados (por orden de
+    relevancia, recortando el último que no cabe entero). El histórico se
+    envía solo como mensajes, nunca repetido dentro del prompt.
+    """
+
+    def __init__(self, max_input_tokens: int = 4000, max_output_tokens: int = 1000,
+                 history_share: float = 0.3, min_chunk_tokens: int = 50):
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.history_share = history_share
+        self.min_chunk_tokens = min_chunk_tokens
+
+    @classmethod
+    def from_env(cls) -> "PromptBuilder":
+        """
+        Crea el builder con los presupuestos de las variables de entorno
+        """
+        return cls(
+            max_input_tokens=int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "4000")),
+            max_output_tokens=int(os.getenv("PROMPT_MAX_OUTPUT_TOKENS", "1000")),
+            history_share=float(os.getenv("PROMPT_HISTORY_SHARE", "0.3"))
+        )
+
+    @staticmethod
+    def _fit_history(history: List[dict], budget: int):
+        """
+        Los mensajes más recientes del histórico que caben en budget tokens
+        """
+        kept = []
+        used = 0
+        for message in reversed(history):
+            tokens = TOKENS_PER_MESSAGE + count_tokens(message["content"])
+            if used + tokens > budget:
+                break
+            kept.append(message)
+            used += tokens
+        kept.reverse()
+        return kept, used
+
+    @staticmethod
+    def source_label(result: dict) -> str:
+        """
+        Fuente para citar: documento y página de origen del fragmento, o
+        todas sus citas si es el registro canónico de varios casi duplicados
+        """
+        if result.get("citations"):
+            return "; ".join(result["citations"])
+        page_number = result.get("page_number")
+        return f"{result['document_name']} (p. {page_number})" if page_number else result["document_name"]
+
+    def build(self, system_prompt: str, query: str, search_results: Optional[List[dict]] = None,
+              history: Optional[List[dict]] = None) -> PromptBuild:
+        """
+        Construye los mensajes para una consulta con su contexto recuperado
+        """
+        search_results = search_results or []
+        history = history or []
+
+        system_message = {"role": "system", "content": system_prompt}
+        empty_prompt = CONTEXT_TEMPLATE.format(query=query, context=[], sources=[])
+        fixed_tokens = count_message_tokens([system_message, {"role": "user", "content": empty_prompt}])
+        available = max(0, self.max_input_tokens - fixed_tokens)
+
+        # 1. Histórico: los mensajes más recientes que quepan en su parte
+        kept_history, history_tokens = self._fit_history(history, int(available * self.history_share))
+
+        # 2. Contexto: fragmentos por relevancia con el presupuesto restante
+        context_budget = available - history_tokens
+        ranked = sorted(search_results, key=lambda r: r.get("score", 0), reverse=True)
+        chunks = []
+        sources = []
+        for result in ranked:
+            # Cada fragmento y su fuente se serializan como elementos de lista
+            source = self.source_label(result)
+            source_tokens = count_tokens(repr(source)) + 2
+            text_tokens = count_tokens(result["page_text"])
+            remaining = context_budget - source_tokens - 2
+            if remaining < min(text_tokens, self.min_chunk_tokens):
+                break
+            text = result["page_text"] if text_tokens <= remaining else truncate_to_tokens(result["page_text"], remaining)
+            chunks.append(text)
+            sources.append(source)
+            context_budget -= source_tokens + 2 + min(text_tokens, remaining)
+
+        user_prompt = CONTEXT_TEMPLATE.format(query=query, context=chunks, sources=sources)
+        messages = [system_message, *kept_history, {"role": "user", "content": user_prompt}]
+        return PromptBuild(
+            messages=messages,
+            prompt_tokens=count_message_tokens(messages),
+            max_tokens=self.max_output_tokens,
+            history_messages=len(kept_history),
+            context_chunks=len(chunks),
+            sources=sources
+        )
+
+    def build_chat(self, system_prompt: str, prompt: str,
+                   history: Optional[List[dict]] = None) -> PromptBuild:
+        """
+        Construye los mensajes para un prompt libre (sin contexto recuperado),
+        recortando el histórico para no superar el presupuesto
+        """
+        system_message = {"role": "system", "content": system_prompt}
+        user_message = {"role": "user", "content": prompt}
+        available = max(0, self.max_input_tokens - count_message_tokens([system_message, user_message]))
+
+        kept_history, _ = self._fit_history(history or [], available)
+
+        messages = [system_message, *kept_history, user_message]
+        return PromptBuild(
+            messages=messages,
+            prompt_tokens=count_message_tokens(messages),
+            max_tokens=self.max_output_tokens,
+            history_messages=len(kept_history)
+        )
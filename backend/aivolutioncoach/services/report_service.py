@@ -0,0 +1,370 @@
+import os
+import re
+import json
+import time
+import uuid
+import hmac
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional
+from aivolutioncoach.services.admission import AdmissionRejected
+from aivolutioncoach.services.metrics import stage
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def session_owner(session_id: str) -> str:
+    """
+    Dueño de un trabajo tal como se guarda en disco: el hash de la sesión,
+    no la sesión, que es la credencial del chat
+    """
+    return hashlib.sha256((session_id or "").encode("utf-8")).hexdigest()
+
+REPORT_SYSTEM_PROMPT = """You are AIvolution Coach writing a follow-up report for a person with
+disabilities who is looking for work. Be accurate, concise and supportive, use only the
+information provided and do not give medical advice."""
+
+DOCUMENT_PROMPT = """Summarize what the following excerpts from "{document}" say that is relevant
+to these questions from the user: {questions}
+
+Excerpts:
+{excerpts}
+
+Answer in at most 5 bullet points."""
+
+CONVERSATION_PROMPT = """Summarize this conversation between the user and the coach in one short
+paragraph: what the user needs and what was recommended.
+
+{conversation}"""
+
+FINAL_PROMPT = """Write the user's report with these sections: Summary, Key recommendations,
+Next steps and Sources. Cite each source as it is named below.
+
+Conversation summary:
+{conversation}
+
+Documents consulted:
+{documents}"""
+
+
+@dataclass
+class ReportJob:
+    id: str
+    key: str
+    session_id: str
+    status: str = QUEUED
+    progress: float = 0.0
+    step: str = "queued"
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Estado público del trabajo (sin su clave ni su sesión)"""
+        data = asdict(self)
+        data.pop("key")
+        data.pop("session_id")
+        return data
+
+
+class ReportService:
+    """
+    Generación de informes en segundo plano.
+
+    - submit() devuelve al momento el trabajo; lo ejecuta un pool de como
+      mucho max_workers hilos propio, así que no ocupa hilos ni huecos de
+      /chat. Con más de max_pending trabajos sin terminar se rechaza (503).
+    - Una petición idéntica (misma sesión, mismo histórico y opciones) a
+      otra pendiente o ya terminada devuelve ese mismo trabajo.
+    - Antes de cada llamada al modelo el trabajo espera mientras el control
+      de admisión de /chat (yield_to) esté lleno, para no competir con el
+      tráfico interactivo.
+    - Los resultados se guardan en disco y se eliminan pasados ttl_seconds.
+      El estado de cada trabajo también se publica en disco, así que con
+      varios workers cualquiera puede responder a la consulta de progreso.
+    """
+
+    def __init__(self, coach_getter: Callable, folder: str, max_workers: int = 2, max_pending: int = 32,
+                 ttl_seconds: float = 86400, max_documents: int = 5, yield_to=None,
+                 max_yield_seconds: float = 30.0):
+        self.coach_getter = coach_getter
+        self.folder = folder
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+        self.yield_to = yield_to
+        self.max_yield_seconds = max_yield_seconds
+        self._jobs: Dict[str, ReportJob] = {}
+        self._by_key: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._last_eviction = 0.0
+
+    @classmethod
+    def from_env(cls, coach_getter: Callable, default_folder: str, yield_to=None) -> "ReportService":
+        """
+        Lee REPORT_DIR, REPORT_MAX_WORKERS, REPORT_MAX_PENDING,
+        REPORT_TTL_SECONDS y REPORT_MAX_DOCUMENTS
+        """
+        return cls(
+            coach_getter,
+            folder=os.getenv("REPORT_DIR", default_folder),
+            max_workers=int(os.getenv("REPORT_MAX_WORKERS", "2")),
+            max_pending=int(os.getenv("REPORT_MAX_PENDING", "32")),
+            ttl_seconds=float(os.getenv("REPORT_TTL_SECONDS", "86400")),
+            max_documents=int(os.getenv("REPORT_MAX_DOCUMENTS", "5")),
+            yield_to=yield_to
+        )
+
+    # -----------------------------------------------------------------
+    # API
+    # -----------------------------------------------------------------
+
+    def submit(self, session_id: str, options: Optional[dict] = None) -> ReportJob:
+        """
+        Encola el informe de una sesión y devuelve su trabajo (o el de una
+        petición idéntica que ya existe). Lanza AdmissionRejected si la cola
+        está llena
+        """
+        history = self.coach_getter().get_history(session_id)
+        if not history:
+            raise ValueError("No conversation history for this session")
+        options = dict(options or {})
+        key = hashlib.sha256(
+            json.dumps([session_id, history, options], sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+        self._evict_expired()
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key, ""))
+            if existing is not None and existing.status != FAILED:
+                return existing
+            pending = sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+            if pending >= self.max_pending:
+                raise AdmissionRejected(503, "Server busy, report queue is full", 30)
+            job = ReportJob(id=uuid.uuid4().hex, key=key, session_id=session_id)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            try:
+                self._write(job, job.to_dict(), None)
+            except OSError as e:
+                print(f"Error publishing report {job.id} state: {str(e)}")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="report")
+            self._executor.submit(self._run, job, history, options)
+        return job
+
+    def status(self, job_id: str, session_id: str) -> Optional[dict]:
+        """
+        Estado y progreso de un trabajo de la sesión, o None si no existe, ha
+        caducado o es de otra sesión
+        """
+        self._evict_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.to_dict() if hmac.compare_digest(job.session_id, session_id or "") else None
+        # Trabajo de otro worker o de antes de un reinicio: su estado en disco
+        stored = self._read(job_id, session_id)
+        return stored["job"] if stored else None
+
+    def result(self, job_id: str, session_id: str) -> Optional[dict]:
+        """Informe de un trabajo terminado de la sesión, o None si no está disponible"""
+        stored = self._read(job_id, session_id)
+        return stored.get("result") if stored else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {"max_workers": self.max_workers, "max_pending": self.max_pending, "jobs": counts}
+
+    # -----------------------------------------------------------------
+    # Ejecución
+    # -----------------------------------------------------------------
+
+    def _progress(self, job: ReportJob, progress: float, step: str) -> None:
+        with self._lock:
+            job.progress = round(min(progress, 1.0), 3)
+            job.step = step
+        self._publish(job)
+
+    def _publish(self, job: ReportJob) -> None:
+        """Estado del trabajo en disco (sin resultado) para los demás procesos"""
+        with self._lock:
+            state = job.to_dict()
+        if state["status"] == DONE:
+            return
+        try:
+            self._write(job, state, None)
+        except OSError as e:
+            print(f"Error publishing report {job.id} state: {str(e)}")
+
+    def _yield_to_interactive(self) -> None:
+        """Espera (como mucho max_yield_seconds) mientras /chat esté saturado"""
+        if self.yield_to is None:
+            return
+        deadline = time.monotonic() + self.max_yield_seconds
+        while self.yield_to.busy() and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def _run(self, job: ReportJob, history: List[dict], options: dict) -> None:
+        with self._lock:
+            job.status = RUNNING
+            job.started = time.time()
+        self._publish(job)
+        try:
+            with stage("report.job"):
+                result = self._generate(job, history, options)
+            # El resultado se escribe antes de marcar el trabajo como terminado
+            finished = time.time()
+            with self._lock:
+                stored_job = dict(job.to_dict(), status=DONE, progress=1.0, step="done", finished=finished)
+            self._write(job, stored_job, result)
+            with self._lock:
+                job.status = DONE
+                job.progress = 1.0
+                job.step = "done"
+                job.finished = finished
+        except Exception as e:
+            print(f"Error generating report {job.id}: {str(e)}")
+            with self._lock:
+                job.status = FAILED
+                job.error = str(e)
+                job.finished = time.time()
+            self._publish(job)
+
+    def _generate(self, job: ReportJob, history: List[dict], options: dict) -> dict:
+        coach = self.coach_getter()
+        usage = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+        def complete(prompt: str) -> str:
+            self._yield_to_interactive()
+            call_usage = {}
+            answer = coach.complete(REPORT_SYSTEM_PROMPT, prompt, temperature=0.3, usage=call_usage)
+            usage["llm_calls"] += 1
+            usage["prompt_tokens"] += call_usage.get("reported_prompt_tokens", call_usage.get("prompt_tokens", 0))
+            usage["completion_tokens"] += call_usage.get("completion_tokens", 0)
+            return answer
+
+        # 1. Documentos consultados: los que recupera cada pregunta del usuario
+        self._progress(job, 0.05, "searching documents")
+        questions = [message["content"] for message in history if message["role"] == "user"]
+        documents: Dict[str, dict] = {}
+        for question in questions:
+            for hit in coach.semantic_search(question, top_k=3):
+                document = documents.setdefault(
+                    hit["document_name"], {"document_name": hit["document_name"], "score": 0.0, "hits": {}}
+                )
+                document["score"] = max(document["score"], hit.get("score", 0.0))
+                document["hits"].setdefault(hit["document_id"], hit)
+        max_documents = int(options.get("max_documents", self.max_documents))
+        cited = sorted(documents.values(), key=lambda document: -document["score"])[:max_documents]
+
+        # 2. Un resumen por documento, 3. de la conversación y 4. el informe
+        steps = len(cited) + 2
+        summaries = []
+        for i, document in enumerate(cited):
+            self._progress(job, 0.1 + 0.85 * i / steps, f"summarizing {document['document_name']}")
+            hits = sorted(document["hits"].values(), key=lambda hit: hit.get("page_number") or 0)
+            summary = complete(DOCUMENT_PROMPT.format(
+                document=document["document_name"],
+                questions=json.dumps(questions, ensure_ascii=False),
+                excerpts="\n\n".join(f"[p. {hit.get('page_number')}] {hit['page_text']}" for hit in hits)
+            ))
+            summaries.append({
+                "document_name": document["document_name"],
+                "pages": sorted({hit.get("page_number") for hit in hits if hit.get("page_number")}),
+                "summary": summary
+            })
+
+        self._progress(job, 0.1 + 0.85 * len(cited) / steps, "summarizing conversation")
+        conversation = complete(CONVERSATION_PROMPT.format(
+            conversation="\n".join(f"{message['role']}: {message['content']}" for message in history)
+        ))
+
+        self._progress(job, 0.1 + 0.85 * (len(cited) + 1) / steps, "writing report")
+        report = complete(FINAL_PROMPT.format(
+            conversation=conversation,
+            documents="\n\n".join(
+                f"{item['document_name']} (pages {', '.join(map(str, item['pages']))}):\n{item['summary']}"
+                for item in summaries
+            ) or "None"
+        ))
+        return {
+            "report": report,
+            "conversation_summary": conversation,
+            "documents": summaries,
+            "usage": usage
+        }
+
+    # -----------------------------------------------------------------
+    # Disco y caducidad
+    # -----------------------------------------------------------------
+
+    def _path(self, job_id: str) -> Optional[str]:
+        if not _JOB_ID_RE.match(job_id or ""):
+            return None
+        return os.path.join(self.folder, f"{job_id}.json")
+
+    def _write(self, job: ReportJob, state: dict, result: dict) -> None:
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(job.id)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"owner": session_owner(job.session_id), "job": state, "result": result}, f, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def _read(self, job_id: str, session_id: str) -> Optional[dict]:
+        """Trabajo guardado en disco, solo si es de la sesión indicada"""
+        path = self._path(job_id)
+        if path is None:
+            return None
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            with open(path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not hmac.compare_digest(stored.get("owner") or "", session_owner(session_id)):
+            return None
+        return stored
+
+    def _evict_expired(self) -> None:
+        """
+        Elimina (como mucho una vez por minuto) los trabajos terminados y los
+        resultados en disco de hace más de ttl_seconds
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._last_eviction < 60:
+                return
+            self._last_eviction = now
+            expired = [job for job in self._jobs.values()
+                       if job.finished is not None and now - job.finished > self.ttl_seconds]
+            for job in expired:
+                del self._jobs[job.id]
+                if self._by_key.get(job.key) == job.id:
+                    del self._by_key[job.key]
+        try:
+            files = os.listdir(self.folder)
+        except OSError:
+            return
+        for file in files:
+            path = os.path.join(self.folder, file)
+            try:
+                if file.endswith(".json") and now - os.path.getmtime(path) > self.ttl_seconds:
+                    os.remove(path)
+            except OSError:
+                pass
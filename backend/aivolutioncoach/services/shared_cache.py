@@ -0,0 +1,143 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+
+def shared_db_path(env_name: str, filename: str) -> Optional[str]:
+    """
+    Ruta de una base SQLite compartida entre procesos: la de env_name si
+    está definida, si no filename dentro de SHARED_CACHE_DIR (o None si
+    tampoco está definido: la caché queda en memoria del proceso)
+    """
+    path = os.getenv(env_name)
+    if path:
+        return path
+    folder = os.getenv("SHARED_CACHE_DIR")
+    if not folder:
+        return None
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, filename)
+
+
+def open_shared_db(path: str) -> sqlite3.Connection:
+    """
+    Conexión SQLite en modo WAL: varios workers leen mientras uno escribe,
+    y las escrituras concurrentes esperan (busy timeout) en vez de fallar
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class SharedDb:
+    """
+    Conexión perezosa a una base compartida, una por proceso: si el proceso
+    se bifurca (workers de gunicorn) el hijo abre la suya en el primer uso
+    """
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self.schema = schema
+        self.lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexión del proceso actual (llamar con lock adquirido)"""
+        if self._db is None or self._pid != os.getpid():
+            self._db = open_shared_db(self.path)
+            self._db.executescript(self.schema)
+            self._pid = os.getpid()
+        return self._db
+
+
+class SharedEmbeddingCache:
+    """
+    Embeddings ya calculados en SQLite (WAL), compartidos por todos los
+    workers: un texto que ha embebido un worker no se vuelve a pedir en los
+    demás ni tras un reinicio. Acotada a max_entries (se borran las más
+    antiguas) y con TTL.
+    """
+
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, db_path: str, max_entries: int = 50000, ttl_seconds: float = 7 * 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._db = SharedDb(db_path, """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_created ON embeddings (created);
+        """)
+        self._last_purge = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedEmbeddingCache"]:
+        """
+        EMBEDDING_CACHE_DB_PATH (o SHARED_CACHE_DIR/embeddings.db),
+        EMBEDDING_CACHE_MAX_ENTRIES y EMBEDDING_CACHE_TTL_SECONDS; None si no
+        hay ruta o MAX_ENTRIES es 0
+        """
+        path = shared_db_path("EMBEDDING_CACHE_DB_PATH", "embeddings.db")
+        max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+        if not path or max_entries <= 0:
+            return None
+        return cls(path, max_entries=max_entries,
+                   ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 86400))))
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[str, List[float]]:
+        """Embeddings cacheados de los textos que los tienen"""
+        keys = {self.key(model, text): text for text in texts}
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._db.lock:
+            rows = self._db.connection().execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders}) AND created >= ?",
+                (*keys, time.time() - self.ttl_seconds)
+            ).fetchall()
+            self.hits += len(rows)
+            self.misses += len(keys) - len(rows)
+        return {keys[key]: np.frombuffer(vector, dtype=np.float32).tolist() for key, vector in rows}
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (self.key(model, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in items.items()
+        ]
+        with self._db.lock:
+            db = self._db.connection()
+            db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, created) VALUES (?, ?, ?)", rows)
+            if now - self._last_purge > self.PURGE_INTERVAL:
+                self._last_purge = now
+                db.execute("DELETE FROM embeddings WHERE created < ?", (now - self.ttl_seconds,))
+                db.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created DESC "
+                    "LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+            db.commit()
+
+    def stats(self) -> dict:
+        with self._db.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
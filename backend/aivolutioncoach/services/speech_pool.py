@@ -0,0 +1,220 @@
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class SpeechObjectPool:
+    """
+    Pool de objetos del SDK de voz (sintetizadores/reconocedores) ya
+    conectados, para no pagar la conexión y el handshake TLS en cada petición.
+
+    - reusable=True: el objeto vuelve al pool tras usarlo (sintetizadores).
+      Si todos están ocupados se espera hasta checkout_timeout y después se
+      lanza TimeoutError.
+    - reusable=False: cada objeto se usa una sola vez (reconocedores con su
+      push stream); el pool se rellena en segundo plano y, si está vacío, se
+      crea uno al momento.
+
+    Un objeto que falla se descarta y se sustituye por uno nuevo. Antes de
+    prestar uno libre se comprueba que sigue vivo (is_alive, p.ej. que su
+    conexión no se ha cerrado) y que no lleva más de max_idle segundos sin
+    usarse (0: sin límite); si no, se descarta y se pasa al siguiente o se
+    crea uno nuevo, en vez de fallar la petición.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], size: int = 2,
+                 checkout_timeout: float = 5.0, reusable: bool = True,
+                 is_alive: Optional[Callable[[Any], bool]] = None, max_idle: float = 0.0):
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.reusable = reusable
+        self.is_alive = is_alive
+        self.max_idle = max_idle
+        # (objeto, desde cuándo está libre)
+        self._idle = queue.Queue()
+        self._uses: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._total = 0
+        # Métricas
+        self.checkouts = 0
+        self.reused = 0
+        self.created = 0
+        self.recycled = 0
+        self.stale = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self, background: bool = True) -> None:
+        """
+        Crea los objetos del pool (en segundo plano para no bloquear el arranque)
+        """
+        missing = max(0, self.size - self._total)
+        for _ in range(missing):
+            self._refill(background)
+
+    def _create(self):
+        obj = self.factory()
+        with self._lock:
+            self.created += 1
+            self._uses[id(obj)] = 0
+        return obj
+
+    def _reserve(self) -> bool:
+        """Reserva un hueco en el pool si aún no está lleno"""
+        with self._lock:
+            if self._total >= self.size:
+                return False
+            self._total += 1
+            return True
+
+    def _create_reserved(self):
+        try:
+            return self._create()
+        except Exception:
+            with self._lock:
+                self._total -= 1
+            raise
+
+    def _refill(self, background: bool = True) -> None:
+        if not self._reserve():
+            return
+
+        def fill():
+            try:
+                self._idle.put((self._create_reserved(), time.monotonic()))
+            except Exception as e:
+                print(f"Speech pool '{self.name}': could not create object: {e}")
+
+        if background:
+            threading.Thread(target=fill, daemon=True, name=f"{self.name}-fill").start()
+        else:
+            fill()
+
+    def _is_stale(self, obj, idle_since: float) -> bool:
+        if self.max_idle and time.monotonic() - idle_since > self.max_idle:
+            return True
+        if self.is_alive is None:
+            return False
+        try:
+            return not self.is_alive(obj)
+        except Exception:
+            return True
+
+    def _discard_stale(self, obj) -> None:
+        with self._lock:
+            self._uses.pop(id(obj), None)
+            self.stale += 1
+            self._total -= 1
+        # Los reutilizables se reponen al momento en _acquire
+        if not self.reusable:
+            self._refill()
+
+    def _take_idle(self, timeout: Optional[float] = None):
+        """
+        Siguiente objeto libre que sigue vivo (descartando los caducados), o
+        queue.Empty si no hay ninguno
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if deadline is None:
+                obj, idle_since = self._idle.get_nowait()
+            else:
+                obj, idle_since = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+            if not self._is_stale(obj, idle_since):
+                return obj
+            self._discard_stale(obj)
+            if deadline is not None:
+                # El hueco que deja se rellena con uno nuevo en _acquire
+                raise queue.Empty
+
+    def _acquire(self):
+        started = time.perf_counter()
+        pooled = True
+        while True:
+            try:
+                obj = self._take_idle()
+            except queue.Empty:
+                if not self.reusable:
+                    obj = self._create()
+                    pooled = False
+                elif self._reserve():
+                    # Pool sin llenar todavía (o con objetos caducados): crece bajo demanda
+                    obj = self._create_reserved()
+                else:
+                    try:
+                        obj = self._take_idle(timeout=self.checkout_timeout)
+                    except queue.Empty:
+                        if self._total < self.size:
+                            continue
+                        with self._lock:
+                            self.timeouts += 1
+                        raise TimeoutError(
+                            f"No {self.name} available after {self.checkout_timeout}s"
+                        )
+            break
+        waited = time.perf_counter() - started
+
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if self._uses.get(id(obj), 0) > 0:
+                self.reused += 1
+            self._uses[id(obj)] = self._uses.get(id(obj), 0) + 1
+        return obj, pooled
+
+    def _release(self, obj, pooled: bool, healthy: bool) -> None:
+        if self.reusable and healthy:
+            self._idle.put((obj, time.monotonic()))
+            return
+        with self._lock:
+            self._uses.pop(id(obj), None)
+            if not healthy:
+                self.recycled += 1
+            if pooled:
+                self._total -= 1
+        self._refill()
+
+    @contextmanager
+    def checkout(self):
+        """
+        Presta un objeto del pool. Si el bloque lanza una excepción (o marca
+        lease.healthy = False) el objeto se descarta en vez de devolverse
+        """
+        obj, pooled = self._acquire()
+        lease = _Lease(obj)
+        try:
+            yield lease
+        except BaseException:
+            lease.healthy = False
+            raise
+        finally:
+            self._release(obj, pooled, lease.healthy)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "created": self.created,
+                "recycled": self.recycled,
+                "stale": self.stale,
+                "timeouts": self.timeouts,
+                "reuse_rate": self.reused / self.checkouts if self.checkouts else 0.0,
+                "wait_avg_ms": 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+                "wait_max_ms": 1000 * self.wait_max
+            }
+
+
+class _Lease:
+    __slots__ = ("obj", "healthy")
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.healthy = True
@@ -1,42 +1,383 @@
 from dotenv import load_dotenv
 import os
+import queue
+import time
+import struct
+import threading
+from typing import Iterable, Iterator, Optional, List
+from xml.sax.saxutils import escape, quoteattr
 import azure.cognitiveservices.speech as speech_sdk
+from aivolutioncoach.services.audio_cache import DiskAudioCache
+from aivolutioncoach.services.speech_pool import SpeechObjectPool
+from aivolutioncoach.services.metrics import record
+
+# Formatos comprimidos aceptados en streaming (requieren GStreamer en el servidor)
+COMPRESSED_FORMATS = {
+    'ogg': speech_sdk.audio.AudioStreamContainerFormat.OGG_OPUS,
+    'opus': speech_sdk.audio.AudioStreamContainerFormat.OGG_OPUS,
+    'mp3': speech_sdk.audio.AudioStreamContainerFormat.MP3,
+    'flac': speech_sdk.audio.AudioStreamContainerFormat.FLAC,
+    'webm': speech_sdk.audio.AudioStreamContainerFormat.ANY,
+    'any': speech_sdk.audio.AudioStreamContainerFormat.ANY
+}
+
+# Formatos de salida de síntesis: (formato del SDK, mimetype)
+OUTPUT_FORMATS = {
+    'mp3': (speech_sdk.SpeechSynthesisOutputFormat.Audio24Khz48KBitRateMonoMp3, 'audio/mpeg'),
+    'wav': (speech_sdk.SpeechSynthesisOutputFormat.Riff24Khz16BitMonoPcm, 'audio/wav'),
+    'pcm': (speech_sdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm, 'audio/L16; rate=24000'),
+    'ogg': (speech_sdk.SpeechSynthesisOutputFormat.Ogg24Khz16BitMonoOpus, 'audio/ogg'),
+    'webm': (speech_sdk.SpeechSynthesisOutputFormat.Webm24Khz16BitMonoOpus, 'audio/webm')
+}
+DEFAULT_VOICE = "en-GB-RyanNeural"
+DEFAULT_OUTPUT_FORMAT = 'mp3'
+# Formato de los reconocedores precalentados (PCM 16 kHz, 16 bits, mono)
+POOLED_INPUT_FORMAT = (16000, 16, 1)
+# Frases fijas del frontend (saludo e instrucciones) que se sintetizan en
+# el warmup para servirlas desde la caché; TTS_WARM_TEXTS (separadas por
+# '|') las sustituye
+GREETING_TEXTS = [
+    "Are you ready? Please say START or click to begin the session.",
+    "Welcome to your AI Coach Assistant",
+    "Let me know a little more about you",
+    "Tell us about your disability so we can customize your coaching experience",
+    "If you're able to see, please click the buttom. Otherwise, wait until the next step.",
+    "If you're able to speak, please say Hello. Otherwise, wait until the next step."
+]
+
+
+class PooledConnection:
+    """
+    Connection del SDK de un objeto del pool, con su estado según los
+    eventos connected/disconnected. Debe vivir tanto como el objeto: si se
+    libera con la apertura en curso el SDK accede a memoria ya liberada
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dropped = False
+        connection.connected.connect(self._on_connected)
+        connection.disconnected.connect(self._on_disconnected)
+
+    def _on_connected(self, event) -> None:
+        self.dropped = False
+
+    def _on_disconnected(self, event) -> None:
+        self.dropped = True
+
+    def open(self, for_continuous_recognition: bool) -> "PooledConnection":
+        self.connection.open(for_continuous_recognition)
+        return self
+
+
+def _connection_alive(obj) -> bool:
+    """Un objeto del pool sigue vivo si su conexión no se ha cerrado"""
+    return not obj[-1].dropped
 
 class SpeechService:
     def __init__(self):
         load_dotenv()
         ai_key = os.getenv('AZURE_SPEECH_KEY')
         ai_region = os.getenv('AZURE_SPEECH_REGION')
+        self.ai_key = ai_key
+        self.ai_region = ai_region
         self.speech_config = speech_sdk.SpeechConfig(ai_key, ai_region)
+        # Clips sintetizados, cacheados en disco por (texto, voz, formato)
+        self.audio_cache = DiskAudioCache.from_env(
+            os.path.join(os.path.dirname(__file__), '..', '..', 'tts-cache')
+        )
+        # Segundos sin eventos del reconocedor antes de abandonar un stream
+        self.recognition_timeout = float(os.getenv('SPEECH_RECOGNITION_TIMEOUT', '30'))
+        # Milisegundos sin recibir audio del servicio antes de cancelar una síntesis
+        self.synthesis_timeout_ms = os.getenv('SPEECH_SYNTHESIS_TIMEOUT_MS', '10000')
+        # Pools de sintetizadores (uno por formato de salida) y reconocedores ya conectados
+        self.synthesizer_pool_size = int(os.getenv('SPEECH_SYNTHESIZER_POOL_SIZE', '2'))
+        self.pool_checkout_timeout = float(os.getenv('SPEECH_POOL_CHECKOUT_TIMEOUT', '5'))
+        # El servicio cierra las conexiones que llevan un rato sin usarse
+        self.pool_max_idle = float(os.getenv('SPEECH_POOL_MAX_IDLE_SECONDS', '180'))
+        self.synthesizer_pools = {}
+        self._pools_lock = threading.Lock()
+        self.recognizer_pool = SpeechObjectPool(
+            'recognizer', self._create_recognizer,
+            size=int(os.getenv('SPEECH_RECOGNIZER_POOL_SIZE', '2')),
+            reusable=False,
+            is_alive=_connection_alive,
+            max_idle=self.pool_max_idle
+        )
         #print('Ready to use speech service in:', self.speech_config.region)
  
-    def transcribe_command(self):
-        command = ''
-        # Configure speech recognition
-        audio_config = speech_sdk.AudioConfig(use_default_microphone=True)
-        speech_recognizer = speech_sdk.SpeechRecognizer(self.speech_config, audio_config)
-        #print('Speak now...')
-        
-        # Process speech input
-        speech = speech_recognizer.recognize_once_async().get()
-        if speech.reason == speech_sdk.ResultReason.RecognizedSpeech:
-            command = speech.text
-            print(command)
+    def start_pools(self, formats: Optional[List[str]] = None) -> None:
+        """
+        Crea y conecta en segundo plano los sintetizadores de los formatos
+        indicados (SPEECH_POOL_FORMATS) y los reconocedores
+        """
+        if formats is None:
+            formats = [f.strip() for f in os.getenv('SPEECH_POOL_FORMATS', DEFAULT_OUTPUT_FORMAT).split(',') if f.strip()]
+        for audio_format in formats:
+            self._synthesizer_pool(audio_format).start()
+        self.recognizer_pool.start()
+
+    def pool_stats(self) -> dict:
+        stats = {f'synthesizer_{name}': pool.stats() for name, pool in self.synthesizer_pools.items()}
+        stats['recognizer'] = self.recognizer_pool.stats()
+        return stats
+
+    def _synthesizer_pool(self, audio_format: str) -> SpeechObjectPool:
+        with self._pools_lock:
+            pool = self.synthesizer_pools.get(audio_format)
+            if pool is None:
+                pool = SpeechObjectPool(
+                    f'synthesizer-{audio_format}',
+                    lambda: self._create_synthesizer(audio_format),
+                    size=self.synthesizer_pool_size,
+                    checkout_timeout=self.pool_checkout_timeout,
+                    is_alive=_connection_alive,
+                    max_idle=self.pool_max_idle
+                )
+                self.synthesizer_pools[audio_format] = pool
+            return pool
+
+    def _create_synthesizer(self, audio_format: str):
+        # La voz va en el SSML de cada petición, así un sintetizador sirve para todas
+        speech_synthesizer = speech_sdk.SpeechSynthesizer(
+            speech_config=self._synthesis_config(DEFAULT_VOICE, audio_format),
+            audio_config=None
+        )
+        connection = PooledConnection(speech_sdk.Connection.from_speech_synthesizer(speech_synthesizer))
+        return speech_synthesizer, connection.open(False)
+
+    def _create_recognizer(self):
+        sample_rate, bits_per_sample, channels = POOLED_INPUT_FORMAT
+        push_stream = speech_sdk.audio.PushAudioInputStream(speech_sdk.audio.AudioStreamFormat(
+            samples_per_second=sample_rate, bits_per_sample=bits_per_sample, channels=channels
+        ))
+        speech_recognizer = speech_sdk.SpeechRecognizer(
+            self.speech_config, speech_sdk.audio.AudioConfig(stream=push_stream)
+        )
+        connection = PooledConnection(speech_sdk.Connection.from_recognizer(speech_recognizer))
+        return speech_recognizer, push_stream, connection.open(True)
+
+    @staticmethod
+    def _read_wav_header(chunks: Iterator[bytes], first: bytes):
+        """
+        Lee la cabecera RIFF/WAVE del inicio del stream.
+        Devuelve (sample_rate, bits_per_sample, channels, resto de audio)
+        """
+        data = first
+        while b'data' not in data[:65536]:
+            chunk = next(chunks, b'')
+            if not chunk:
+                break
+            data += chunk
+        fmt = data.find(b'fmt ')
+        data_pos = data.find(b'data')
+        if fmt < 0 or data_pos < 0:
+            return None, None, None, data
+        channels, sample_rate = struct.unpack_from('<HI', data, fmt + 10)
+        bits_per_sample, = struct.unpack_from('<H', data, fmt + 22)
+        return sample_rate, bits_per_sample, channels, data[data_pos + 8:]
+
+    @staticmethod
+    def _feed(push_stream, first: bytes, chunks: Iterator[bytes], errors: list):
+        """
+        Copia el audio del cliente al push stream y lo cierra al terminar
+        """
+        try:
+            if first:
+                push_stream.write(first)
+            for chunk in chunks:
+                if chunk:
+                    push_stream.write(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            push_stream.close()
+
+    def transcribe_stream(self, chunks: Iterable[bytes], audio_format: str = 'wav',
+                          sample_rate: int = 16000, timeout: Optional[float] = None) -> Iterator[dict]:
+        """
+        Transcribe audio enviado por el cliente con reconocimiento continuo.
+
+        chunks es un iterable de bytes (p.ej. el cuerpo de una subida
+        chunked). Va devolviendo eventos según llegan: 'partial' (hipótesis
+        parciales), 'final' (cada frase reconocida), y al terminar 'done' con
+        el texto completo o 'error'. Cada llamada usa su propio reconocedor,
+        así que se pueden ejecutar muchas en paralelo.
+        """
+        timeout = timeout or self.recognition_timeout
+        chunks = iter(chunks)
+        first = next(chunks, b'')
+        bits_per_sample, channels = 16, 1
+
+        audio_format = (audio_format or 'wav').lower()
+        compressed = audio_format in COMPRESSED_FORMATS
+        if compressed:
+            stream_format = speech_sdk.audio.AudioStreamFormat(
+                compressed_stream_format=COMPRESSED_FORMATS[audio_format]
+            )
         else:
-            print(speech.reason)
-            if speech.reason == speech_sdk.ResultReason.Canceled:
-                cancellation = speech.cancellation_details
-                print(cancellation.reason)
-                print(cancellation.error_details)
-        return command
-
-    def speak_output(self, text):
-        speaked_text = text
-        # Configure speech synthesis
-        self.speech_config.speech_synthesis_voice_name = "en-GB-RyanNeural"
-        speech_synthesizer = speech_sdk.SpeechSynthesizer(self.speech_config)
-        
-        # Synthesize spoken output
-        speak = speech_synthesizer.speak_text_async(speaked_text).get()
-        if speak.reason != speech_sdk.ResultReason.SynthesizingAudioCompleted:
-            print(speak.reason)
\ No newline at end of file
+            if audio_format == 'wav' and first.startswith(b'RIFF'):
+                header_rate, header_bits, header_channels, first = self._read_wav_header(chunks, first)
+                sample_rate = header_rate or sample_rate
+                bits_per_sample = header_bits or bits_per_sample
+                channels = header_channels or channels
+            stream_format = speech_sdk.audio.AudioStreamFormat(
+                samples_per_second=sample_rate,
+                bits_per_sample=bits_per_sample,
+                channels=channels
+            )
+
+        if not compressed and (sample_rate, bits_per_sample, channels) == POOLED_INPUT_FORMAT:
+            # Reconocedor ya conectado del pool (de un solo uso)
+            with self.recognizer_pool.checkout() as lease:
+                speech_recognizer, push_stream, _ = lease.obj
+                yield from self._recognize(speech_recognizer, push_stream, first, chunks, timeout)
+            return
+
+        push_stream = speech_sdk.audio.PushAudioInputStream(stream_format)
+        audio_config = speech_sdk.audio.AudioConfig(stream=push_stream)
+        speech_recognizer = speech_sdk.SpeechRecognizer(self.speech_config, audio_config)
+        yield from self._recognize(speech_recognizer, push_stream, first, chunks, timeout)
+
+    def _recognize(self, speech_recognizer, push_stream, first: bytes,
+                   chunks: Iterator[bytes], timeout: float) -> Iterator[dict]:
+        events = queue.Queue()
+        speech_recognizer.recognizing.connect(
+            lambda evt: events.put({'type': 'partial', 'text': evt.result.text})
+        )
+        speech_recognizer.recognized.connect(
+            lambda evt: events.put({'type': 'final', 'text': evt.result.text})
+            if evt.result.reason == speech_sdk.ResultReason.RecognizedSpeech else None
+        )
+        speech_recognizer.canceled.connect(lambda evt: events.put({
+            'type': 'canceled',
+            'reason': evt.cancellation_details.reason,
+            'error': evt.cancellation_details.error_details
+        }))
+        speech_recognizer.session_stopped.connect(lambda evt: events.put(None))
+
+        errors = []
+        started = time.perf_counter()
+        first_result = True
+        speech_recognizer.start_continuous_recognition_async().get()
+        feeder = threading.Thread(
+            target=self._feed, args=(push_stream, first, chunks, errors), daemon=True
+        )
+        feeder.start()
+
+        recognized = []
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=timeout)
+                except queue.Empty:
+                    yield {'type': 'error', 'error': f'No recognition events for {timeout}s'}
+                    return
+                if event is None:
+                    break
+                if event['type'] == 'canceled':
+                    # EndOfStream es el final normal al cerrar el push stream
+                    if event['reason'] == speech_sdk.CancellationReason.Error:
+                        print(event['error'])
+                        yield {'type': 'error', 'error': event['error']}
+                        return
+                    continue
+                if first_result:
+                    record('speech.recognize.first_result', time.perf_counter() - started)
+                    first_result = False
+                if event['type'] == 'final':
+                    recognized.append(event['text'])
+                yield event
+
+            if errors:
+                yield {'type': 'error', 'error': str(errors[0])}
+                return
+            yield {'type': 'done', 'text': ' '.join(recognized)}
+        finally:
+            speech_recognizer.stop_continuous_recognition_async().get()
+            record('speech.recognize', time.perf_counter() - started)
+
+    def _synthesis_config(self, voice: str, audio_format: Optional[str] = None):
+        """
+        SpeechConfig propio de cada petición: la voz y el formato no tocan
+        el speech_config compartido
+        """
+        speech_config = speech_sdk.SpeechConfig(self.ai_key, self.ai_region)
+        speech_config.speech_synthesis_voice_name = voice
+        if audio_format:
+            speech_config.set_speech_synthesis_output_format(OUTPUT_FORMATS[audio_format][0])
+        speech_config.set_property_by_name('SpeechSynthesis_FrameTimeoutInterval', self.synthesis_timeout_ms)
+        speech_config.set_property_by_name('SpeechSynthesis_RtfTimeoutThreshold', '3')
+        return speech_config
+
+    def synthesize_stream(self, text: str, voice: Optional[str] = None,
+                          audio_format: Optional[str] = None, chunk_size: int = 16000) -> Iterator[bytes]:
+        """
+        Sintetiza el texto y devuelve el audio en chunks según se genera.
+        Si el clip ya está en la caché se sirve directamente desde disco
+        """
+        voice = voice or DEFAULT_VOICE
+        audio_format = audio_format or DEFAULT_OUTPUT_FORMAT
+        if audio_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported audio format: {audio_format}")
+
+        key = self.audio_cache.key(text, voice, audio_format)
+        cached = self.audio_cache.get(key)
+        if cached:
+            return self.audio_cache.read(cached)
+        return self.audio_cache.write_through(key, self._synthesize_chunks(text, voice, audio_format, chunk_size))
+
+    def is_cached(self, text: str, voice: Optional[str] = None, audio_format: Optional[str] = None) -> bool:
+        key = self.audio_cache.key(text, voice or DEFAULT_VOICE, audio_format or DEFAULT_OUTPUT_FORMAT)
+        return self.audio_cache.get(key) is not None
+
+    @staticmethod
+    def _ssml(text: str, voice: str) -> str:
+        language = '-'.join(voice.split('-')[:2])
+        return (
+            "<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' "
+            f"xml:lang={quoteattr(language)}><voice name={quoteattr(voice)}>{escape(text)}</voice></speak>"
+        )
+
+    def _synthesize_chunks(self, text: str, voice: str, audio_format: str, chunk_size: int) -> Iterator[bytes]:
+        # Sintetizador del pool (audio_config=None: el audio se devuelve al
+        # cliente). Si la síntesis falla o el cliente corta, se descarta
+        started = time.perf_counter()
+        first_audio = True
+        with self._synthesizer_pool(audio_format).checkout() as lease:
+            record('speech.pool_wait', time.perf_counter() - started)
+            speech_synthesizer, _ = lease.obj
+            result = speech_synthesizer.start_speaking_ssml_async(self._ssml(text, voice)).get()
+            if result.reason == speech_sdk.ResultReason.Canceled:
+                details = result.cancellation_details
+                raise RuntimeError(f"Speech synthesis canceled: {details.reason} {details.error_details}")
+
+            audio_stream = speech_sdk.AudioDataStream(result)
+            buffer = bytes(chunk_size)
+            while True:
+                filled = audio_stream.read_data(buffer)
+                if filled == 0:
+                    break
+                if first_audio:
+                    record('speech.synthesize.first_audio', time.perf_counter() - started)
+                    first_audio = False
+                yield buffer[:filled]
+
+            if audio_stream.status == speech_sdk.StreamStatus.Canceled:
+                details = audio_stream.cancellation_details
+                raise RuntimeError(f"Speech synthesis canceled: {details.reason} {details.error_details}")
+            record('speech.synthesize', time.perf_counter() - started)
+
+    def warm_cache(self, texts: Optional[List[str]] = None, voice: Optional[str] = None,
+                   audio_format: Optional[str] = None) -> None:
+        """
+        Sintetiza y cachea frases fijas (por defecto GREETING_TEXTS o
+        TTS_WARM_TEXTS) para servirlas al instante
+        """
+        if texts is None:
+            configured = os.getenv('TTS_WARM_TEXTS')
+            texts = [text.strip() for text in configured.split('|') if text.strip()] if configured else GREETING_TEXTS
+        for text in texts:
+            if not self.is_cached(text, voice, audio_format):
+                for _ in self.synthesize_stream(text, voice, audio_format):
+                    pass
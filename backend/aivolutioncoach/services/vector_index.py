@@ -0,0 +1,253 @@
+import os
+import json
+import uuid
+import shutil
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Dict, Optional, Sequence
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+INDEX_VERSION_FILE = "index_version"
+
+# Cada save escribe todos los ficheros de un índice en una carpeta nueva
+# (generación) y la publica reescribiendo CURRENT con os.replace: quien lee
+# nunca mezcla ficheros de dos generaciones, aunque save se corte a medias
+CURRENT_FILE = "CURRENT"
+GENERATION_PREFIX = "gen-"
+
+
+def current_generation(folder: str) -> str:
+    """
+    Carpeta con los ficheros del índice publicado; la propia carpeta si se
+    guardó antes de que hubiera generaciones
+    """
+    try:
+        with open(os.path.join(folder, CURRENT_FILE)) as f:
+            return os.path.join(folder, f.read().strip())
+    except OSError:
+        return folder
+
+
+@contextmanager
+def new_generation(folder: str, legacy_files: Iterable[str] = ()) -> Iterator[str]:
+    """
+    Carpeta donde escribir una generación nueva del índice; al salir del
+    bloque sin errores pasa a ser la publicada. Se conserva la anterior
+    (algún lector puede estar abriéndola) y se borran las más antiguas y
+    los ficheros sueltos del formato sin generaciones (legacy_files)
+    """
+    os.makedirs(folder, exist_ok=True)
+    name = f"{GENERATION_PREFIX}{uuid.uuid4().hex}"
+    path = os.path.join(folder, name)
+    os.makedirs(path)
+    try:
+        yield path
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+
+    previous = os.path.basename(current_generation(folder))
+    temporary = os.path.join(folder, f"{CURRENT_FILE}.{name}.tmp")
+    with open(temporary, "w") as f:
+        f.write(name)
+    os.replace(temporary, os.path.join(folder, CURRENT_FILE))
+
+    for entry in os.listdir(folder):
+        if entry.startswith(GENERATION_PREFIX) and entry not in (name, previous):
+            shutil.rmtree(os.path.join(folder, entry), ignore_errors=True)
+    for legacy in legacy_files:
+        if os.path.isfile(os.path.join(folder, legacy)):
+            os.remove(os.path.join(folder, legacy))
+
+
+class VectorIndex:
+    """
+    Índice vectorial en memoria sobre las páginas del corpus extraído.
+
+    Los embeddings se guardan en una matriz float32 contigua y normalizada,
+    de forma que la similitud del coseno de una consulta contra todo el
+    corpus es un único producto matriz-vector.
+    """
+
+    def __init__(self, embeddings: np.ndarray, records: List[dict]):
+        if len(embeddings) != len(records):
+            raise ValueError(
+                f"Embeddings ({len(embeddings)}) and records ({len(records)}) differ in length"
+            )
+        self.embeddings = embeddings
+        self.records = records
+        self._row_by_id = {record['document_id']: row for row, record in enumerate(records)}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """
+        Normaliza filas a norma unitaria (los vectores nulos quedan a cero)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(vectors / norms)
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict]) -> "VectorIndex":
+        """
+        Construye el índice a partir de los documentos de
+        DocumentProcessor.extracted_documents (con 'page_embedding')
+        """
+        builder = VectorIndexBuilder()
+        for doc in documents:
+            builder.add(doc)
+        return builder.build()
+
+    def save(self, folder: str) -> None:
+        """
+        Guarda la matriz (.npy) y los metadatos (.json) como una generación
+        nueva de la carpeta indicada
+        """
+        with new_generation(folder, legacy_files=(EMBEDDINGS_FILE, RECORDS_FILE)) as generation:
+            np.save(os.path.join(generation, EMBEDDINGS_FILE), np.ascontiguousarray(self.embeddings))
+            with open(os.path.join(generation, RECORDS_FILE), "w") as f:
+                json.dump(self.records, f)
+
+    @classmethod
+    def load(cls, folder: str, mmap: bool = True) -> "VectorIndex":
+        """
+        Carga un índice guardado; con mmap=True la matriz se mapea desde disco
+        en lugar de copiarse en memoria
+        """
+        folder = current_generation(folder)
+        embeddings = np.load(
+            os.path.join(folder, EMBEDDINGS_FILE),
+            mmap_mode="r" if mmap else None
+        )
+        with open(os.path.join(folder, RECORDS_FILE)) as f:
+            records = json.load(f)
+        return cls(embeddings, records)
+
+    def _query_vector(self, query_embedding: Sequence[float]) -> np.ndarray:
+        return self.normalize(np.asarray(query_embedding, dtype=np.float32))
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        Índices de los top_k mayores scores, ordenados de mayor a menor
+        """
+        if top_k >= len(scores):
+            return np.argsort(-scores)
+        candidates = np.argpartition(-scores, top_k)[:top_k]
+        return candidates[np.argsort(-scores[candidates])]
+
+    def _results(self, rows: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        return [
+            {**self.records[row], 'score': float(score)}
+            for row, score in zip(rows, scores)
+        ]
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Similitud de la consulta (normalizada) con todas las filas o solo
+        con las indicadas
+        """
+        if rows is None:
+            return self.embeddings @ query
+        return self.embeddings[rows] @ query
+
+    def search(self, query_embedding: Sequence[float], top_k: int = 3) -> List[Dict]:
+        """
+        Busca los top_k registros más similares en todo el corpus
+        """
+        scores = self._scores(self._query_vector(query_embedding))
+        best = self._top_k(scores, top_k)
+        return self._results(best, scores[best])
+
+    def rescore(self, query_embedding: Sequence[float], document_ids: List[str],
+                top_k: int = 3) -> List[Dict]:
+        """
+        Modo híbrido: reordena candidatos (p.ej. de Azure Search) usando la
+        misma matriz. Los IDs que no están en el índice se ignoran
+        """
+        rows = np.array(
+            [self._row_by_id[doc_id] for doc_id in document_ids if doc_id in self._row_by_id],
+            dtype=np.intp
+        )
+        if len(rows) == 0:
+            return []
+        scores = self._scores(self._query_vector(query_embedding), rows)
+        best = self._top_k(scores, top_k)
+        return self._results(rows[best], scores[best])
+
+
+class VectorIndexBuilder:
+    """
+    Construye un VectorIndex documento a documento: cada embedding se guarda
+    ya como fila float32, sin retener el documento
+    """
+
+    def __init__(self):
+        self.records: List[dict] = []
+        self._rows: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, doc: dict) -> None:
+        if not doc.get('page_embedding'):
+            return
+        self._rows.append(np.asarray(doc['page_embedding'], dtype=np.float32))
+        self.records.append({
+            'document_id': doc['document_id'],
+            'document_name': doc['document_name'],
+            'page_number': doc['page_number'],
+            'page_text': doc['page_text'],
+            'citations': doc.get('citations', [])
+        })
+
+    def build(self) -> VectorIndex:
+        if not self._rows:
+            raise ValueError("No documents with embeddings to index")
+        return VectorIndex(VectorIndex.normalize(np.stack(self._rows)), self.records)
+
+
+def load_vector_index(folder: str, mmap: bool = True) -> Optional[VectorIndex]:
+    """
+    Carga el índice si existe (el cuantizado de embedding_store si lo
+    hay); devuelve None si aún no se ha construido
+    """
+    from aivolutioncoach.services.embedding_store import QuantizedVectorIndex, STORE_FILE
+    try:
+        generation = current_generation(folder)
+        if os.path.exists(os.path.join(generation, STORE_FILE)):
+            return QuantizedVectorIndex.load(generation)
+        if not os.path.exists(os.path.join(generation, EMBEDDINGS_FILE)):
+            return None
+        return VectorIndex.load(generation, mmap=mmap)
+    except Exception as e:
+        print(f"Error loading vector index from {folder}: {str(e)}")
+        return None
+
+
+def write_index_version(folder: str) -> str:
+    """
+    Marca una nueva versión del índice de documentos (las cachés que
+    dependen de él, como SemanticAnswerCache, se invalidan al verla)
+    """
+    os.makedirs(folder, exist_ok=True)
+    version = uuid.uuid4().hex
+    with open(os.path.join(folder, INDEX_VERSION_FILE), "w") as f:
+        f.write(version)
+    return version
+
+
+def read_index_version(folder: str) -> Optional[str]:
+    """
+    Versión actual del índice de documentos, o None si nunca se ha construido
+    """
+    try:
+        with open(os.path.join(folder, INDEX_VERSION_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
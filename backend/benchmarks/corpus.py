@@ -0,0 +1,86 @@
+"""
+Corpus sintético para los benchmarks, generado a partir de los ficheros
+extraídos de data-extracted: páginas reales barajadas y recombinadas,
+para tener un volumen configurable con el vocabulario y la longitud de
+los documentos de verdad.
+"""
+import os
+import json
+import random
+from typing import List
+
+from aivolutioncoach.services.extracted_store import extracted_paths, read_extracted
+from aivolutioncoach.services.ingest_manifest import MANIFEST_FILE
+from benchmarks.fakes import SYNTHETIC_PDF_HEADER, fake_embedding
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+EXTRACTED_DIR = os.path.join(BACKEND_DIR, "data-extracted")
+
+
+def source_pages() -> List[str]:
+    """Texto de todas las páginas extraídas que tienen contenido"""
+    pages = []
+    for path in extracted_paths(EXTRACTED_DIR, exclude=(MANIFEST_FILE,)):
+        content = read_extracted(path)["content"]
+        pages.extend(page["page_content"] for page in content if page.get("page_content"))
+    return pages
+
+
+def synthetic_documents(count: int, pages_per_document: int = 8, seed: int = 0) -> List[List[str]]:
+    """
+    count documentos de pages_per_document páginas; cada página mezcla
+    frases de dos páginas reales para que no haya duplicados exactos
+    """
+    pages = source_pages()
+    rng = random.Random(seed)
+    documents = []
+    for _ in range(count):
+        document = []
+        for _ in range(pages_per_document):
+            first, second = rng.sample(pages, 2)
+            sentences = first.split(". ") + second.split(". ")
+            rng.shuffle(sentences)
+            document.append(". ".join(sentences[:max(1, len(sentences) // 2)]))
+        documents.append(document)
+    return documents
+
+
+def write_raw_folder(folder: str, documents: List[List[str]]) -> List[str]:
+    """
+    Escribe los documentos como PDF sintéticos (los entiende
+    FakeDocumentAnalysisClient) y devuelve los nombres de fichero
+    """
+    os.makedirs(folder, exist_ok=True)
+    names = []
+    for i, document in enumerate(documents):
+        name = f"synthetic-{i:04d}.pdf"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(SYNTHETIC_PDF_HEADER + json.dumps(document).encode("utf-8"))
+        names.append(name)
+    return names
+
+
+def search_documents(documents: List[List[str]]) -> List[dict]:
+    """Los mismos documentos como registros del índice de búsqueda, con embedding"""
+    records = []
+    for i, document in enumerate(documents):
+        for page_number, text in enumerate(document, start=1):
+            records.append({
+                "document_id": f"synthetic-{i:04d}-{page_number}",
+                "document_name": f"synthetic-{i:04d}.pdf",
+                "page_number": page_number,
+                "page_text": text,
+                "page_embedding": fake_embedding(text)
+            })
+    return records
+
+
+def questions(count: int, seed: int = 0) -> List[str]:
+    """Preguntas de usuario construidas con frases del corpus"""
+    pages = source_pages()
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        sentence = rng.choice(rng.choice(pages).split(". "))
+        result.append(f"What should I know about {' '.join(sentence.split()[:12])}?")
+    return result
@@ -0,0 +1,511 @@
+"""
+Dobles locales de los servicios de Azure para los benchmarks.
+
+Cada doble simula la latencia del servicio (media +- jitter) y puede fallar
+con la probabilidad indicada, lanzando el mismo tipo de error que el SDK
+real para que se ejerciten los reintentos y el aislamiento de fallos.
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import types
+from typing import List, Optional
+
+import httpx
+import numpy as np
+import openai
+import azure.cognitiveservices.speech as speech_sdk
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+
+EMBEDDING_DIM = 256
+SYNTHETIC_PDF_HEADER = b"%PDF-synthetic\n"
+
+
+class Latency:
+    """
+    Latencia simulada: uniforme en mean +- jitter segundos, y un fallo con
+    probabilidad failure_rate
+    """
+
+    def __init__(self, mean: float = 0.05, jitter: float = 0.02, failure_rate: float = 0.0, seed: int = 0):
+        self.mean = mean
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def scaled(self, factor: float) -> "Latency":
+        """Misma configuración con la latencia multiplicada por factor"""
+        latency = Latency(self.mean * factor, self.jitter * factor, self.failure_rate)
+        latency._random = self._random
+        latency._lock = self._lock
+        return latency
+
+    def delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.mean + self._random.uniform(-self.jitter, self.jitter))
+
+    def fails(self) -> bool:
+        if self.failure_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def wait(self) -> None:
+        time.sleep(self.delay())
+
+    async def async_wait(self) -> None:
+        await asyncio.sleep(self.delay())
+
+
+def fake_embedding(text: str) -> List[float]:
+    """Embedding determinista a partir del hash del texto"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32).tolist()
+
+
+def _rate_limit_error() -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://fake.openai.azure.com/openai/deployments/fake")
+    response = httpx.Response(429, headers={"retry-after-ms": "50"}, request=request)
+    return openai.RateLimitError("Injected rate limit", response=response, body=None)
+
+
+# ---------------------------------------------------------------------------
+# Azure OpenAI
+# ---------------------------------------------------------------------------
+
+ANSWER = ("Here are some practical steps for your job search: update your CV, "
+          "ask about reasonable accommodations and practice your interview answers.")
+
+
+def _usage(messages) -> types.SimpleNamespace:
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+    return types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(ANSWER) // 4)
+
+
+def _embedding_response(texts: List[str]):
+    return types.SimpleNamespace(data=[
+        types.SimpleNamespace(embedding=fake_embedding(text), index=i) for i, text in enumerate(texts)
+    ])
+
+
+def _completion_response(messages):
+    message = types.SimpleNamespace(content=ANSWER)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=_usage(messages))
+
+
+def _stream_chunks(token_latency: Latency):
+    # Primero un chunk sin choices, como los filtros de contenido de Azure
+    yield types.SimpleNamespace(choices=[])
+    for word in ANSWER.split(" "):
+        token_latency.wait()
+        delta = types.SimpleNamespace(content=word + " ")
+        yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+
+
+class FakeOpenAI:
+    """AzureOpenAI: embeddings (con 429 inyectados) y chat (con y sin streaming)"""
+
+    def __init__(self, embedding_latency: Latency, chat_latency: Latency):
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.embeddings = types.SimpleNamespace(create=self._embed)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._complete))
+
+    def with_options(self, **kwargs) -> "FakeOpenAI":
+        return self
+
+    def _embed(self, input, model, **kwargs):
+        self.embedding_latency.wait()
+        if self.embedding_latency.fails():
+            raise _rate_limit_error()
+        return _embedding_response(list(input))
+
+    def _complete(self, model, messages, stream=False, **kwargs):
+        if self.chat_latency.fails():
+            raise _rate_limit_error()
+        if stream:
+            self.chat_latency.wait()
+            return _stream_chunks(self.chat_latency.scaled(0.02))
+        self.chat_latency.wait()
+        return _completion_response(messages)
+
+
+class FakeAsyncOpenAI:
+    """AsyncAzureOpenAI"""
+
+    def __init__(self, embedding_latency: Latency, chat_latency: Latency):
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.embeddings = types.SimpleNamespace(create=self._embed)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._complete))
+
+    async def _embed(self, input, model, **kwargs):
+        await self.embedding_latency.async_wait()
+        if self.embedding_latency.fails():
+            raise _rate_limit_error()
+        return _embedding_response(list(input))
+
+    async def _complete(self, model, messages, **kwargs):
+        await self.chat_latency.async_wait()
+        if self.chat_latency.fails():
+            raise _rate_limit_error()
+        return _completion_response(messages)
+
+
+# ---------------------------------------------------------------------------
+# Azure Cognitive Search
+# ---------------------------------------------------------------------------
+
+class FakeSearchClient:
+    """
+    SearchClient sobre un corpus en memoria: búsqueda por coincidencia de
+    términos y subida/borrado con fallos por documento
+    """
+
+    def __init__(self, latency: Latency, documents: Optional[List[dict]] = None, key_field: str = "document_id"):
+        self.latency = latency
+        self.key_field = key_field
+        self.documents = {document[key_field]: document for document in documents or []}
+        self._lock = threading.Lock()
+
+    def _search(self, search_text: str, top: int, select=None) -> List[dict]:
+        if self.latency.fails():
+            raise ServiceRequestError("Injected search failure")
+        terms = set(search_text.lower().split())
+        with self._lock:
+            documents = list(self.documents.values())
+        scored = []
+        for document in documents:
+            words = document.get("page_text", "").lower().split()
+            score = sum(1 for word in words if word in terms)
+            if score:
+                scored.append((score, document))
+        scored.sort(key=lambda item: -item[0])
+        hits = [document for _, document in scored[:top]] or documents[:top]
+        if select:
+            hits = [{field: hit.get(field) for field in select} for hit in hits]
+        return [dict(hit) for hit in hits]
+
+    def search(self, search_text: str, top: int = 10, select=None, **kwargs):
+        self.latency.wait()
+        return iter(self._search(search_text, top, select))
+
+    def _apply(self, documents: List[dict], delete: bool = False):
+        self.latency.wait()
+        if self.latency.fails():
+            raise HttpResponseError(message="Injected batch failure")
+        results = []
+        with self._lock:
+            for document in documents:
+                key = document[self.key_field]
+                if self.latency.fails():
+                    results.append(types.SimpleNamespace(
+                        key=key, succeeded=False, status_code=503, error_message="Injected throttling"
+                    ))
+                    continue
+                if delete:
+                    self.documents.pop(key, None)
+                else:
+                    self.documents[key] = dict(self.documents.get(key, {}), **document)
+                results.append(types.SimpleNamespace(key=key, succeeded=True, status_code=200, error_message=None))
+        return results
+
+    def upload_documents(self, documents):
+        return self._apply(documents)
+
+    def merge_or_upload_documents(self, documents):
+        return self._apply(documents)
+
+    def delete_documents(self, documents):
+        return self._apply(documents, delete=True)
+
+
+class _AsyncResults:
+    def __init__(self, hits: List[dict]):
+        self._hits = hits
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for hit in self._hits:
+            yield hit
+
+
+class FakeAsyncSearchClient:
+    """SearchClient aio sobre el mismo corpus que FakeSearchClient"""
+
+    def __init__(self, sync_client: FakeSearchClient):
+        self.sync_client = sync_client
+
+    async def search(self, search_text: str, top: int = 10, select=None, **kwargs):
+        await self.sync_client.latency.async_wait()
+        return _AsyncResults(self.sync_client._search(search_text, top, select))
+
+
+class FakeSearchIndexClient:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+    def create_or_update_index(self, index):
+        self.latency.wait()
+        return index
+
+
+# ---------------------------------------------------------------------------
+# Form Recognizer (Document Intelligence)
+# ---------------------------------------------------------------------------
+
+class _Word:
+    __slots__ = ("content",)
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _Line:
+    def __init__(self, text: str):
+        self._words = [_Word(word) for word in text.split()]
+
+    def get_words(self):
+        return self._words
+
+
+class _Poller:
+    def __init__(self, result, latency: Latency, error: Optional[Exception]):
+        self._result = result
+        self._latency = latency
+        self._error = error
+
+    def result(self):
+        self._latency.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class FakeDocumentAnalysisClient:
+    """
+    Analiza los PDF sintéticos de corpus.py: tras SYNTHETIC_PDF_HEADER
+    llevan un JSON con el texto de cada página. La latencia es por página
+    """
+
+    def __init__(self, latency_per_page: Latency):
+        self.latency_per_page = latency_per_page
+
+    def begin_analyze_document(self, model_id: str, document: bytes, pages: Optional[str] = None, **kwargs):
+        page_texts = json.loads(document[len(SYNTHETIC_PDF_HEADER):].decode("utf-8"))
+        numbers = range(1, len(page_texts) + 1)
+        if pages:
+            first, last = (int(part) for part in pages.split("-"))
+            numbers = range(first, min(last, len(page_texts)) + 1)
+        result = types.SimpleNamespace(pages=[
+            types.SimpleNamespace(
+                page_number=number,
+                lines=[_Line(sentence) for sentence in page_texts[number - 1].split(". ") if sentence]
+            )
+            for number in numbers
+        ])
+        error = HttpResponseError(message="Injected analysis failure") if self.latency_per_page.fails() else None
+        return _Poller(result, self.latency_per_page.scaled(max(1, len(numbers))), error)
+
+
+# ---------------------------------------------------------------------------
+# Speech SDK
+# ---------------------------------------------------------------------------
+
+class _Signal:
+    def __init__(self):
+        self._callbacks = []
+
+    def connect(self, callback):
+        self._callbacks.append(callback)
+
+    def fire(self, event):
+        for callback in self._callbacks:
+            callback(event)
+
+
+class _Future:
+    def __init__(self, action=None):
+        self._action = action
+
+    def get(self):
+        return self._action() if self._action else None
+
+
+class FakePushAudioInputStream:
+    def __init__(self, stream_format=None):
+        self.bytes_written = 0
+        self.closed = threading.Event()
+        self._written = threading.Condition()
+
+    def write(self, data: bytes) -> None:
+        with self._written:
+            self.bytes_written += len(data)
+            self._written.notify_all()
+
+    def close(self) -> None:
+        self.closed.set()
+        with self._written:
+            self._written.notify_all()
+
+    def wait_for(self, size: int, timeout: float) -> bool:
+        with self._written:
+            return self._written.wait_for(lambda: self.bytes_written >= size or self.closed.is_set(), timeout)
+
+
+class FakeAudioConfig:
+    def __init__(self, stream=None, **kwargs):
+        self.stream = stream
+
+
+class FakeConnection:
+    def __init__(self, owner):
+        self.owner = owner
+        self.connected = _Signal()
+        self.disconnected = _Signal()
+
+    @classmethod
+    def from_speech_synthesizer(cls, synthesizer):
+        return cls(synthesizer)
+
+    @classmethod
+    def from_recognizer(cls, recognizer):
+        return cls(recognizer)
+
+    def open(self, for_continuous_recognition: bool):
+        # Conexión previa: el primer uso ya no paga el handshake
+        self.owner.connected = True
+        self.connected.fire(None)
+
+
+class FakeSpeechRecognizer:
+    """
+    Reconocimiento continuo sobre un push stream: una hipótesis parcial por
+    cada segundo de audio (PCM 16 kHz, 16 bits) y la frase final al cerrar
+    """
+
+    BYTES_PER_SECOND = 32000
+
+    def __init__(self, latency: Latency, speech_config=None, audio_config=None):
+        self.latency = latency
+        self.push_stream = audio_config.stream if audio_config is not None else None
+        self.connected = False
+        self.recognizing = _Signal()
+        self.recognized = _Signal()
+        self.canceled = _Signal()
+        self.session_stopped = _Signal()
+        self._stopped = threading.Event()
+
+    def _run(self):
+        if not self.connected:
+            self.latency.wait()
+        words = []
+        received = 0
+        stream = self.push_stream
+        while not self._stopped.is_set():
+            stream.wait_for(received + self.BYTES_PER_SECOND, timeout=0.1)
+            while stream.bytes_written - received >= self.BYTES_PER_SECOND:
+                received += self.BYTES_PER_SECOND
+                words.append(f"word{len(words)}")
+                self.recognizing.fire(self._event(" ".join(words), speech_sdk.ResultReason.RecognizingSpeech))
+            if stream.closed.is_set():
+                break
+        self.latency.wait()
+        if self.latency.fails():
+            details = types.SimpleNamespace(reason=speech_sdk.CancellationReason.Error,
+                                            error_details="Injected recognition failure")
+            self.canceled.fire(types.SimpleNamespace(cancellation_details=details))
+        else:
+            self.recognized.fire(self._event(" ".join(words) or "silence", speech_sdk.ResultReason.RecognizedSpeech))
+        self.session_stopped.fire(None)
+
+    @staticmethod
+    def _event(text, reason):
+        return types.SimpleNamespace(result=types.SimpleNamespace(text=text, reason=reason))
+
+    def start_continuous_recognition_async(self):
+        return _Future(lambda: threading.Thread(target=self._run, daemon=True).start())
+
+    def stop_continuous_recognition_async(self):
+        return _Future(self._stopped.set)
+
+
+class _SynthesisResult:
+    def __init__(self, audio: bytes, reason, details=None):
+        self.audio = audio
+        self.reason = reason
+        self.cancellation_details = details
+
+
+class FakeSpeechSynthesizer:
+    """
+    Síntesis: tras la latencia inicial (menor si la conexión ya está
+    abierta) devuelve ~4 KB de audio por palabra, entregados en chunks
+    """
+
+    def __init__(self, latency: Latency, speech_config=None, audio_config=None):
+        self.latency = latency
+        self.connected = False
+
+    def start_speaking_ssml_async(self, ssml: str):
+        def speak():
+            (self.latency.scaled(0.5) if self.connected else self.latency).wait()
+            if self.latency.fails():
+                details = types.SimpleNamespace(reason=speech_sdk.CancellationReason.Error,
+                                                error_details="Injected synthesis failure")
+                return _SynthesisResult(b"", speech_sdk.ResultReason.Canceled, details)
+            return _SynthesisResult(b"\x00" * 4096 * len(ssml.split()), speech_sdk.ResultReason.SynthesizingAudioStarted)
+        return _Future(speak)
+
+    def start_speaking_text_async(self, text: str):
+        return self.start_speaking_ssml_async(text)
+
+
+class FakeAudioDataStream:
+    def __init__(self, result: _SynthesisResult, chunk_latency: Latency):
+        self._audio = result.audio
+        self._position = 0
+        self._chunk_latency = chunk_latency
+        self.status = speech_sdk.StreamStatus.AllData
+        self.cancellation_details = None
+
+    def read_data(self, buffer: bytes) -> int:
+        if self._position >= len(self._audio):
+            return 0
+        self._chunk_latency.wait()
+        size = min(len(buffer), len(self._audio) - self._position)
+        self._position += size
+        return size
+
+
+class FakeSpeechSDK(types.ModuleType):
+    """
+    Sustituto del módulo azure.cognitiveservices.speech: las clases que
+    hablan con el servicio son dobles; el resto (enums, SpeechConfig,
+    formatos) se delega en el SDK real, que funciona sin red
+    """
+
+    def __init__(self, latency: Latency):
+        super().__init__("fake_speech_sdk")
+        chunk_latency = latency.scaled(0.01)
+        self.SpeechRecognizer = lambda speech_config=None, audio_config=None: \
+            FakeSpeechRecognizer(latency, speech_config, audio_config)
+        self.SpeechSynthesizer = lambda speech_config=None, audio_config=None: \
+            FakeSpeechSynthesizer(latency, speech_config, audio_config)
+        self.AudioDataStream = lambda result: FakeAudioDataStream(result, chunk_latency)
+        self.Connection = FakeConnection
+        self.audio = types.SimpleNamespace(
+            PushAudioInputStream=FakePushAudioInputStream,
+            AudioConfig=FakeAudioConfig,
+            AudioStreamFormat=speech_sdk.audio.AudioStreamFormat,
+            AudioStreamContainerFormat=speech_sdk.audio.AudioStreamContainerFormat
+        )
+
+    def __getattr__(self, name):
+        return getattr(speech_sdk, name)
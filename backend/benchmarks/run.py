@@ -0,0 +1,366 @@
+"""
+Benchmarks sin conexión: ejecuta escenarios de carga contra la app (y la
+ingesta) con dobles locales de Azure OpenAI, Cognitive Search, Speech y
+Document Intelligence, con latencia y fallos configurables.
+
+Escenarios:
+    chat        POST /api/chat
+    chat-async  POST /api/chat/async
+    stt         POST /api/speech-to-text (WAV 16 kHz)
+    tts         POST /api/text-to-speech (con --repeat-rate frases repetidas)
+    ingest      DocumentProcessor.process_all sobre un corpus sintético
+
+Uso (desde backend/):
+    python benchmarks/run.py chat tts --requests 200 --concurrency 16
+    python benchmarks/run.py all --latency-scale 2 --failure-rate 0.02 --compare
+
+Cada escenario se ejecuta en un proceso nuevo (la memoria pico es la suya)
+y su resultado se guarda en benchmarks/results/ con el commit actual;
+--compare lo muestra junto al resultado anterior del mismo escenario.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import argparse
+import tempfile
+import resource
+import statistics
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+SCENARIOS = ["chat", "chat-async", "stt", "tts", "ingest"]
+
+# Latencias medias (segundos) de cada servicio simulado, antes de --latency-scale
+BASE_LATENCY = {
+    "embedding": (0.04, 0.02),
+    "chat": (0.6, 0.2),
+    "search": (0.08, 0.03),
+    "speech": (0.15, 0.05),
+    "document": (0.2, 0.05)
+}
+
+# Configuración mínima para que los servicios arranquen; nunca se usa la red
+DUMMY_ENV = {
+    "OPENAI_API_KEY": "benchmark",
+    "OPENAI_API_BASE": "https://benchmark.openai.azure.com",
+    "OPENAI_API_VERSION": "2024-02-01",
+    "CHAT_MODEL_NAME": "benchmark-chat",
+    "EMBEDDING_MODEL_NAME": "benchmark-embedding",
+    "AZURE_COGNITIVE_SEARCH_ENDPOINT": "https://benchmark.search.windows.net",
+    "AZURE_COGNITIVE_SEARCH_KEY": "benchmark",
+    "AZURE_COGNITIVE_SEARCH_DOC_INDEX_NAME": "benchmark",
+    "AZURE_SPEECH_KEY": "benchmark",
+    "AZURE_SPEECH_REGION": "westeurope",
+    "AZURE_FORM_RECOGNIZER_ENDPOINT": "https://benchmark.cognitiveservices.azure.com",
+    "AZURE_FORM_RECOGNIZER_KEY": "benchmark",
+    "WARMUP_ON_START": "false",
+    # El control de admisión no debe limitar la carga generada
+    "CHAT_MAX_CONCURRENT": "1024",
+    "CHAT_MAX_QUEUE": "1024",
+    "SPEECH_MAX_CONCURRENT": "1024",
+    "SPEECH_MAX_QUEUE": "1024"
+}
+
+
+# ---------------------------------------------------------------------------
+# Proceso hijo: un escenario
+# ---------------------------------------------------------------------------
+
+def latencies(args):
+    from benchmarks.fakes import Latency
+    return {
+        name: Latency(mean * args.latency_scale, jitter * args.latency_scale, args.failure_rate, args.seed + i)
+        for i, (name, (mean, jitter)) in enumerate(BASE_LATENCY.items())
+    }
+
+
+def install_fakes(args, workdir: str):
+    """
+    Sustituye los clientes de coach y el SDK de voz por los dobles, con un
+    índice de búsqueda en memoria sobre el corpus sintético
+    """
+    from benchmarks import corpus
+    from benchmarks.fakes import (FakeOpenAI, FakeAsyncOpenAI, FakeSearchClient,
+                                  FakeAsyncSearchClient, FakeSpeechSDK)
+    from aivolutioncoach.services import coach, speech_utils
+
+    latency = latencies(args)
+    documents = corpus.synthetic_documents(args.documents, seed=args.seed)
+    search_client = FakeSearchClient(latency["search"], corpus.search_documents(documents))
+    coach.set_clients(
+        client=FakeOpenAI(latency["embedding"], latency["chat"]),
+        search_client=search_client,
+        async_client=FakeAsyncOpenAI(latency["embedding"], latency["chat"]),
+        async_search_client=FakeAsyncSearchClient(search_client)
+    )
+    speech_utils.speech_sdk = FakeSpeechSDK(latency["speech"])
+    return latency
+
+
+def wav_bytes(seconds: float, sample_rate: int = 16000) -> bytes:
+    """WAV PCM 16 bits mono de ruido, con cabecera RIFF"""
+    frames = bytes(random.getrandbits(8) for _ in range(int(seconds * sample_rate) * 2))
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(frames), b"WAVE", b"fmt ", 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", len(frames)
+    )
+    return header + frames
+
+
+def load_test(call: Callable[[int], bool], requests: int, concurrency: int) -> Tuple[List[float], int, float]:
+    """
+    Ejecuta call(i) requests veces con concurrency hilos. Devuelve las
+    latencias, el número de errores y la duración total
+    """
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            ok = call(i)
+        except Exception as e:
+            print(f"request {i} failed: {str(e)}", file=sys.stderr)
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    return [seconds for seconds, _ in results], sum(1 for _, ok in results if not ok), elapsed
+
+
+def http_scenario(args, workdir: str):
+    from benchmarks import corpus
+    from aivolutioncoach import create_app
+
+    install_fakes(args, workdir)
+    client = create_app().test_client()
+
+    if args.scenario in ("chat", "chat-async"):
+        path = "/api/chat" if args.scenario == "chat" else "/api/chat/async"
+        questions = corpus.questions(args.requests, seed=args.seed)
+
+        def call(i):
+            # Cada petición es una sesión nueva: sin histórico, como un primer mensaje
+            response = client.post(path, json={"message": questions[i]},
+                                   environ_base={"REMOTE_ADDR": f"10.0.{i // 256 % 256}.{i % 256}"})
+            response.close()
+            return response.status_code == 200
+
+    elif args.scenario == "stt":
+        audio = wav_bytes(args.audio_seconds)
+
+        def call(i):
+            response = client.post("/api/speech-to-text", data=audio, content_type="audio/wav")
+            ok = response.status_code == 200 and response.get_json().get("success")
+            response.close()
+            return ok
+
+    else:
+        phrases = corpus.questions(max(1, args.requests), seed=args.seed)
+        rng = random.Random(args.seed)
+
+        def call(i):
+            # Con probabilidad repeat_rate se repite una frase ya pedida (caché)
+            text = phrases[rng.randrange(max(1, i))] if i and rng.random() < args.repeat_rate else phrases[i]
+            response = client.post("/api/text-to-speech", json={"text": text})
+            ok = response.status_code == 200 and len(response.data) > 0
+            response.close()
+            return ok
+
+    return load_test(call, args.requests, args.concurrency)
+
+
+def ingest_scenario(args, workdir: str):
+    from benchmarks import corpus
+    from benchmarks.fakes import FakeOpenAI, FakeSearchClient, FakeSearchIndexClient, FakeDocumentAnalysisClient
+    from aivolutioncoach.services.bulk_uploader import BulkUploader
+    from aivolutioncoach.services.embedding_service import EmbeddingService
+    from aivolutioncoach.services.document_processor import DocumentProcessor
+    from aivolutioncoach.services.ingest_manifest import MANIFEST_FILE
+
+    latency = latencies(args)
+    processor = DocumentProcessor()
+    processor.raw_data_folder = os.path.join(workdir, "unstructured-data")
+    processor.extracted_data_folder = os.path.join(workdir, "data-extracted")
+    processor.vector_index_folder = os.path.join(workdir, "vector-index")
+    processor.manifest_path = os.path.join(processor.extracted_data_folder, MANIFEST_FILE)
+    os.makedirs(processor.extracted_data_folder, exist_ok=True)
+    corpus.write_raw_folder(processor.raw_data_folder, corpus.synthetic_documents(args.documents, seed=args.seed))
+
+    processor.doc_client = FakeDocumentAnalysisClient(latency["document"].scaled(0.1))
+    processor.index_client = FakeSearchIndexClient(latency["search"])
+    processor.search_client = FakeSearchClient(latency["search"])
+    processor.uploader = BulkUploader.from_env(processor.search_client, key_field="document_id")
+    processor.openai_client = FakeOpenAI(latency["embedding"], latency["chat"])
+    processor.embedding_service = EmbeddingService.from_env(processor.openai_client, processor.embedding_name)
+
+    started = time.perf_counter()
+    processor.process_all()
+    elapsed = time.perf_counter() - started
+    # Una "petición" por documento: la latencia es la de toda la ingesta
+    return [elapsed], 0, elapsed
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[position]
+
+
+def run_child(args) -> None:
+    workdir = tempfile.mkdtemp(prefix=f"benchmark-{args.scenario}-")
+    for name, value in DUMMY_ENV.items():
+        os.environ.setdefault(name, value)
+    os.environ["TTS_CACHE_DIR"] = os.path.join(workdir, "tts-cache")
+    os.environ["VECTOR_INDEX_PATH"] = os.path.join(workdir, "vector-index")
+    sys.path.insert(0, BACKEND_DIR)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    try:
+        if args.scenario == "ingest":
+            times, errors, elapsed = ingest_scenario(args, workdir)
+            units = args.documents
+        else:
+            times, errors, elapsed = http_scenario(args, workdir)
+            units = args.requests
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    from aivolutioncoach.services import metrics
+    result = {
+        "scenario": args.scenario,
+        "count": len(times),
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput": units / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(times, 0.50) * 1000,
+        "p95_ms": percentile(times, 0.95) * 1000,
+        "p99_ms": percentile(times, 0.99) * 1000,
+        "mean_ms": statistics.mean(times) * 1000,
+        # ru_maxrss está en KB en Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": {labels[0]: {"count": count, "avg_ms": total / count * 1000}
+                   for labels, (count, total) in metrics.STAGE_SECONDS.snapshot().items() if count}
+    }
+    if args.tracemalloc:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    print(json.dumps(result))
+
+
+# ---------------------------------------------------------------------------
+# Proceso principal: lanza los escenarios, guarda y compara
+# ---------------------------------------------------------------------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def child_arguments(args) -> List[str]:
+    return [
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--documents", str(args.documents), "--latency-scale", str(args.latency_scale),
+        "--failure-rate", str(args.failure_rate), "--repeat-rate", str(args.repeat_rate),
+        "--audio-seconds", str(args.audio_seconds), "--seed", str(args.seed)
+    ] + (["--tracemalloc"] if args.tracemalloc else [])
+
+
+def run_scenario(scenario: str, args) -> dict:
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", scenario] + child_arguments(args),
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario '{scenario}' failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def previous_result(scenario: str):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(file for file in os.listdir(RESULTS_DIR) if file.endswith(f"-{scenario}.json"))
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1])) as f:
+        return json.load(f)
+
+
+def save_result(result: dict, params: dict) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{result['scenario']}.json")
+    with open(path, "w") as f:
+        json.dump(dict(result, commit=git_commit(), params=params, timestamp=stamp), f, indent=2)
+    return path
+
+
+def format_result(result: dict, previous=None) -> str:
+    keys = ["p50_ms", "p95_ms", "p99_ms", "throughput", "peak_rss_mb"]
+    lines = [f"{result['scenario']}: {result['count']} run(s), {result['errors']} error(s), {result['seconds']:.2f}s"]
+    for key in keys:
+        line = f"  {key:<12} {result[key]:10.1f}"
+        if previous and previous.get(key):
+            change = (result[key] - previous[key]) / previous[key] * 100
+            line += f"   was {previous[key]:10.1f} ({change:+.1f}%, {previous.get('commit', '?')})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmarks with local stand-ins for Azure services")
+    parser.add_argument("scenarios", nargs="*", default=["all"], help=f"{', '.join(SCENARIOS)} or all")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--documents", type=int, default=20, help="Synthetic documents in the corpus")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for every simulated latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability that a fake call fails")
+    parser.add_argument("--repeat-rate", type=float, default=0.5, help="Share of repeated phrases in tts")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="Length of each stt upload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the peak of traced Python allocations")
+    parser.add_argument("--compare", action="store_true", help="Show the change against the previous stored run")
+    parser.add_argument("--no-save", action="store_true", help="Do not store the results")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.scenario = args.child
+        run_child(args)
+        return
+
+    scenarios = SCENARIOS if "all" in args.scenarios else args.scenarios
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    params = {key: value for key, value in vars(args).items() if key not in ("scenarios", "child", "compare", "no_save")}
+    failed = False
+    for scenario in scenarios:
+        try:
+            result = run_scenario(scenario, args)
+        except RuntimeError as e:
+            print(str(e))
+            failed = True
+            continue
+        previous = previous_result(scenario) if args.compare else None
+        print(format_result(result, previous))
+        if not args.no_save:
+            print(f"  saved to {os.path.relpath(save_result(result, params), BACKEND_DIR)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark de arranque: mide cuánto tarda un proceso nuevo en importar
+aivolutioncoach y ejecutar create_app(), y comprueba que los SDKs pesados
+no se importan al arrancar (se cargan en el primer uso o en el warmup).
+
+Uso (desde backend/):
+    python benchmarks/startup.py [--runs 5] [--budget 1.0]
+
+Termina con código 1 si la mediana supera el presupuesto o si algún módulo
+pesado se importa durante el arranque, para usarlo como guarda en CI.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Módulos que no deben cargarse al crear la app
+HEAVY_MODULES = [
+    "openai",
+    "pandas",
+    "azure.search.documents",
+    "azure.ai.formrecognizer",
+    "tiktoken"
+]
+
+# Se ejecuta en un proceso nuevo para medir un arranque en frío real
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+from aivolutioncoach import create_app
+create_app()
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "heavy": [m for m in HEAVY if m in sys.modules]}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ, WARMUP_ON_START="false")
+    code = f"HEAVY = {HEAVY_MODULES!r}\n{PROBE}"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(top: int = 10) -> list:
+    """
+    Módulos que más tardan en importarse (python -X importtime)
+    """
+    env = dict(os.environ, WARMUP_ON_START="false")
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from aivolutioncoach import create_app; create_app()"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Formato: "import time: <self us> | <cumulative us> | <módulo>"
+        _, cumulative_us, module = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), module.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup-time benchmark for the Flask app factory")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0")),
+                        help="Maximum allowed median startup time, in seconds")
+    parser.add_argument("--profile", action="store_true", help="Show the slowest imports")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    times = [result["seconds"] for result in results]
+    heavy = sorted({module for result in results for module in result["heavy"]})
+    median = statistics.median(times)
+
+    print(f"create_app cold start: median {median:.3f}s, min {min(times):.3f}s, "
+          f"max {max(times):.3f}s over {args.runs} run(s) (budget {args.budget:.3f}s)")
+    if args.profile:
+        for cumulative_us, module in import_profile():
+            print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if median > args.budget:
+        print(f"FAIL: startup median {median:.3f}s exceeds budget {args.budget:.3f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark de escalado con el número de workers: lanza la app con gunicorn
+(gunicorn.conf.py, los mismos dobles locales que run.py) para cada número
+de workers y mide el throughput de POST /api/chat por HTTP.
+
+Una parte de las preguntas se repite (--repeat-rate) para que la caché de
+respuestas cuente; con --no-shared cada worker tiene sus propias cachés en
+memoria en lugar de las de SQLite en SHARED_CACHE_DIR.
+
+Uso (desde backend/, con gunicorn instalado):
+    python benchmarks/workers.py --workers 1 2 4 --requests 200 --concurrency 32
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from urllib.error import URLError
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.run import DUMMY_ENV, load_test, percentile  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, server: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn not ready after {timeout:.0f}s")
+
+
+def post_json(url: str, payload: dict) -> int:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+        return response.status
+
+
+def run_workers(workers: int, args, questions) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"benchmark-workers-{workers}-")
+    port = free_port()
+    env = dict(os.environ, **DUMMY_ENV)
+    env.update({
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_THREADS": str(args.threads),
+        "BIND": f"127.0.0.1:{port}",
+        "VECTOR_INDEX_PATH": os.path.join(workdir, "vector-index"),
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts-cache"),
+        "REPORT_DIR": os.path.join(workdir, "reports"),
+        "SHARED_CACHE_DIR": "" if args.no_shared else os.path.join(workdir, "shared-cache"),
+        "BENCHMARK_WORKDIR": workdir,
+        "BENCHMARK_ARGS": json.dumps({
+            "latency_scale": args.latency_scale, "failure_rate": 0.0,
+            "seed": args.seed, "documents": args.documents
+        }),
+        "PYTHONPATH": BACKEND_DIR
+    })
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+         "benchmarks.wsgi_fakes:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(f"{base}/api/admission", server)
+
+        def call(i):
+            return post_json(f"{base}/api/chat", {"message": questions[i]}) == 200
+
+        times, errors, elapsed = load_test(call, args.requests, args.concurrency)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "workers": workers,
+        "errors": errors,
+        "throughput": args.requests / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(times, 0.50) * 1000,
+        "p95_ms": percentile(times, 0.95) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of /api/chat under gunicorn by worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=4, help="Threads per worker")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--repeat-rate", type=float, default=0.5, help="Share of repeated questions")
+    parser.add_argument("--no-shared", action="store_true", help="Per-worker in-memory caches")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from benchmarks import corpus
+    distinct = corpus.questions(args.requests, seed=args.seed)
+    rng = random.Random(args.seed)
+    questions = [
+        distinct[rng.randrange(max(1, i))] if i and rng.random() < args.repeat_rate else distinct[i]
+        for i in range(args.requests)
+    ]
+
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+    for workers in args.workers:
+        result = run_workers(workers, args, questions)
+        print(f"{result['workers']:>7} {result['throughput']:8.1f} {result['p50_ms']:8.0f} "
+              f"{result['p95_ms']:8.0f} {result['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+App WSGI con los dobles locales de benchmarks/fakes.py, para lanzarla con
+gunicorn desde benchmarks/workers.py:
+
+    gunicorn -c gunicorn.conf.py benchmarks.wsgi_fakes:app
+
+Los parámetros de los dobles llegan en BENCHMARK_ARGS (JSON con los mismos
+nombres que las opciones de run.py).
+"""
+import os
+import json
+import argparse
+from aivolutioncoach import create_app
+from benchmarks.run import install_fakes
+
+args = argparse.Namespace(**json.loads(os.environ["BENCHMARK_ARGS"]))
+install_fakes(args, os.environ.get("BENCHMARK_WORKDIR", "."))
+app = create_app()
@@ -0,0 +1,60 @@
+# gunicorn.conf.py: modo producción con varios workers
+#   cd backend && gunicorn -c gunicorn.conf.py wsgi:app
+#
+# - preload_app: la app y el estado de solo lectura (índice vectorial,
+#   BM25, tokenizador) se cargan una vez en el proceso maestro antes del
+#   fork; los workers comparten esas páginas (copy-on-write) en lugar de
+#   cargar cada uno su copia.
+# - Los clientes, hilos, pools de voz y conexiones SQLite se crean en cada
+#   worker después del fork (post_fork), nunca en el maestro.
+# - Las cachés de embeddings y respuestas y el histórico de conversación
+#   van a SQLite (WAL) en SHARED_CACHE_DIR, compartidos por todos los workers.
+import os
+import gc
+import threading
+from dotenv import load_dotenv
+
+# Las variables de .env tienen prioridad sobre los valores por defecto de aquí
+load_dotenv()
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(2 * (os.cpu_count() or 1) + 1)))
+# Las vistas pasan casi todo el tiempo esperando a Azure: varios hilos por worker.
+# También /chat/async: cada petición en curso ocupa un hilo hasta terminar
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Respuestas en streaming (chat, TTS) más largas que el timeout por defecto
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+
+# SHARED_CACHE_DIR="" (definida pero vacía) desactiva las cachés compartidas
+shared_cache_dir = os.environ.setdefault("SHARED_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared-cache"))
+# Sin copia en memoria del histórico solo si el histórico vive en SQLite (la
+# misma ruta que resuelve shared_db_path): así da igual qué worker atienda
+# cada mensaje de la sesión
+if os.getenv("CONVERSATION_DB_PATH") or shared_cache_dir:
+    os.environ.setdefault("CONVERSATION_MAX_SESSIONS", "0")
+
+# El warmup crea hilos y conexiones: se hace en cada worker, no en el maestro
+_warmup_workers = os.getenv("WARMUP_ON_START", "true").lower() == "true"
+os.environ["WARMUP_ON_START"] = "false"
+
+
+def when_ready(server):
+    from aivolutioncoach import preload
+
+    preload()
+    # Lo cargado hasta aquí no lo recorre el GC de los workers, que si no
+    # tocaría (y copiaría) esas páginas
+    gc.freeze()
+    server.log.info("Read-only state preloaded, starting %s worker(s)", workers)
+
+
+def post_fork(server, worker):
+    if _warmup_workers:
+        from aivolutioncoach import warmup
+
+        threading.Thread(target=warmup, daemon=True, name="warmup").start()
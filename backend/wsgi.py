@@ -0,0 +1,4 @@
+# wsgi.py: punto de entrada para servidores WSGI
+#   gunicorn -c gunicorn.conf.py wsgi:app
+from aivolutioncoach import create_app
+app = create_app()
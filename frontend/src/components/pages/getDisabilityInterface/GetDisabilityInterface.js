@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import Navbar from "../../layout/Navbar/Navbar";
+import { listenForSpeech, playSpeech } from "../../../speech";
 
 const GetDisabilityInterface = () => {
   const navigate = useNavigate();
@@ -10,17 +11,8 @@ const GetDisabilityInterface = () => {
   // Function to handle TTS
   const speakPhrase = async (text) => {
     try {
-      const response = await fetch("/api/text-to-speech", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ text: text }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch TTS from the backend.");
-      }
+      // Play the audio returned by the backend; resolves when it ends
+      await playSpeech(text);
     } catch (err) {
       console.error("Error in speakPhrase:", err);
     }
@@ -33,10 +25,8 @@ const GetDisabilityInterface = () => {
 
     while (retryCount < maxRetries) {
       try {
-        const response = await fetch("/api/speech-to-text", {
-          method: "POST",
-        });
-        const data = await response.json();
+        // Record a few seconds from the microphone and send them to the backend
+        const data = await listenForSpeech(3000);
 
         if (data.success) {
           const command = data.command.toLowerCase();
@@ -1,11 +1,13 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
+import { listenForSpeech, playSpeech } from "../../../speech";
 
 const StartingInterface = () => {
   const [status, setStatus] = useState('Listening for "Start"...');
   const [recognizedText, setRecognizedText] = useState("");
   const [error, setError] = useState("");
   const [isSpeaking, setIsSpeaking] = useState(false);
+  const isListening = useRef(false);
   const navigate = useNavigate();
 
   const phraseToSpeak =
@@ -15,22 +17,9 @@ const StartingInterface = () => {
   const speakPhrase = async () => {
     try {
       setIsSpeaking(true); // Mark TTS as active
-      const response = await fetch("/api/text-to-speech", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ text: phraseToSpeak }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to fetch TTS from the backend.");
-      }
-
-      // Simulate TTS playback duration
-      setTimeout(() => {
-        setIsSpeaking(false);
-      }, 4000);
+      // Play the audio returned by the backend; STT resumes when it ends
+      await playSpeech(phraseToSpeak);
+      setIsSpeaking(false);
     } catch (err) {
       console.error("Error in speakPhrase:", err);
       setError("Failed to generate speech output.");
@@ -40,13 +29,12 @@ const StartingInterface = () => {
 
   // Function to handle STT
   const listenForStart = async () => {
-    if (isSpeaking) return; // Skip STT if TTS is active
+    if (isSpeaking || isListening.current) return; // Skip STT if TTS or a recording is active
 
+    isListening.current = true;
     try {
-      const response = await fetch("/api/speech-to-text", {
-        method: "POST",
-      });
-      const data = await response.json();
+      // Record a few seconds from the microphone and send them to the backend
+      const data = await listenForSpeech(3000);
 
       if (data.success) {
         const command = data.command.toLowerCase();
@@ -66,7 +54,9 @@ const StartingInterface = () => {
       }
     } catch (err) {
       console.error("Error in listenForStart:", err);
-      setError("Failed to connect to the server.");
+      setError("Failed to record or transcribe speech.");
+    } finally {
+      isListening.current = false;
     }
   };
 
@@ -0,0 +1,137 @@
+// Voice helpers shared by the pages. The backend transcribes audio uploaded
+// by the browser (the microphone is recorded here and sent as WAV) and
+// streams synthesized speech back, which is played here.
+
+// Sample rate sent to speech-to-text (16 kHz mono PCM is what it expects)
+const STT_SAMPLE_RATE = 16000;
+
+let microphone = null;
+
+// Ask for the microphone once and reuse the stream for every recording
+const getMicrophone = () => {
+  if (!microphone) {
+    microphone = navigator.mediaDevices
+      .getUserMedia({ audio: { channelCount: 1 } })
+      .catch((err) => {
+        microphone = null;
+        throw err;
+      });
+  }
+  return microphone;
+};
+
+// Average the captured blocks down to the target sample rate
+const downsample = (blocks, fromRate, toRate) => {
+  const length = blocks.reduce((total, block) => total + block.length, 0);
+  const samples = new Float32Array(length);
+  let offset = 0;
+  for (const block of blocks) {
+    samples.set(block, offset);
+    offset += block.length;
+  }
+  if (fromRate <= toRate) {
+    return samples;
+  }
+  const ratio = fromRate / toRate;
+  const result = new Float32Array(Math.floor(length / ratio));
+  for (let i = 0; i < result.length; i++) {
+    const start = Math.floor(i * ratio);
+    const end = Math.min(length, Math.floor((i + 1) * ratio));
+    let sum = 0;
+    for (let j = start; j < end; j++) {
+      sum += samples[j];
+    }
+    result[i] = end > start ? sum / (end - start) : 0;
+  }
+  return result;
+};
+
+// 16-bit mono PCM samples in a RIFF/WAVE container
+const encodeWav = (samples, sampleRate) => {
+  const view = new DataView(new ArrayBuffer(44 + samples.length * 2));
+  const writeString = (offset, text) => {
+    for (let i = 0; i < text.length; i++) {
+      view.setUint8(offset + i, text.charCodeAt(i));
+    }
+  };
+  writeString(0, "RIFF");
+  view.setUint32(4, 36 + samples.length * 2, true);
+  writeString(8, "WAVE");
+  writeString(12, "fmt ");
+  view.setUint32(16, 16, true);
+  view.setUint16(20, 1, true); // PCM
+  view.setUint16(22, 1, true); // mono
+  view.setUint32(24, sampleRate, true);
+  view.setUint32(28, sampleRate * 2, true);
+  view.setUint16(32, 2, true);
+  view.setUint16(34, 16, true);
+  writeString(36, "data");
+  view.setUint32(40, samples.length * 2, true);
+  for (let i = 0; i < samples.length; i++) {
+    const sample = Math.max(-1, Math.min(1, samples[i]));
+    view.setInt16(44 + i * 2, sample < 0 ? sample * 0x8000 : sample * 0x7fff, true);
+  }
+  return new Blob([view], { type: "audio/wav" });
+};
+
+// Record the microphone for durationMs and return it as a WAV blob
+export const recordSpeech = async (durationMs = 3000) => {
+  const stream = await getMicrophone();
+  const context = new AudioContext();
+  const source = context.createMediaStreamSource(stream);
+  const processor = context.createScriptProcessor(4096, 1, 1);
+  const blocks = [];
+  processor.onaudioprocess = (event) => {
+    blocks.push(new Float32Array(event.inputBuffer.getChannelData(0)));
+  };
+  source.connect(processor);
+  processor.connect(context.destination);
+
+  await new Promise((resolve) => setTimeout(resolve, durationMs));
+
+  processor.disconnect();
+  source.disconnect();
+  const sampleRate = context.sampleRate;
+  await context.close();
+  const targetRate = Math.min(STT_SAMPLE_RATE, sampleRate);
+  return encodeWav(downsample(blocks, sampleRate, targetRate), targetRate);
+};
+
+// Record for durationMs and transcribe it: resolves to { success, command } or { success, error }
+export const listenForSpeech = async (durationMs = 3000) => {
+  const audio = await recordSpeech(durationMs);
+  const response = await fetch("/api/speech-to-text?format=wav", {
+    method: "POST",
+    headers: {
+      "Content-Type": "audio/wav",
+    },
+    body: audio,
+  });
+  return response.json();
+};
+
+// Synthesize text with the backend and play it; resolves when playback ends
+export const playSpeech = async (text) => {
+  const response = await fetch("/api/text-to-speech", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ text }),
+  });
+  if (!response.ok) {
+    throw new Error("Failed to fetch TTS from the backend.");
+  }
+
+  const url = URL.createObjectURL(await response.blob());
+  try {
+    const audio = new Audio(url);
+    await new Promise((resolve, reject) => {
+      audio.onended = resolve;
+      audio.onerror = () => reject(new Error("Failed to play speech output."));
+      audio.play().catch(reject);
+    });
+  } finally {
+    URL.revokeObjectURL(url);
+  }
+};